@@ -9,6 +9,7 @@ import logging
 import sys
 import pickle
 import os
+from tracing import tracer
 
 # --- Logging Configuration ---
 logging.basicConfig(
@@ -226,24 +227,27 @@ class MultiHorizonForecaster:
         model = model_info['model']
         feature_names = model_info['features']
 
-        df_input = pd.DataFrame([context_data])
-        for col, le in self.encoders.items():
-            if col in df_input.columns:
-                df_input[col] = df_input[col].apply(lambda x: le.transform([str(x)])[0] if str(x) in le.classes_ else -1)
-        for col in feature_names:
-            if col not in df_input.columns: df_input[col] = 0 
-        
-        X_pred = df_input[feature_names]
+        with tracer.start_as_current_span("demand.features"):
+            df_input = pd.DataFrame([context_data])
+            for col, le in self.encoders.items():
+                if col in df_input.columns:
+                    df_input[col] = df_input[col].apply(lambda x: le.transform([str(x)])[0] if str(x) in le.classes_ else -1)
+            for col in feature_names:
+                if col not in df_input.columns: df_input[col] = 0 
+            
+            X_pred = df_input[feature_names]
         
         # Predict Log Value
-        log_pred = model.predict(X_pred)[0]
+        with tracer.start_as_current_span("demand.predict", attributes={"horizon": horizon}):
+            log_pred = model.predict(X_pred)[0]
         # Inverse Log: exp(pred) - 1
         prediction = np.expm1(log_pred)
         prediction = max(0.0, float(prediction))
         
         # SHAP Explanation
-        explainer = shap.TreeExplainer(model)
-        shap_values = explainer.shap_values(X_pred)
+        with tracer.start_as_current_span("demand.shap"):
+            explainer = shap.TreeExplainer(model)
+            shap_values = explainer.shap_values(X_pred)
         shap_dict = {feature_names[i]: float(shap_values[0][i]) for i in range(len(feature_names))}
         
         return {
@@ -295,10 +299,12 @@ class RecursiveMultiStepForecaster:
         start_date = pd.to_datetime(start_date)
         
         # Get historical data for this store/sku
-        hist = self.raw_data[
-            (self.raw_data['store_id'] == store_id) & 
-            (self.raw_data['sku_id'] == sku_id)
-        ].copy().sort_values('date')
+        with tracer.start_as_current_span("forecast.history") as span:
+            hist = self.raw_data[
+                (self.raw_data['store_id'] == store_id) & 
+                (self.raw_data['sku_id'] == sku_id)
+            ].copy().sort_values('date')
+            span.set_attribute("rows", len(hist))
         
         if len(hist) == 0:
             raise ValueError(f"No historical data for store={store_id}, sku={sku_id}")
@@ -339,7 +345,8 @@ class RecursiveMultiStepForecaster:
             }
             
             # Predict using horizon=1 model (1-day ahead)
-            result = self.forecaster.predict(context, horizon=1)
+            with tracer.start_as_current_span("forecast.demand", attributes={"day": day_offset}):
+                result = self.forecaster.predict(context, horizon=1)
             predicted_units = result['prediction']
             logger.info(f"FORECAST|DAY_{day_offset}|DATE={pred_date.strftime('%Y-%m-%d')}|UNITS_SOLD={predicted_units:.2f}")
             
@@ -372,7 +379,8 @@ class RecursiveMultiStepForecaster:
                         'brand': brand,
                         'supplier_id': last_row.get('supplier_id', 'Unknown')
                     }
-                    lead_time_result = self.lead_time_predictor.predict(lead_time_context)
+                    with tracer.start_as_current_span("forecast.lead_time", attributes={"day": day_offset}):
+                        lead_time_result = self.lead_time_predictor.predict(lead_time_context)
                     predicted_lead_time = round(lead_time_result['prediction'], 2)
                     lead_time_shap = lead_time_result['shap_explanation']
                     logger.info(f"LEAD_TIME|DAY_{day_offset}|DATE={pred_date.strftime('%Y-%m-%d')}|DAYS={predicted_lead_time}")
@@ -442,14 +450,17 @@ class LeadTimePredictor:
 
     def predict(self, context: Dict) -> Dict[str, Any]:
         if self.model is None: raise Exception("Model not trained.")
-        df_pred = pd.DataFrame([context])
-        X_pred = self._preprocess(df_pred, is_training=False)
+        with tracer.start_as_current_span("lead_time.features"):
+            df_pred = pd.DataFrame([context])
+            X_pred = self._preprocess(df_pred, is_training=False)
         
-        prediction = max(0.0, float(self.model.predict(X_pred)[0]))
+        with tracer.start_as_current_span("lead_time.predict"):
+            prediction = max(0.0, float(self.model.predict(X_pred)[0]))
         
         # SHAP Explanation
-        explainer = shap.TreeExplainer(self.model)
-        shap_values = explainer.shap_values(X_pred)
+        with tracer.start_as_current_span("lead_time.shap"):
+            explainer = shap.TreeExplainer(self.model)
+            shap_values = explainer.shap_values(X_pred)
         feature_names = self.feature_cols
         shap_dict = {feature_names[i]: float(shap_values[0][i]) for i in range(len(feature_names))}
         
@@ -8,6 +8,7 @@ import logging
 from functools import lru_cache
 from datetime import datetime
 from core import pipeline
+from tracing import tracer, setup_tracing
 
 # --- Logging Setup ---
 logging.basicConfig(
@@ -43,8 +44,28 @@ def get_cached_prediction(start_date: str, store_id: str, sku_id: str, category:
     """Cache wrapper for predictions to avoid redundant computation"""
     return pipeline.get_7day_forecast(start_date, store_id, sku_id, category, brand)
 
+def cached_prediction(start_date: str, store_id: str, sku_id: str, category: str, brand: str):
+    """get_cached_prediction inside a span recording whether the cache answered"""
+    with tracer.start_as_current_span("forecast.cache") as span:
+        hits = get_cached_prediction.cache_info().hits
+        predictions = get_cached_prediction(start_date, store_id, sku_id, category, brand)
+        # Approximate under concurrent requests, exact otherwise
+        span.set_attribute("cache.hit", get_cached_prediction.cache_info().hits > hits)
+        return predictions
+
 # --- Endpoints ---
 
+@app.on_event("startup")
+def start_tracing():
+    app.state.tracer_provider = setup_tracing("ai_backend")
+
+@app.on_event("shutdown")
+def stop_tracing():
+    # Flush spans still waiting in the batch processor
+    provider = getattr(app.state, "tracer_provider", None)
+    if provider:
+        provider.shutdown()
+
 @app.on_event("startup")
 def startup_event():
     """Load pre-trained models or train if not available."""
@@ -162,7 +183,7 @@ def predict_next_7_days(request: SimpleForecastRequest):
     try:
         logger.info(f"PREDICT|REQUEST|START_DATE={request.start_date}|STORE={request.store_id}|SKU={request.sku_id}")
         # Use cached predictions if available
-        predictions = get_cached_prediction(
+        predictions = cached_prediction(
             start_date=request.start_date,
             store_id=request.store_id,
             sku_id=request.sku_id,
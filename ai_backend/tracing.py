@@ -0,0 +1,48 @@
+import os
+import logging
+from opentelemetry import trace
+
+try:
+    from opentelemetry.sdk.resources import Resource
+    from opentelemetry.sdk.trace import TracerProvider
+    from opentelemetry.sdk.trace.export import BatchSpanProcessor, ConsoleSpanExporter
+except ImportError:  # optional: without the SDK every span is a no-op
+    TracerProvider = None
+
+try:
+    from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+except ImportError:  # optional: only needed to send spans to a collector
+    OTLPSpanExporter = None
+
+logger = logging.getLogger(__name__)
+
+# Collector base URL, e.g. http://localhost:4318; spans go to <url>/v1/traces
+OTEL_EXPORTER_OTLP_ENDPOINT = os.getenv("OTEL_EXPORTER_OTLP_ENDPOINT")
+# Append finished spans to this file as JSON lines instead
+TRACE_FILE = os.getenv("TRACE_FILE")
+
+tracer = trace.get_tracer("ai_backend")
+
+
+def setup_tracing(service_name: str):
+    """
+    Install a tracer provider exporting to the OTLP collector or TRACE_FILE.
+    Returns the provider (to flush on shutdown), or None when tracing is off.
+    """
+    if TracerProvider is None or not (OTEL_EXPORTER_OTLP_ENDPOINT or TRACE_FILE):
+        return None
+
+    provider = TracerProvider(resource=Resource.create({"service.name": service_name}))
+    if OTEL_EXPORTER_OTLP_ENDPOINT:
+        if OTLPSpanExporter is None:
+            logger.warning("TRACING|OTLP_EXPORTER_NOT_INSTALLED")
+        else:
+            provider.add_span_processor(BatchSpanProcessor(OTLPSpanExporter()))
+    if TRACE_FILE:
+        out = open(TRACE_FILE, "a", buffering=1)
+        provider.add_span_processor(BatchSpanProcessor(
+            ConsoleSpanExporter(out=out, formatter=lambda span: span.to_json(indent=None) + "\n")
+        ))
+    trace.set_tracer_provider(provider)
+    logger.info(f"TRACING|ENABLED|SERVICE={service_name}|OTLP={OTEL_EXPORTER_OTLP_ENDPOINT}|FILE={TRACE_FILE}")
+    return provider
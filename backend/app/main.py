@@ -1,13 +1,58 @@
 from fastapi import FastAPI, Query, Depends, HTTPException
 from sqlalchemy.orm import Session
+from sqlalchemy.exc import TimeoutError as SQLAlchemyTimeoutError
 from sqlalchemy import func, case, literal, text, desc, tuple_
-from .model.sales_fact import SalesFact
-from .utils.db import get_db
+from .model.sales_fact import SalesFact, Base
+from .model.dimensions import DimStore, DimSku, DimSupplier, DimCalendar, DIMENSION_TABLES
+from .model.latest_inventory import LatestInventory
+from .model.stock_alerts import StockAlert, STOCK_ALERT_TABLES
+from .model.leaderboard import SkuLeaderboard, LEADERBOARD_TABLES
+from .model.ingest_log import SalesIngest
+from .utils.db import get_db, get_chatbot_db, SessionLocal, engine, chatbot_engine
+from .utils.sql_guard import run_guarded, QueryRejected
+from .utils.result_digest import digest_result, jsonable
+from .utils.chatbot_cache import (
+    normalize_question, data_version, find_sql, remember_sql,
+    result_handle, get_result, set_result, get_answer, set_answer,
+)
+from .utils.llm import GeminiClient, get_llm, gemini_client, content_hash, sse_event, SSE_HEADERS
+from .utils.aggregates import Metric, run_metrics
+from .utils.filters import sales_filters
+from .utils.refresh import refresh_after_ingest, refresh_dimensions, refresh_latest_inventory
+from .utils.leaderboard import refresh_sku_leaderboard, SKU_LEADERBOARD_SIZE
+from .utils.warmup import cache_warmer, CACHE_WARM_ON_STARTUP, CACHE_WARM_AFTER_REFRESH
+from .utils.ingest import ingest_file, resolve_ingest_path, partition_sales_fact, IngestError
+from .utils.auth import require_admin
+from .utils.pagination import encode_cursor, decode_cursor
+from .utils.ai_client import AIBackendClient, CircuitOpenError
+from .utils.cube import sales_cube, CUBE_REFRESH_SECONDS
+from .utils.olap import parquet_snapshot, olap_filters
+from .utils.stock_alerts import materialize_forecasts, run_stock_alerts, latest_alert_run
+from .utils.jobs import BackgroundJob
+from .utils.export import export_rows, EXPORT_FORMATS, ARROW_AVAILABLE
+from .utils.cache import FastJSONResponse, cached_json, cache_json, columnar, SERIES_FORMAT_PATTERN
+from .utils.timeseries import period_column, downsample, GRANULARITY_PATTERN
+from .utils.compare import period_comparison, change, COMPARE_PATTERN
+from .utils.weather_stats import weather_statistics
+from .utils.geo import cluster_points, parse_bbox, cells_in_bbox, BBOX_PATTERN, CLUSTER_MAX_ZOOM, CLUSTER_MAX_FEATURES, CLUSTER_CELL_PX
+from .utils.http_cache import (
+    current_data_version, ConditionalGetMiddleware, BrotliMiddleware,
+    COMPRESSION_MIN_BYTES, DATA_VERSION_POLL_SECONDS,
+)
+from .utils.metrics import (
+    MetricsMiddleware, InstrumentedRedis, instrument_engine, render_metrics, slow_queries,
+    CONTENT_TYPE as METRICS_CONTENT_TYPE,
+)
+from .utils.tracing import setup_tracing
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse, Response
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.concurrency import run_in_threadpool
+import asyncio
+import logging
 import httpx
 from datetime import datetime, timedelta
 import os
-from google import genai
 from upstash_redis.asyncio import Redis
 import json
 
@@ -17,6 +62,17 @@ app = FastAPI(
     version="1.0.0"
 )
 
+app.add_middleware(ConditionalGetMiddleware)
+
+if BrotliMiddleware is not None:
+    app.add_middleware(BrotliMiddleware, minimum_size=COMPRESSION_MIN_BYTES, gzip_fallback=True)
+else:
+    app.add_middleware(GZipMiddleware, minimum_size=COMPRESSION_MIN_BYTES)
+
+# Outside the others so 304s and compression time are measured too
+app.add_middleware(MetricsMiddleware)
+
+# Added last so it wraps the others and 304s carry CORS headers too
 app.add_middleware(
     CORSMiddleware,
     allow_origins=[
@@ -28,14 +84,183 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-redis_client = Redis(
+redis_client = InstrumentedRedis(Redis(
     url=os.getenv("UPSTASH_REDIS_REST_URL"),
     token=os.getenv("UPSTASH_REDIS_REST_TOKEN"),
-)
+), version=lambda: current_data_version.value)
+
+# Statement latency, row counts and slow-query plans for both pools
+instrument_engine(engine, "main")
+instrument_engine(chatbot_engine, "chatbot")
 CACHE_TTL = 600
 
+logger = logging.getLogger(__name__)
+
+# Shared for the application lifetime so forecast calls reuse pooled connections
+ai_client = AIBackendClient.from_env()
+
+@app.on_event("startup")
+def create_derived_tables():
+    # sales_fact itself is managed outside the app; only create our derived tables
+    Base.metadata.create_all(bind=engine, tables=DIMENSION_TABLES + [LatestInventory.__table__] + STOCK_ALERT_TABLES + LEADERBOARD_TABLES + [SalesIngest.__table__])
+
+@app.on_event("startup")
+def start_tracing():
+    app.state.tracer_provider = setup_tracing("backend")
+
+@app.on_event("shutdown")
+def stop_tracing():
+    # Flush spans still waiting in the batch processor
+    provider = getattr(app.state, "tracer_provider", None)
+    if provider:
+        provider.shutdown()
+
+@app.on_event("startup")
+async def start_ai_client():
+    await ai_client.start()
+
+@app.on_event("shutdown")
+async def close_ai_client():
+    await ai_client.close()
+
+@app.on_event("shutdown")
+async def close_llm_client():
+    await gemini_client.close()
+
+def _load_sales_cube():
+    db = SessionLocal()
+    try:
+        sales_cube.load(db)
+    finally:
+        db.close()
+
+async def _refresh_sales_cube_forever():
+    while True:
+        try:
+            await run_in_threadpool(_load_sales_cube)
+        except Exception as e:
+            # Keep serving the previous snapshot (or Postgres) and retry next round
+            logger.error(f"CUBE|REFRESH|FAILED|{str(e)}")
+        await asyncio.sleep(CUBE_REFRESH_SECONDS)
+
+@app.on_event("startup")
+async def start_sales_cube():
+    # Only with QUERY_ENGINE=cube; until the first load finishes endpoints use Postgres
+    if sales_cube.enabled:
+        app.state.cube_task = asyncio.create_task(_refresh_sales_cube_forever())
+
+@app.on_event("shutdown")
+async def stop_sales_cube():
+    task = getattr(app.state, "cube_task", None)
+    if task:
+        task.cancel()
+
+async def _sync_data_version_forever():
+    while True:
+        try:
+            latest = await current_data_version.fetch(redis_client)
+            if sales_cube.enabled and current_data_version.value not in (None, latest):
+                # Another worker published new data: adopt its version only once
+                # this worker's cube holds it, or old bodies would get new ETags
+                await run_in_threadpool(_load_sales_cube)
+            current_data_version.value = latest
+        except Exception as e:
+            # Keep the last known version; ETags stay valid until the next sync
+            logger.error(f"DATA_VERSION|SYNC|FAILED|{str(e)}")
+        await asyncio.sleep(DATA_VERSION_POLL_SECONDS)
+
+@app.on_event("startup")
+async def start_cache_warmup():
+    # Fills only missing entries, so a deploy over a warm Redis costs a round of cache hits
+    if CACHE_WARM_ON_STARTUP:
+        cache_warmer.start(app, redis_client, SessionLocal, refresh=False)
+
+@app.on_event("shutdown")
+async def stop_cache_warmup():
+    if cache_warmer.running:
+        cache_warmer.task.cancel()
+
+forecast_job = BackgroundJob("FORECASTS")
+
+@app.on_event("shutdown")
+async def stop_forecasts():
+    forecast_job.cancel()
+
+# Any constant shared by the workers; serializes their startup backfills
+BACKFILL_LOCK_ID = 4_046_034
+
+def _backfill_derived_tables() -> list:
+    """
+    Build the tables a deploy over an existing sales_fact starts without and
+    that are otherwise only filled by refresh, ingest and /admin/forecasts:
+    the dimension tables, the latest_inventory snapshot, the SKU leaderboard
+    and the first stock alert run.
+    Returns the names of the tables filled.
+    """
+    filled = []
+    db = SessionLocal()
+    try:
+        db.execute(text("SELECT pg_advisory_xact_lock(:id)"), {"id": BACKFILL_LOCK_ID})
+        if db.query(DimStore.store_id).first() is None or db.query(DimCalendar.date).first() is None:
+            refresh_dimensions(db)
+            filled.append("dimensions")
+        if db.query(LatestInventory.sku_id).first() is None:
+            refresh_latest_inventory(db)
+            filled.append("latest_inventory")
+        if db.query(SkuLeaderboard.rank).first() is None:
+            refresh_sku_leaderboard(db)
+            filled.append("sku_leaderboard")
+        # A run over an empty snapshot has no rows; replace it once there is inventory
+        run = latest_alert_run(db)
+        if (run is None or run.sku_stores == 0) and db.query(LatestInventory.sku_id).first() is not None:
+            run_stock_alerts(db)
+            filled.append("stock_alerts")
+        db.commit()
+    finally:
+        db.close()
+    return filled
+
+async def _backfill_on_startup():
+    try:
+        filled = await run_in_threadpool(_backfill_derived_tables)
+    except Exception as e:
+        logger.error(f"BACKFILL|FAILED|{str(e)}")
+        return
+    if filled:
+        logger.info(f"BACKFILL|COMPLETE|TABLES={','.join(filled)}")
+        # Entries cached meanwhile, and the startup warm-up, saw empty tables
+        await _invalidate_derived_caches()
+
+@app.on_event("startup")
+async def start_backfill():
+    app.state.backfill_task = asyncio.create_task(_backfill_on_startup())
+
+@app.on_event("startup")
+async def start_data_version_sync():
+    # Until the first sync responses carry no ETag and versioned cache keys are bypassed
+    try:
+        await current_data_version.sync(redis_client)
+    except Exception as e:
+        logger.error(f"DATA_VERSION|SYNC|FAILED|{str(e)}")
+    app.state.data_version_task = asyncio.create_task(_sync_data_version_forever())
+
+@app.on_event("shutdown")
+async def stop_data_version_sync():
+    task = getattr(app.state, "data_version_task", None)
+    if task:
+        task.cancel()
+
 @app.get("/information")
 def get_information(db: Session = Depends(get_db)):
+    if sales_cube.ready:
+        return {
+            "number_of_countries": sales_cube.count_distinct("country"),
+            "total_net_sales": sales_cube.totals({"net_sales": ("sum", "net_sales", None)})["net_sales"],
+            "total_stores": sales_cube.count_distinct("store_id"),
+            "total_products": sales_cube.count_distinct("sku_id"),
+            "number_of_days": sales_cube.count_distinct("day"),
+        }
+
     # Gộp tất cả tính toán vào một query duy nhất
     result = db.query(
         func.count(func.distinct(SalesFact.country)).label("number_of_countries"),
@@ -58,7 +283,7 @@ def get_information(db: Session = Depends(get_db)):
 def get_rows(
     db: Session = Depends(get_db)
 ):
-    countries = db.query(SalesFact.country).distinct().all()
+    countries = db.query(DimStore.country).distinct().order_by(DimStore.country).all()
 
     result = [c[0] for c in countries if c[0] is not None]
 
@@ -72,37 +297,51 @@ def get_net_sales(
     db: Session = Depends(get_db),
     year: str = Query("all", description="Filter by year, use 'all' for no filter"),
     month: str = Query("all", description="Filter by month, use 'all' for no filter"),
+    format: str = Query("rows", pattern=SERIES_FORMAT_PATTERN, description="rows, or columnar for one array per field"),
+    granularity: str = Query("day", pattern=GRANULARITY_PATTERN, description="Aggregate per day, week, month or quarter"),
+    max_points: int = Query(None, ge=3, description="Downsample to at most this many points (LTTB), omit for every point"),
 ):
-    query = db.query(
-        SalesFact.date,
-        func.sum(SalesFact.net_sales).label("net_sales")
-    )
-
-    yearList = db.query(func.extract("year", SalesFact.date).distinct()).order_by(func.extract("year", SalesFact.date)).all()
-
-    if country != "all":
-        query = query.filter(SalesFact.country == country)
+    return FastJSONResponse(_query_net_sales_daily(db, country, year, month, format, granularity, max_points))
+
+def _query_net_sales_daily(db: Session, country: str, year: str, month: str,
+                           format: str = "rows", granularity: str = "day", max_points: int = None):
+    if sales_cube.ready:
+        rows = sales_cube.group_by(
+            "date", {"net_sales": ("sum", "net_sales")},
+            granularity=granularity, country=country, year=year, month=month
+        )
+        yearList = [(y,) for y in sales_cube.years]
+    else:
+        period = period_column(SalesFact.date, granularity)
+        query = db.query(
+            period.label("date"),
+            func.sum(SalesFact.net_sales).label("net_sales")
+        ).filter(*sales_filters(country, year, month))
 
-    if year != "all":
-        query = query.filter(func.extract("year", SalesFact.date) == int(year))
-    if month != "all":
-        query = query.filter(func.extract("month", SalesFact.date) == int(month))
+        yearList = db.query(DimCalendar.year).distinct().order_by(DimCalendar.year).all()
 
-    rows = query.group_by(SalesFact.date).order_by(SalesFact.date).all()
+        rows = query.group_by(period).order_by(period).all()
 
     start_date = rows[0].date if rows else None
     end_date = rows[-1].date if rows else None
+    points = len(rows)
+    rows = downsample(rows, "net_sales", max_points)
+
+    data = [
+        {"date": r.date, "net_sales": float(r.net_sales)}
+        for r in rows
+    ]
 
     return {
         "meta": {
             "startDate": start_date,
             "endDate": end_date,
-            "yearList": [int(y[0]) for y in yearList]
+            "yearList": [int(y[0]) for y in yearList],
+            "granularity": granularity,
+            "points": points,
+            "downsampled": len(rows) < points
         },
-        "data": [
-            {"date": r.date, "net_sales": float(r.net_sales)}
-            for r in rows
-        ]
+        "data": columnar(data, ["date", "net_sales"]) if format == "columnar" else data
     }
 
 @app.get("/unit_sold/daily")
@@ -115,51 +354,61 @@ def get_units_sold(
     category: str = Query("all", description="Filter by category, use 'all' for no filter"),
     brand: str = Query("all", description="Filter by brand, use 'all' for no filter"),
     sku_id: str = Query("all", description="Filter by SKU ID, use 'all' for no filter"),
+    format: str = Query("rows", pattern=SERIES_FORMAT_PATTERN, description="rows, or columnar for one array per field"),
+    granularity: str = Query("day", pattern=GRANULARITY_PATTERN, description="Aggregate per day, week, month or quarter"),
+    max_points: int = Query(None, ge=3, description="Downsample to at most this many points (LTTB), omit for every point"),
 ):
-    query = db.query(
-        SalesFact.date,
-        func.sum(SalesFact.units_sold).label("units_sold")
-    )
-
-    yearList = db.query(func.extract("year", SalesFact.date).distinct()).order_by(func.extract("year", SalesFact.date)).all()
-
-    if country != "all":
-        query = query.filter(SalesFact.country == country)
-
-    if year != "all":
-        query = query.filter(func.extract("year", SalesFact.date) == int(year))
+    if sales_cube.ready:
+        rows = sales_cube.group_by(
+            "date", {"units_sold": ("sum", "units_sold")},
+            granularity=granularity, country=country, year=year, month=month,
+            store_id=store, category=category, brand=brand, sku_id=sku_id
+        )
+        yearList = [(y,) for y in sales_cube.years]
+    else:
+        period = period_column(SalesFact.date, granularity)
+        query = db.query(
+            period.label("date"),
+            func.sum(SalesFact.units_sold).label("units_sold")
+        ).filter(*sales_filters(country, year, month))
 
-    if month != "all":
-        query = query.filter(func.extract("month", SalesFact.date) == int(month))
+        yearList = db.query(DimCalendar.year).distinct().order_by(DimCalendar.year).all()
 
-    if store != "all":
-        query = query.filter(SalesFact.store_id == store)
+        if store != "all":
+            query = query.filter(SalesFact.store_id == store)
 
-    if category != "all":
-        query = query.filter(SalesFact.category == category)
+        if category != "all":
+            query = query.filter(SalesFact.category == category)
 
-    if brand != "all":
-        query = query.filter(SalesFact.brand == brand)
+        if brand != "all":
+            query = query.filter(SalesFact.brand == brand)
 
-    if sku_id != "all":
-        query = query.filter(SalesFact.sku_id == sku_id)
+        if sku_id != "all":
+            query = query.filter(SalesFact.sku_id == sku_id)
 
-    rows = query.group_by(SalesFact.date).order_by(SalesFact.date).all()
+        rows = query.group_by(period).order_by(period).all()
 
     start_date = rows[0].date if rows else None
     end_date = rows[-1].date if rows else None
+    points = len(rows)
+    rows = downsample(rows, "units_sold", max_points)
 
-    return {
+    data = [
+        {"date": r.date, "units_sold": int(r.units_sold)}
+        for r in rows
+    ]
+
+    return FastJSONResponse({
         "meta": {
             "startDate": start_date,
             "endDate": end_date,
-            "yearList": [int(y[0]) for y in yearList]
+            "yearList": [int(y[0]) for y in yearList],
+            "granularity": granularity,
+            "points": points,
+            "downsampled": len(rows) < points
         },
-        "data": [
-            {"date": r.date, "units_sold": int(r.units_sold)}
-            for r in rows
-        ]
-    }
+        "data": columnar(data, ["date", "units_sold"]) if format == "columnar" else data
+    })
 
 @app.get("/net_sales/category")
 def get_net_sales_by_category(
@@ -168,20 +417,18 @@ def get_net_sales_by_category(
     year: str = Query("all", description="Filter by year, use 'all' for no filter"),
     month: str = Query("all", description="Filter by month, use 'all' for no filter"),
 ):
-    query = db.query(
-        SalesFact.category,
-        func.sum(SalesFact.net_sales).label("net_sales")
-    )
-
-    if country != "all":
-        query = query.filter(SalesFact.country == country)
-
-    if year != "all":
-        query = query.filter(func.extract("year", SalesFact.date) == int(year))
-    if month != "all":
-        query = query.filter(func.extract("month", SalesFact.date) == int(month))
+    if sales_cube.ready:
+        rows = sales_cube.group_by(
+            "category", {"net_sales": ("sum", "net_sales")},
+            country=country, year=year, month=month
+        )
+    else:
+        query = db.query(
+            SalesFact.category,
+            func.sum(SalesFact.net_sales).label("net_sales")
+        ).filter(*sales_filters(country, year, month))
 
-    rows = query.group_by(SalesFact.category).order_by(SalesFact.category).all()
+        rows = query.group_by(SalesFact.category).order_by(SalesFact.category).all()
 
     return {
         "data": [
@@ -197,34 +444,30 @@ def get_unit_sold_statistics(
     year: str = Query("all", description="Filter by year, use 'all' for no filter"),
     month: str = Query("all", description="Filter by month, use 'all' for no filter"),
 ):
-    groups = {
-        "weekday": lambda q: q.where(SalesFact.is_weekend == False),
-        "weekend": lambda q: q.where(SalesFact.is_weekend == True),
-        "holiday": lambda q: q.where(SalesFact.is_holiday == True),
-        "non_holiday": lambda q: q.where(SalesFact.is_holiday == False),
-    }
-
-    result = {}
-
-    for name, filter_fn in groups.items():
-        query = db.query(
-            func.sum(SalesFact.units_sold).label("total_units_sold"),
-        )
-
-        query = filter_fn(query)
-
-        if country != "all":
-            query = query.filter(SalesFact.country == country)
-        if year != "all":
-            query = query.filter(func.extract("year", SalesFact.date) == int(year))
-        if month != "all":
-            query = query.filter(func.extract("month", SalesFact.date) == int(month))
+    metrics = [
+        Metric("weekday", "sum", SalesFact.units_sold, SalesFact.is_weekend == False),
+        Metric("weekend", "sum", SalesFact.units_sold, SalesFact.is_weekend == True),
+        Metric("holiday", "sum", SalesFact.units_sold, SalesFact.is_holiday == True),
+        Metric("non_holiday", "sum", SalesFact.units_sold, SalesFact.is_holiday == False),
+    ]
 
-        res = query.one()
+    # One scan computes all four groups
+    if sales_cube.ready:
+        totals = sales_cube.totals({
+            "weekday": ("sum", "units_sold", ("is_weekend", False)),
+            "weekend": ("sum", "units_sold", ("is_weekend", True)),
+            "holiday": ("sum", "units_sold", ("is_holiday", True)),
+            "non_holiday": ("sum", "units_sold", ("is_holiday", False)),
+        }, country=country, year=year, month=month)
+    else:
+        totals = run_metrics(db, metrics, sales_filters(country, year, month))
 
-        result[name] = {
-            "total_units_sold": int(res.total_units_sold) if res.total_units_sold is not None else 0
+    result = {
+        name: {
+            "total_units_sold": int(value) if value is not None else 0
         }
+        for name, value in totals.items()
+    }
 
     return result
 
@@ -234,115 +477,48 @@ async def get_top_skus(
     db: Session = Depends(get_db),
     year: str = Query("all", description="Filter by year, use 'all' for no filter"),
     month: str = Query("all", description="Filter by month, use 'all' for no filter"),
-    limit: int = Query(20, description="Number of top SKUs to return"),
+    limit: int = Query(20, ge=1, description="Number of top SKUs to return, at most SKU_LEADERBOARD_SIZE"),
 ):
-    cache_key = f"top_skus:{country}:{year}:{month}:{limit}"
+    """
+    Best-selling SKUs with their top store, read from the sku_leaderboard
+    table maintained on ingest (see utils/leaderboard.py).
+    """
+    # Only SKU_LEADERBOARD_SIZE SKUs are ranked per filter
+    limit = min(limit, SKU_LEADERBOARD_SIZE)
+
+    # One entry per filter holds the whole leaderboard; every limit is a slice of it
+    cache_key = f"top_skus:{country}:{year}:{month}"
 
     cached = await redis_client.get(cache_key)
     if cached:
         cached_data = json.loads(cached)
         return {
             "source": "redis",
-            **cached_data
+            "data": cached_data["data"][:limit],
         }
 
-    # Subquery: sum units_sold per sku per store
-    sales_per_sku_store = db.query(
-        SalesFact.sku_id,
-        SalesFact.store_id,
-        func.sum(SalesFact.units_sold).label("total_units")
-    )
-
-    if country != "all":
-        sales_per_sku_store = sales_per_sku_store.filter(SalesFact.country == country)
-    if year != "all":
-        sales_per_sku_store = sales_per_sku_store.filter(func.extract("year", SalesFact.date) == int(year))
-    if month != "all":
-        sales_per_sku_store = sales_per_sku_store.filter(func.extract("month", SalesFact.date) == int(month))
-
-    sales_per_sku_store = sales_per_sku_store.group_by(SalesFact.sku_id, SalesFact.store_id).subquery()
-
-    # Subquery: max units per sku
-    max_per_sku = db.query(
-        sales_per_sku_store.c.sku_id,
-        func.max(sales_per_sku_store.c.total_units).label("max_units")
-    ).group_by(sales_per_sku_store.c.sku_id).subquery()
-
-    # Subquery: top store per sku
-    top_store_per_sku = db.query(
-        sales_per_sku_store.c.sku_id,
-        sales_per_sku_store.c.store_id,
-        sales_per_sku_store.c.total_units.label("units_sold")
+    rows = db.query(
+        SkuLeaderboard.sku_id,
+        DimSku.sku_name,
+        DimSku.category,
+        DimSku.subcategory,
+        DimSku.brand,
+        DimSku.supplier_id,
+        SkuLeaderboard.store_id,
+        DimStore.city,
+        SkuLeaderboard.units_sold,
+        SkuLeaderboard.stock_opening,
+        SkuLeaderboard.lead_time_days,
+        SkuLeaderboard.net_sales,
     ).join(
-        max_per_sku,
-        (sales_per_sku_store.c.sku_id == max_per_sku.c.sku_id) &
-        (sales_per_sku_store.c.total_units == max_per_sku.c.max_units)
-    ).subquery()
-
-    # Subquery: get latest details per sku/store
-    latest_details = db.query(
-        SalesFact.sku_id,
-        SalesFact.sku_name,
-        SalesFact.store_id,
-        SalesFact.city,
-        SalesFact.category,
-        SalesFact.subcategory,
-        SalesFact.brand,
-        SalesFact.supplier_id,
-        SalesFact.stock_opening,
-        SalesFact.lead_time_days,
-        SalesFact.net_sales,
-        func.row_number().over(
-            partition_by=[SalesFact.sku_id, SalesFact.store_id],
-            order_by=SalesFact.date.desc()
-        ).label("rn")
-    )
-    
-    if country != "all":
-        latest_details = latest_details.filter(SalesFact.country == country)
-    if year != "all":
-        latest_details = latest_details.filter(func.extract("year", SalesFact.date) == int(year))
-    if month != "all":
-        latest_details = latest_details.filter(func.extract("month", SalesFact.date) == int(month))
-    
-    latest_details = latest_details.subquery()
-    
-    # Get latest record (rn=1)
-    details_ranked = db.query(
-        latest_details.c.sku_id,
-        latest_details.c.sku_name,
-        latest_details.c.store_id,
-        latest_details.c.city,
-        latest_details.c.category,
-        latest_details.c.subcategory,
-        latest_details.c.brand,
-        latest_details.c.supplier_id,
-        latest_details.c.stock_opening,
-        latest_details.c.lead_time_days,
-        latest_details.c.net_sales,
-    ).filter(latest_details.c.rn == 1).subquery()
-
-    # Final query: combine all
-    query = db.query(
-        top_store_per_sku.c.sku_id,
-        details_ranked.c.sku_name,
-        details_ranked.c.category,
-        details_ranked.c.subcategory,
-        details_ranked.c.brand,
-        details_ranked.c.supplier_id,
-        top_store_per_sku.c.store_id,
-        details_ranked.c.city,
-        top_store_per_sku.c.units_sold,
-        details_ranked.c.stock_opening,
-        details_ranked.c.lead_time_days,
-        details_ranked.c.net_sales,
+        DimSku, DimSku.sku_id == SkuLeaderboard.sku_id
     ).join(
-        details_ranked,
-        (top_store_per_sku.c.sku_id == details_ranked.c.sku_id) &
-        (top_store_per_sku.c.store_id == details_ranked.c.store_id)
-    ).order_by(top_store_per_sku.c.units_sold.desc()).limit(limit)
-
-    rows = query.all()
+        DimStore, DimStore.store_id == SkuLeaderboard.store_id
+    ).filter(
+        SkuLeaderboard.country == country,
+        SkuLeaderboard.year == (0 if year == "all" else int(year)),
+        SkuLeaderboard.month == (0 if month == "all" else int(month)),
+    ).order_by(SkuLeaderboard.rank).all()
 
     result = {
         "data": [
@@ -365,15 +541,17 @@ async def get_top_skus(
         ]
     }
 
-    await redis_client.set(
-        cache_key,
-        json.dumps(result),
-    
-    )
+    # Empty until the first refresh or startup backfill; not cached so it shows up once built
+    if result["data"]:
+        await redis_client.set(
+            cache_key,
+            json.dumps(result),
+        
+        )
 
     return {
         "source": "db",
-        **result
+        "data": result["data"][:limit],
     }
 
 @app.get("/unit_sold/promo")
@@ -383,26 +561,24 @@ def get_units_sold_discount_scatter(
     year: str = Query("all", description="Filter by year, use 'all' for no filter"),
     month: str = Query("all", description="Filter by month, use 'all' for no filter"),
 ):
-    query = db.query(
-        SalesFact.promo_flag,
-        func.sum(SalesFact.units_sold).label("units_sold"),
-        func.sum(SalesFact.net_sales).label("net_sales"),
-    )
-
-    if country != "all":
-        query = query.filter(SalesFact.country == country)
-
-    if year != "all":
-        query = query.filter(func.extract("year", SalesFact.date) == int(year))
-
-    if month != "all":
-        query = query.filter(func.extract("month", SalesFact.date) == int(month))
-
-    rows = (
-        query
-        .group_by(SalesFact.promo_flag)
-        .all()
-    )
+    if sales_cube.ready:
+        rows = sales_cube.group_by(
+            "promo_flag",
+            {"units_sold": ("sum", "units_sold"), "net_sales": ("sum", "net_sales")},
+            country=country, year=year, month=month
+        )
+    else:
+        query = db.query(
+            SalesFact.promo_flag,
+            func.sum(SalesFact.units_sold).label("units_sold"),
+            func.sum(SalesFact.net_sales).label("net_sales"),
+        ).filter(*sales_filters(country, year, month))
+
+        rows = (
+            query
+            .group_by(SalesFact.promo_flag)
+            .all()
+        )
 
     return {
         "data": [
@@ -422,16 +598,129 @@ async def get_net_sales_by_location(
     year: str = Query("all", description="Filter by year, use 'all' for no filter"),
     month: str = Query("all", description="Filter by month, use 'all' for no filter")
 ):
+    result, source = await _net_sales_locations(db, country, year, month)
+    return {
+        "source": source,
+        **result
+    }
+
+async def _net_sales_locations(db: Session, country: str, year: str, month: str):
+    """Net sales per store for the filter as GeoJSON, and whether it came from Redis or the db."""
     cache_key = f"net_sales_location:{country}:{year}:{month}"
 
     cached = await redis_client.get(cache_key)
     if cached:
-        cached_data = json.loads(cached)
-        return {
-            "source": "redis",
-            **cached_data
+        return json.loads(cached), "redis"
+
+    result = await run_in_threadpool(_query_net_sales_by_location, db, country, year, month)
+
+    await redis_client.set(
+        cache_key,
+        json.dumps(result),
+    
+    )
+    return result, "db"
+
+async def _location_clusters(country: str, year: str, month: str, zoom: int, load_stores) -> dict:
+    """
+    Columnar grid clusters of every store for the filter at `zoom`, cached per
+    zoom; on a miss they are computed from `load_stores()`.
+    """
+    cache_key = f"net_sales_clusters:{country}:{year}:{month}:{zoom}"
+
+    cached = await redis_client.get(cache_key)
+    if cached:
+        return json.loads(cached)
+
+    clusters = cluster_points(await load_stores(), zoom)
+
+    await redis_client.set(cache_key, json.dumps(clusters))
+    return clusters
+
+@app.get("/net_sales/location/clusters")
+async def get_net_sales_location_clusters(
+    db: Session = Depends(get_db),
+    country: str = Query("all", description="Country to filter by"),
+    year: str = Query("all", description="Filter by year, use 'all' for no filter"),
+    month: str = Query("all", description="Filter by month, use 'all' for no filter"),
+    zoom: int = Query(3, ge=0, le=24, description="Map zoom level"),
+    bbox: str = Query(None, pattern=BBOX_PATTERN, description="Visible area as west,south,east,north in degrees"),
+):
+    """
+    Stores merged into map clusters: one feature per grid cell of
+    CLUSTER_CELL_PX screen pixels at the zoom, with summed net sales and the
+    stock-out rate over the cell's store-days. Cells are computed per filter
+    and zoom and cached; bbox limits the response to the cells overlapping
+    the visible area. When
+    more than CLUSTER_MAX_FEATURES cells remain, coarser zooms are used.
+    """
+    try:
+        bounds = parse_bbox(bbox) if bbox else None
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    stores = None
+
+    async def load_stores():
+        # Read at most once per request, however many zooms miss the cache
+        nonlocal stores
+        if stores is None:
+            locations, _ = await _net_sales_locations(db, country, year, month)
+            features = locations["features"]
+            stores = {
+                "store_id": [f["properties"]["store_id"] for f in features],
+                "longitude": [f["geometry"]["coordinates"][0] for f in features],
+                "latitude": [f["geometry"]["coordinates"][1] for f in features],
+                **{
+                    name: [f["properties"][name] for f in features]
+                    for name in ["net_sales", "stock_out_count", "total_count"]
+                },
+            }
+        return stores
+
+    cluster_zoom = min(zoom, CLUSTER_MAX_ZOOM)
+    while True:
+        clusters = await _location_clusters(country, year, month, cluster_zoom, load_stores)
+        selected = range(len(clusters["cell"]))
+        if bounds:
+            # By cell, not centroid: a cluster centred off-screen may hold visible stores
+            inside = cells_in_bbox(clusters["cell"], cluster_zoom, bounds)
+            selected = [i for i in selected if inside[i]]
+        if len(selected) <= CLUSTER_MAX_FEATURES or cluster_zoom == 0:
+            break
+        cluster_zoom -= 1
+
+    features = []
+    for i in selected[:CLUSTER_MAX_FEATURES]:
+        total_count = clusters["total_count"][i]
+        properties = {
+            "cluster_id": clusters["cell"][i],
+            "stores": clusters["stores"][i],
+            "net_sales": clusters["net_sales"][i],
+            "stock_out_count": clusters["stock_out_count"][i],
+            "stock_out_rate": round(clusters["stock_out_count"][i] / total_count, 4) if total_count else 0,
         }
+        if clusters["store_id"][i] is not None:
+            properties["store_id"] = clusters["store_id"][i]
+        features.append({
+            "type": "Feature",
+            "geometry": {"type": "Point", "coordinates": [clusters["longitude"][i], clusters["latitude"][i]]},
+            "properties": properties,
+        })
+
+    return FastJSONResponse({
+        "type": "FeatureCollection",
+        "features": features,
+        "meta": {
+            "zoom": zoom,
+            "cluster_zoom": cluster_zoom,
+            "cell_px": CLUSTER_CELL_PX,
+            "clusters": len(features),
+            "stores": int(sum(clusters["stores"][i] for i in selected)),
+        },
+    })
 
+def _query_net_sales_by_location(db: Session, country: str, year: str, month: str):
     query = db.query(
         SalesFact.store_id,
         SalesFact.latitude,
@@ -462,7 +751,7 @@ async def get_net_sales_by_location(
 
     rows = query.all()
 
-    result = {
+    return {
         "type": "FeatureCollection",
         "features": [
             {
@@ -475,6 +764,7 @@ async def get_net_sales_by_location(
                     "store_id": r.store_id,
                     "net_sales": float(r.net_sales or 0),
                     "stock_out_count": int(r.stock_out_count or 0),
+                    "total_count": int(r.total_count or 0),
                     "stock_out_rate": float(
                         r.stock_out_count / r.total_count
                         if r.total_count else 0
@@ -485,17 +775,6 @@ async def get_net_sales_by_location(
             if r.latitude is not None and r.longitude is not None
         ],
     }
-    
-    await redis_client.set(
-        cache_key,
-        json.dumps(result),
-    
-    )
-
-    return {
-        "source": "db",
-        **result
-    }
 
 @app.get('/store/list')
 async def get_store_list(
@@ -512,17 +791,19 @@ async def get_store_list(
         }
 
     stores = db.query(
-        SalesFact.store_id,
-    ).distinct().all()
+        DimStore.store_id,
+    ).order_by(DimStore.store_id).all()
 
     result = {
         "data": [s[0] for s in stores if s[0] is not None]
     }
 
-    await redis_client.set(
-        cache_name,
-        json.dumps(result["data"])
-    )
+    # Empty until the dimension tables are filled; not cached so they show up once built
+    if result["data"]:
+        await redis_client.set(
+            cache_name,
+            json.dumps(result["data"])
+        )
 
     return {
         "source": "db",
@@ -543,17 +824,19 @@ async def get_city_list(
         }
 
     stores = db.query(
-        SalesFact.city,
-    ).distinct().all()
+        DimStore.city,
+    ).distinct().order_by(DimStore.city).all()
 
     result = {
         "data": [s[0] for s in stores if s[0] is not None]
     }
 
-    await redis_client.set(
-        cache_name,
-        json.dumps(result["data"])
-    )
+    # Empty until the dimension tables are filled; not cached so they show up once built
+    if result["data"]:
+        await redis_client.set(
+            cache_name,
+            json.dumps(result["data"])
+        )
 
     return {
         "source": "db",
@@ -575,8 +858,8 @@ async def get_category_list(
         }
 
     categories = db.query(
-        SalesFact.category
-    ).distinct().all()
+        DimSku.category
+    ).distinct().order_by(DimSku.category).all()
 
     result = [c[0] for c in categories if c[0] is not None]
 
@@ -584,10 +867,12 @@ async def get_category_list(
         "data": result
     }
 
-    await redis_client.set(
-        cache_name,
-        json.dumps(result["data"])
-    )
+    # Empty until the dimension tables are filled; not cached so they show up once built
+    if result["data"]:
+        await redis_client.set(
+            cache_name,
+            json.dumps(result["data"])
+        )
 
     return {
         "source": "db",
@@ -609,8 +894,8 @@ async def get_brand_list(
         }
 
     brands = db.query(
-        SalesFact.brand
-    ).distinct().all()
+        DimSku.brand
+    ).distinct().order_by(DimSku.brand).all()
 
     result = [b[0] for b in brands if b[0] is not None]
 
@@ -618,10 +903,12 @@ async def get_brand_list(
         "data": result
     }
 
-    await redis_client.set(
-        cache_name,
-        json.dumps(result["data"])
-    )
+    # Empty until the dimension tables are filled; not cached so they show up once built
+    if result["data"]:
+        await redis_client.set(
+            cache_name,
+            json.dumps(result["data"])
+        )
 
     return {
         "source": "db",
@@ -635,14 +922,14 @@ async def get_product_list(
     db: Session = Depends(get_db)
 ):
     query = db.query(
-        SalesFact.sku_id,
-        SalesFact.sku_name
-    ).distinct()
+        DimSku.sku_id,
+        DimSku.sku_name
+    ).order_by(DimSku.sku_id)
 
     if category:
-        query = query.filter(SalesFact.category == category)
+        query = query.filter(DimSku.category == category)
     if brand:
-        query = query.filter(SalesFact.brand == brand)
+        query = query.filter(DimSku.brand == brand)
 
     products = query.all()
 
@@ -655,30 +942,212 @@ async def get_product_list(
         "data": result
     }
 
-@app.post("/predict_7days")
-async def predict_7days(
-    request: dict,
-    db: Session = Depends(get_db)
+async def _refresh(status: dict, start_date, end_date):
+    def run():
+        db = SessionLocal()
+        try:
+            return refresh_after_ingest(db, start_date, end_date)
+        finally:
+            db.close()
+
+    status["state"] = "refreshing"
+    timings = await run_in_threadpool(run)
+    await _invalidate_derived_caches()
+    return {"timings": timings}
+
+refresh_job = BackgroundJob("REFRESH")
+
+@app.on_event("shutdown")
+async def stop_refresh():
+    refresh_job.cancel()
+
+@app.post('/admin/refresh', status_code=202, dependencies=[Depends(require_admin)])
+async def refresh_derived_tables(
+    start_date: str = Query(None, description="First ingested date (YYYY-MM-DD), omit for the whole table"),
+    end_date: str = Query(None, description="Last ingested date (YYYY-MM-DD), omit for the whole table"),
 ):
     """
-    Predicts 7-day demand and lead time forecast for a specific store and SKU.
-    Forwards the request to AI backend /ai/predict_7days endpoint.
+    Refresh dimension and derived tables after new days were loaded into
+    sales_fact, in the background; poll GET /admin/refresh for progress.
     """
     try:
-        # Validate required fields
-        required_fields = [
-            'start_date', 'store_id', 'sku_id', 'category', 'brand'
-        ]
+        start = datetime.strptime(start_date, "%Y-%m-%d").date() if start_date else None
+        end = datetime.strptime(end_date, "%Y-%m-%d").date() if end_date else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid date format")
 
-        for field in required_fields:
-            if field not in request:
-                raise HTTPException(status_code=400, detail=f"Missing required field: {field}")
+    started = refresh_job.start(_refresh, start_date=start, end_date=end)
+    return {
+        "code": "success",
+        "message": "Refresh started" if started else "Refresh already running",
+        "job_id": refresh_job.status["job_id"],
+    }
 
-        # Validate date format
-        date_str = request['start_date']
-        datetime.strptime(date_str, '%Y-%m-%d')
+@app.get('/admin/refresh', dependencies=[Depends(require_admin)])
+async def get_refresh_status():
+    """State and, once finished, the per-step timings of this worker's latest refresh."""
+    return refresh_job.status
+
+async def _publish_new_data(reload_cube: bool = True):
+    if reload_cube and sales_cube.enabled:
+        # Reload now rather than at the next CUBE_REFRESH_SECONDS tick, and
+        # before warming so cached entries are built from the new data
+        await run_in_threadpool(_load_sales_cube)
+    if CACHE_WARM_AFTER_REFRESH:
+        # The warmer builds the next data version's entries and publishes it
+        # when done, or queues this refresh behind a run in progress
+        cache_warmer.start(app, redis_client, SessionLocal, refresh=True)
+    else:
+        await current_data_version.bump(redis_client)
+
+async def _invalidate_derived_caches():
+    app.state.reload_task = asyncio.create_task(_publish_new_data())
+
+@app.post('/admin/warmup', dependencies=[Depends(require_admin)])
+async def warm_caches(
+    refresh: bool = Query(False, description="Recompute every entry instead of only the missing ones"),
+):
+    """
+    Request every cached endpoint for every country/year/month filter in the
+    dimension tables in the background, at most CACHE_WARM_CONCURRENCY at a time.
+    """
+    started = cache_warmer.start(app, redis_client, SessionLocal, refresh=refresh)
+    if started:
+        message = "Cache warm-up started"
+    elif refresh:
+        message = "Cache warm-up queued behind the run in progress"
+    else:
+        message = "Cache warm-up already running"
+    return {"code": "success", "message": message}
+
+@app.get('/admin/warmup', dependencies=[Depends(require_admin)])
+async def get_warmup_status():
+    """Progress and per-endpoint timings of this worker's latest warm-up run."""
+    return cache_warmer.status
+
+async def _ingest(status: dict, path: str, format: str, refresh: bool, partition: bool):
+    def run():
+        db = SessionLocal()
+        try:
+            if partition:
+                status["state"] = "partitioning"
+                partition_sales_fact(db)
+            status["state"] = "loading"
+            stats = ingest_file(db, path, format, progress=status)
+            db.commit()
+            if refresh and stats["rows"]:
+                status["state"] = "refreshing"
+                stats["timings"] = refresh_after_ingest(db, stats["start_date"], stats["end_date"])
+            return stats
+        except IngestError:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    stats = await run_in_threadpool(run)
+    await _invalidate_derived_caches()
+    return stats
+
+ingest_job = BackgroundJob("INGEST")
+
+@app.on_event("shutdown")
+async def stop_ingest():
+    ingest_job.cancel()
+
+@app.post('/admin/ingest', status_code=202, dependencies=[Depends(require_admin)])
+async def ingest_sales(
+    path: str = Query(..., description="CSV or Parquet file under INGEST_DIR"),
+    format: str = Query(None, pattern="^(csv|parquet)$", description="Defaults to the file extension"),
+    refresh: bool = Query(True, description="Refresh derived tables for the ingested dates"),
+    partition: bool = Query(False, description="First convert an unpartitioned sales_fact to monthly partitions"),
+):
+    """
+    Bulk-load a CSV or Parquet file into sales_fact with COPY, upserting on
+    (date, store_id, sku_id), then refresh derived tables and caches for the
+    loaded date range. The file is loaded in one transaction, in the
+    background; poll GET /admin/ingest for progress.
+    """
+    try:
+        resolved = resolve_ingest_path(path)
+    except IngestError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
-        # Build the request body for the AI backend API
+    started = ingest_job.start(_ingest, path=resolved, format=format, refresh=refresh, partition=partition)
+    return {
+        "code": "success",
+        "message": "Ingest started" if started else "Ingest already running",
+        "job_id": ingest_job.status["job_id"],
+    }
+
+@app.get('/admin/ingest', dependencies=[Depends(require_admin)])
+async def get_ingest_status():
+    """State, rows loaded so far and, once finished, the stats of this worker's latest ingest."""
+    return ingest_job.status
+
+def _run_stock_alerts():
+    db = SessionLocal()
+    try:
+        run_id = run_stock_alerts(db)
+        db.commit()
+        return run_id
+    finally:
+        db.close()
+
+async def _forecast_and_alert(status: dict, refresh: bool):
+    stats = await materialize_forecasts(SessionLocal, ai_client, refresh=refresh, status=status)
+    status["state"] = "alerting"
+    run_id = await run_in_threadpool(_run_stock_alerts)
+
+    # A new alert run changes /stock_alerts and /analytics/inventory-optimization
+    await _publish_new_data(reload_cube=False)
+    return {"forecasts": stats, "run_id": run_id}
+
+@app.post('/admin/forecasts', status_code=202, dependencies=[Depends(require_admin)])
+async def refresh_forecasts(
+    refresh: bool = Query(False, description="Re-forecast SKU-stores whose forecast is already current"),
+):
+    """
+    Materialize 7-day demand and lead-time forecasts from the AI backend for
+    every SKU-store in the background, then compute a new stock alert run
+    from them. Poll GET /admin/forecasts for progress.
+    """
+    started = forecast_job.start(_forecast_and_alert, refresh=refresh)
+    return {
+        "code": "success",
+        "message": "Forecasts started" if started else "Forecasts already running",
+        "job_id": forecast_job.status["job_id"],
+    }
+
+@app.get('/admin/forecasts', dependencies=[Depends(require_admin)])
+async def get_forecast_status():
+    """Progress of this worker's latest forecast run: SKU-stores forecasted, failed and the alert run_id."""
+    return forecast_job.status
+
+@app.post("/predict_7days")
+async def predict_7days(
+    request: dict,
+    db: Session = Depends(get_db)
+):
+    """
+    Predicts 7-day demand and lead time forecast for a specific store and SKU.
+    Forwards the request to AI backend /ai/predict_7days endpoint.
+    """
+    try:
+        # Validate required fields
+        required_fields = [
+            'start_date', 'store_id', 'sku_id', 'category', 'brand'
+        ]
+
+        for field in required_fields:
+            if field not in request:
+                raise HTTPException(status_code=400, detail=f"Missing required field: {field}")
+
+        # Validate date format
+        date_str = request['start_date']
+        datetime.strptime(date_str, '%Y-%m-%d')
+
+        # Build the request body for the AI backend API
         body = {
             "start_date": date_str,
             "store_id": request['store_id'],
@@ -687,15 +1156,18 @@ async def predict_7days(
             "brand": request['brand']
         }
 
-        # Send to AI server
-        async with httpx.AsyncClient() as client:
-            response = await client.post("http://3.27.185.230:8001/ai/predict_7days", json=body, timeout=30.0)
-            response.raise_for_status()
-            result = response.json()
+        # Send to AI server; forecasts are deterministic, so the call is safe to retry
+        response = await ai_client.post("/ai/predict_7days", json=body, idempotent=True)
+        response.raise_for_status()
+        result = response.json()
 
-            # Return the result
-            return result
+        # Return the result
+        return result
 
+    except HTTPException:
+        raise
+    except CircuitOpenError as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except KeyError as e:
         raise HTTPException(status_code=400, detail=f"Missing field: {e}")
     except ValueError as e:
@@ -712,12 +1184,21 @@ async def get_stock_alerts(
     urgency: str = Query("all", description="Filter by urgency: critical, warning, all"),
 ):
     """
-    Get stock alerts for items below safety stock levels.
-    Returns items with low stock that may lead to stockouts.
+    Get stock alerts for SKU-stores projected to run out within their lead time
+    (critical) or shortly after (warning), from the latest alert run.
     """
-    from sqlalchemy import and_, or_
+    run = latest_alert_run(db)
+    if run is None:
+        # The first run is still being computed at startup; not cached
+        return {
+            "source": "db",
+            "data": [],
+            "summary": {"critical_count": 0, "warning_count": 0, "total_alerts": 0},
+            "run": None,
+        }
 
-    cache_key = f"stock_alerts:{country}:{urgency}"
+    # A new run gets new keys, so cached alerts never outlive their run
+    cache_key = f"stock_alerts:{run.run_id}:{country}:{urgency}"
 
     cached = await redis_client.get(cache_key)
     if cached:
@@ -726,87 +1207,56 @@ async def get_stock_alerts(
             "source": "redis",
             **cached_data
         }
-    
-    # Get latest date for each SKU-Store combination
-    latest_records = db.query(
-        SalesFact.sku_id,
-        SalesFact.store_id,
-        func.max(SalesFact.date).label("latest_date")
-    ).group_by(SalesFact.sku_id, SalesFact.store_id).subquery()
-    
-    # Join with latest records
-    query = db.query(
-        SalesFact.sku_id,
-        SalesFact.sku_name,
-        SalesFact.store_id,
-        SalesFact.city,
-        SalesFact.stock_on_hand,
-        SalesFact.stock_opening,
-        SalesFact.lead_time_days,
-        func.avg(SalesFact.units_sold).label("avg_daily_sales"),
-    ).join(
-        latest_records,
-        and_(
-            SalesFact.sku_id == latest_records.c.sku_id,
-            SalesFact.store_id == latest_records.c.store_id,
-            SalesFact.date == latest_records.c.latest_date
-        )
-    )
-    
+
+    query = db.query(StockAlert).filter(StockAlert.run_id == run.run_id)
+
     if country != "all":
-        query = query.filter(SalesFact.country == country)
-    
-    # Filter for low stock or stockout
-    query = query.filter(
-        or_(
-            SalesFact.stock_on_hand < SalesFact.stock_opening * 0.2,
-            SalesFact.stock_out_flag == True
-        )
-    ).group_by(
-        SalesFact.sku_id, SalesFact.sku_name, SalesFact.store_id,
-        SalesFact.city, SalesFact.stock_on_hand, SalesFact.stock_opening,
-        SalesFact.lead_time_days
-    ).order_by(SalesFact.stock_on_hand.asc())
-    
-    alerts = []
-    for row in query.all():
-        avg_daily = row.avg_daily_sales or 1
-        stock_level = row.stock_on_hand or 0
-        days_left = stock_level / avg_daily if avg_daily > 0 else 0
-        lead_time = row.lead_time_days or 7
-        
-        # Determine urgency
-        if stock_level == 0 or days_left < lead_time:
-            alert_urgency = "critical"
-        elif days_left < lead_time + 3:
-            alert_urgency = "warning"
-        else:
-            alert_urgency = "info"
-        
-        if urgency != "all" and alert_urgency != urgency:
-            continue
-        
-        alerts.append({
+        query = query.filter(StockAlert.country == country)
+    if urgency != "all":
+        query = query.filter(StockAlert.urgency == urgency)
+    else:
+        query = query.filter(StockAlert.urgency.in_(["critical", "warning"]))
+
+    query = query.order_by(
+        StockAlert.days_until_stockout.asc().nulls_last(),
+        StockAlert.sku_id,
+        StockAlert.store_id,
+    )
+
+    alerts = [
+        {
             "sku_id": row.sku_id,
             "sku_name": row.sku_name,
             "store_id": row.store_id,
             "city": row.city,
-            "current_stock": int(row.stock_on_hand or 0),
-            "safety_stock": int(row.stock_opening or 0),
-            "avg_daily_sales": round(float(row.avg_daily_sales or 0), 2),
-            "days_until_stockout": round(float(days_left), 1),
-            "lead_time_days": int(row.lead_time_days or 0),
-            "recommended_order_qty": max(int(row.stock_opening or 0) * 2 - int(row.stock_on_hand or 0), 0),
-            "urgency": alert_urgency,
-        })
-    
+            "current_stock": row.current_stock,
+            "safety_stock": row.safety_stock,
+            "reorder_point": row.reorder_point,
+            "avg_daily_sales": float(row.avg_daily_demand),
+            "days_until_stockout": float(row.days_until_stockout) if row.days_until_stockout is not None else None,
+            "stockout_date": row.stockout_date.isoformat() if row.stockout_date else None,
+            "lead_time_days": float(row.lead_time_days),
+            "recommended_order_qty": row.order_qty,
+            "urgency": row.urgency,
+            "demand_source": row.demand_source,
+        }
+        for row in query.all()
+    ]
+
     result = {
         "data": alerts,
         "summary": {
             "critical_count": sum(1 for a in alerts if a["urgency"] == "critical"),
             "warning_count": sum(1 for a in alerts if a["urgency"] == "warning"),
             "total_alerts": len(alerts)
-        }
+        },
+        "run": {
+            "run_id": run.run_id,
+            "created_at": run.created_at.isoformat(),
+            "as_of": run.as_of.isoformat() if run.as_of else None,
+            "sku_stores": run.sku_stores,
+            "forecasted": run.forecasted,
+        },
     }
 
     await redis_client.set(
@@ -873,19 +1323,23 @@ async def get_revenue_analytics(
     country: str = Query("all", description="Filter by country"),
     year: str = Query("all", description="Filter by year"),
     month: str = Query("all", description="Filter by month"),
+    format: str = Query("rows", pattern=SERIES_FORMAT_PATTERN, description="rows, or columnar for one array per field"),
+    compare: str = Query("none", pattern=COMPARE_PATTERN, description="Also compute prev_period or prev_year, with deltas and growth rates"),
 ):
     """
-    Get revenue analytics with trends and breakdown.
+    Get revenue analytics with trends and breakdown. With compare, the
+    comparison period's series and summary come from the same query.
     """
-    cache_key = f"revenue:{country}:{year}:{month}"
+    try:
+        comparison = period_comparison(year, month, compare)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
-    cached = await redis_client.get(cache_key)
+    cache_key = f"revenue:{country}:{year}:{month}:{format}:{compare}"
+
+    cached = await cached_json(redis_client, cache_key)
     if cached:
-        cached_data = json.loads(cached)
-        return {
-            "source": "redis",
-            **cached_data
-        }
+        return cached
 
     query = db.query(
         SalesFact.date,
@@ -893,22 +1347,20 @@ async def get_revenue_analytics(
         func.sum(SalesFact.units_sold).label("total_units"),
         func.count(func.distinct(SalesFact.store_id)).label("store_count")
     )
-    
-    if country != "all":
-        query = query.filter(SalesFact.country == country)
-    if year != "all":
-        query = query.filter(func.extract("year", SalesFact.date) == int(year))
-    if month != "all":
-        query = query.filter(func.extract("month", SalesFact.date) == int(month))
-    
+
+    if comparison:
+        query = query.filter(*sales_filters(country), comparison.where())
+    else:
+        query = query.filter(*sales_filters(country, year, month))
+
     rows = query.group_by(SalesFact.date).order_by(SalesFact.date).all()
-    
-    total_revenue = sum(float(r.total_revenue or 0) for r in rows)
-    total_units = sum(int(r.total_units or 0) for r in rows)
-    avg_revenue_per_day = total_revenue / len(rows) if rows else 0
 
-    result = {
-        "data": [
+    def series(rows):
+        total_revenue = sum(float(r.total_revenue or 0) for r in rows)
+        total_units = sum(int(r.total_units or 0) for r in rows)
+        avg_revenue_per_day = total_revenue / len(rows) if rows else 0
+
+        data = [
             {
                 "date": r.date.isoformat(),
                 "revenue": float(r.total_revenue or 0),
@@ -916,34 +1368,48 @@ async def get_revenue_analytics(
                 "stores": int(r.store_count or 0)
             }
             for r in rows
-        ],
-        "summary": {
-            "total_revenue": round(total_revenue, 2),
-            "total_units": total_units,
-            "avg_daily_revenue": round(avg_revenue_per_day, 2),
-            "period_days": len(rows)
+        ]
+
+        return {
+            "data": columnar(data, ["date", "revenue", "units", "stores"]) if format == "columnar" else data,
+            "summary": {
+                "total_revenue": round(total_revenue, 2),
+                "total_units": total_units,
+                "avg_daily_revenue": round(avg_revenue_per_day, 2),
+                "period_days": len(rows)
+            }
         }
-    }
 
-    await redis_client.set(cache_key, json.dumps(result),)
-    
-    return {
-        "source": "db",
-        **result
-    }
+    if not comparison:
+        return await cache_json(redis_client, cache_key, series(rows))
+
+    result = series([r for r in rows if comparison.is_current(r.date)])
+    previous = series([r for r in rows if not comparison.is_current(r.date)])
+    result["summary"]["previous"] = previous["summary"]
+    result["summary"]["change"] = change(result["summary"], previous["summary"])
+    result["previous_data"] = previous["data"]
+    result["compare"] = comparison.describe()
+
+    return await cache_json(redis_client, cache_key, result)
 
 @app.get('/analytics/profit')
 async def get_profit_analytics(
     db: Session = Depends(get_db),
     country: str = Query("all", description="Filter by country"),
     year: str = Query("all", description="Filter by year"),
-    month: str = Query("all", description="Filter by month")
+    month: str = Query("all", description="Filter by month"),
+    compare: str = Query("none", pattern=COMPARE_PATTERN, description="Also compute prev_period or prev_year, with deltas and growth rates"),
 ):
     """
-    Get profit margin analytics by category and time period.
+    Get profit margin analytics by category and time period. With compare,
+    both periods are aggregated in the same pass.
     """
-    cache_key = f"profit:{country}:{year}:{month}"
-    print("CACHE KEY:", cache_key)
+    try:
+        comparison = period_comparison(year, month, compare)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    cache_key = f"profit:{country}:{year}:{month}:{compare}"
 
     cached = await redis_client.get(cache_key)
     if cached:
@@ -953,58 +1419,65 @@ async def get_profit_analytics(
             **cached_data
         }
 
-    query = db.query(
-        SalesFact.category,
-        func.sum(SalesFact.net_sales).label("total_revenue"),
-        func.sum(SalesFact.purchase_cost * SalesFact.units_sold).label("total_cost"),
-        func.count(func.distinct(SalesFact.date)).label("days"),
-        func.avg(SalesFact.margin_pct).label("avg_margin")
-    )
-    
-    if country != "all":
-        query = query.filter(SalesFact.country == country)
-    if year != "all":
-        query = query.filter(func.extract("year", SalesFact.date) == int(year))
-    if month != "all":
-        query = query.filter(func.extract("month", SalesFact.date) == int(month))
-    
+    aggregates = {
+        "total_revenue": func.sum(SalesFact.net_sales),
+        "total_cost": func.sum(SalesFact.purchase_cost * SalesFact.units_sold),
+        "days": func.count(func.distinct(SalesFact.date)),
+    }
+
+    if comparison:
+        query = db.query(SalesFact.category, *comparison.split(aggregates))
+        query = query.filter(*sales_filters(country), comparison.where())
+    else:
+        query = db.query(SalesFact.category, *[a.label(n) for n, a in aggregates.items()])
+        query = query.filter(*sales_filters(country, year, month))
+
     rows = query.group_by(SalesFact.category).all()
-    
-    categories_profit = []
-    total_revenue = 0
-    total_cost = 0
-    
-    for row in rows:
-        revenue = float(row.total_revenue or 0)
-        cost = float(row.total_cost or 0)
-        profit = revenue - cost
-        margin = (profit / revenue * 100) if revenue > 0 else 0
-        
-        total_revenue += revenue
-        total_cost += cost
-        
-        categories_profit.append({
-            "category": row.category,
+
+    def profit(revenue, cost, days):
+        revenue = float(revenue or 0)
+        cost = float(cost or 0)
+        margin = ((revenue - cost) / revenue * 100) if revenue > 0 else 0
+        return {
             "revenue": round(revenue, 2),
             "cost": round(cost, 2),
-            "profit": round(profit, 2),
+            "profit": round(revenue - cost, 2),
             "margin_pct": round(margin, 2),
-            "days": int(row.days or 0)
-        })
-    
-    overall_profit = total_revenue - total_cost
-    overall_margin = (overall_profit / total_revenue * 100) if total_revenue > 0 else 0
+            "days": int(days or 0)
+        }
 
-    result = {
-        "data": sorted(categories_profit, key=lambda x: x["profit"], reverse=True),
-        "summary": {
+    def summary(totals):
+        total_revenue = sum(float(revenue or 0) for revenue, _ in totals)
+        total_cost = sum(float(cost or 0) for _, cost in totals)
+        overall_profit = total_revenue - total_cost
+        overall_margin = (overall_profit / total_revenue * 100) if total_revenue > 0 else 0
+        return {
             "total_revenue": round(total_revenue, 2),
             "total_cost": round(total_cost, 2),
             "total_profit": round(overall_profit, 2),
             "overall_margin_pct": round(overall_margin, 2),
         }
+
+    categories_profit = []
+
+    for row in rows:
+        entry = {"category": row.category, **profit(row.total_revenue, row.total_cost, row.days)}
+        if comparison:
+            previous = profit(row.prev_total_revenue, row.prev_total_cost, row.prev_days)
+            entry["previous"] = previous
+            entry["change"] = change(entry, previous)
+        categories_profit.append(entry)
+
+    result = {
+        "data": sorted(categories_profit, key=lambda x: x["profit"], reverse=True),
+        "summary": summary([(r.total_revenue, r.total_cost) for r in rows]),
     }
-    
+    if comparison:
+        previous_summary = summary([(r.prev_total_revenue, r.prev_total_cost) for r in rows])
+        result["summary"]["previous"] = previous_summary
+        result["summary"]["change"] = change(result["summary"], previous_summary)
+        result["compare"] = comparison.describe()
+
     await redis_client.set(cache_key, json.dumps(result),)
 
     return {
@@ -1020,29 +1493,26 @@ def get_kpi_analytics(
     """
     Get key performance indicators for the business.
     """
-    query = db.query(SalesFact)
-    
-    if country != "all":
-        query = query.filter(SalesFact.country == country)
-    
-    # Overall metrics
-    total_records = db.query(func.count(SalesFact.sku_id)).filter(
-        SalesFact.country == country if country != "all" else True
-    ).scalar()
-    
-    stockout_count = db.query(func.count()).filter(
-        SalesFact.stock_out_flag == True,
-        SalesFact.country == country if country != "all" else True
-    ).scalar()
-    
-    promo_sales = db.query(func.sum(SalesFact.net_sales)).filter(
-        SalesFact.promo_flag == True,
-        SalesFact.country == country if country != "all" else True
-    ).scalar()
-    
-    total_sales = db.query(func.sum(SalesFact.net_sales)).filter(
-        SalesFact.country == country if country != "all" else True
-    ).scalar()
+    # Overall metrics, all computed in one scan
+    if sales_cube.ready:
+        metrics = sales_cube.totals({
+            "total_records": ("count", None, None),
+            "stockout_count": ("count", None, ("stock_out_flag", True)),
+            "promo_sales": ("sum", "net_sales", ("promo_flag", True)),
+            "total_sales": ("sum", "net_sales", None),
+        }, country=country)
+    else:
+        metrics = run_metrics(db, [
+            Metric("total_records", "count", SalesFact.sku_id),
+            Metric("stockout_count", "count", where=SalesFact.stock_out_flag == True),
+            Metric("promo_sales", "sum", SalesFact.net_sales, SalesFact.promo_flag == True),
+            Metric("total_sales", "sum", SalesFact.net_sales),
+        ], sales_filters(country))
+
+    total_records = metrics["total_records"]
+    stockout_count = metrics["stockout_count"]
+    promo_sales = metrics["promo_sales"]
+    total_sales = metrics["total_sales"]
     
     return {
         "data": {
@@ -1054,11 +1524,132 @@ def get_kpi_analytics(
         }
     }
 
-GEMINI_API_KEY = os.getenv('GEMINI_API_KEY')
+# ==================== DASHBOARD BUNDLE ====================
+
+# Every panel takes (db, country, year, month); panels without a year/month
+# filter simply ignore them, as their standalone endpoints do.
+DASHBOARD_PANELS = {
+    "information": lambda db, country, year, month: get_information(db=db),
+    "net_sales_daily": lambda db, country, year, month: _query_net_sales_daily(db, country, year, month),
+    "net_sales_category": lambda db, country, year, month: get_net_sales_by_category(country=country, db=db, year=year, month=month),
+    "unit_sold_holiday_weekday": lambda db, country, year, month: get_unit_sold_statistics(country=country, db=db, year=year, month=month),
+    "unit_sold_promo": lambda db, country, year, month: get_units_sold_discount_scatter(country=country, db=db, year=year, month=month),
+    "net_sales_location": lambda db, country, year, month: _query_net_sales_by_location(db, country, year, month),
+    "analytics_kpi": lambda db, country, year, month: get_kpi_analytics(db=db, country=country),
+}
+
+# Kept below the engine's pool size so dashboard loads never starve other requests
+DASHBOARD_CONCURRENCY = int(os.getenv("DASHBOARD_CONCURRENCY", 4))
+# Shared by every dashboard request, so concurrent loads together hold at most
+# DASHBOARD_CONCURRENCY pooled connections
+dashboard_semaphore = asyncio.Semaphore(DASHBOARD_CONCURRENCY)
+
+def _run_dashboard_panel(name: str, country: str, year: str, month: str):
+    # Each panel gets its own pooled connection so panels can run in parallel
+    db = SessionLocal()
+    try:
+        return DASHBOARD_PANELS[name](db, country, year, month)
+    finally:
+        db.close()
+
+@app.get('/dashboard')
+async def get_dashboard(
+    country: str = Query("all", description="Filter by country"),
+    year: str = Query("all", description="Filter by year"),
+    month: str = Query("all", description="Filter by month"),
+    panels: str = Query(
+        ",".join(DASHBOARD_PANELS),
+        description="Comma-separated panel names, defaults to every panel"
+    ),
+):
+    """
+    Get several dashboard panels for one filter set in a single request.
+    Panels are computed concurrently, each on its own pooled connection.
+    """
+    names = list(dict.fromkeys(p.strip() for p in panels.split(",") if p.strip()))
+
+    unknown = [n for n in names if n not in DASHBOARD_PANELS]
+    if unknown:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown panels: {', '.join(unknown)}. Available: {', '.join(DASHBOARD_PANELS)}"
+        )
+
+    cache_key = f"dashboard:{country}:{year}:{month}:{','.join(sorted(names))}"
+
+    cached = await redis_client.get(cache_key)
+    if cached:
+        cached_data = json.loads(cached)
+        return {
+            "source": "redis",
+            **cached_data
+        }
+
+    async def run_panel(name: str):
+        async with dashboard_semaphore:
+            return await run_in_threadpool(_run_dashboard_panel, name, country, year, month)
+
+    payloads = await asyncio.gather(*(run_panel(n) for n in names))
+
+    result = {
+        "filters": {"country": country, "year": year, "month": month},
+        "panels": dict(zip(names, payloads)),
+    }
+
+    await redis_client.set(
+        cache_key,
+        json.dumps(result, default=str),
+    )
+
+    return {
+        "source": "db",
+        **result
+    }
+
+# Suggestions are cached per identical forecast payload
+SUGGESTION_CACHE_TTL = int(os.getenv("SUGGESTION_CACHE_TTL", 24 * 3600))
+
+async def _suggestion_response(kind: str, request: dict, prompt: list, llm: GeminiClient, stream: bool):
+    cache_key = f"suggestion:{kind}:{content_hash(request)}"
+    cached = await redis_client.get(cache_key)
+
+    if stream:
+        async def events():
+            try:
+                if cached:
+                    yield sse_event({"text": cached})
+                else:
+                    parts = []
+                    async for chunk in llm.stream(prompt):
+                        parts.append(chunk)
+                        yield sse_event({"text": chunk})
+                    await redis_client.set(cache_key, "".join(parts), ex=SUGGESTION_CACHE_TTL)
+                yield sse_event({"source": "redis" if cached else "llm"}, event="done")
+            except Exception as e:
+                yield sse_event({"message": str(e)}, event="error")
+
+        return StreamingResponse(events(), media_type="text/event-stream", headers=SSE_HEADERS)
+
+    if cached:
+        return {
+            "type": "text",
+            "message": cached,
+            "source": "redis",
+        }
+
+    message = await llm.generate(prompt)
+    await redis_client.set(cache_key, message, ex=SUGGESTION_CACHE_TTL)
+    return {
+        "type": "text",
+        "message": message,
+        "source": "llm",
+    }
 
 @app.post("/suggestion/sales_demand")
-async def suggestion(
-    request: dict
+async def suggestion_sales_demand(
+    request: dict,
+    stream: bool = Query(False, description="Stream the suggestion as server-sent events"),
+    llm: GeminiClient = Depends(get_llm),
 ):
     data = request.get("forecast_data", "")
     daily_demand_str = "\n".join(
@@ -1100,20 +1691,13 @@ async def suggestion(
             }
         ]
 
-    client = genai.Client(api_key=GEMINI_API_KEY)
-
-    response = client.models.generate_content(
-        model="gemini-2.5-flash", 
-        contents=prompt
-    )
-    return {
-        "type": "text",
-        "message": response.text
-    }
+    return await _suggestion_response("sales_demand", request, prompt, llm, stream)
 
 @app.post("/suggestion/lead_time")
-async def suggestion(
-    request: dict
+async def suggestion_lead_time(
+    request: dict,
+    stream: bool = Query(False, description="Stream the suggestion as server-sent events"),
+    llm: GeminiClient = Depends(get_llm),
 ):
     data = request.get("forecast_data", "")
     daily_lead_time_str = "\n".join(
@@ -1156,16 +1740,7 @@ async def suggestion(
             }
         ]
 
-    client = genai.Client(api_key=GEMINI_API_KEY)
-
-    response = client.models.generate_content(
-        model="gemini-2.5-flash", 
-        contents=prompt
-    )
-    return {
-        "type": "text",
-        "message": response.text
-    }
+    return await _suggestion_response("lead_time", request, prompt, llm, stream)
 
 def validate_sql(sql: str):
     if not sql:
@@ -1178,9 +1753,12 @@ def validate_sql(sql: str):
 
     lower = sql.lower()
 
-    if not lower.startswith("select"):
+    if not lower.startswith("select") and not lower.startswith("with"):
         raise ValueError("Only SELECT queries are allowed")
 
+    if ";" in sql:
+        raise ValueError("Only one statement is allowed")
+
     forbidden = ["insert", "update", "delete", "drop"]
     if any(k in lower for k in forbidden):
         raise ValueError("Unsafe SQL detected")
@@ -1192,11 +1770,36 @@ def validate_sql(sql: str):
     return sql
 
 @app.post("/chatbot")
-def chatbot(
+async def chatbot(
     request: dict,
-    db: Session = Depends(get_db)
+    # Read-only, size-limited pool with a statement timeout (see utils/db.py)
+    db: Session = Depends(get_chatbot_db),
+    llm: GeminiClient = Depends(get_llm),
+    stream: bool = Query(False, description="Stream the answer as server-sent events"),
 ):
     message = request.get("message", "")
+    question = normalize_question(message)
+    version = await data_version(redis_client)
+
+    # Repeat question on unchanged data: no LLM call at all
+    cached_answer = await get_answer(redis_client, version, question)
+    if cached_answer and stream:
+        async def cached_events():
+            yield sse_event({k: v for k, v in cached_answer.items() if k != "answer"}, event="meta")
+            yield sse_event({"text": cached_answer["answer"]})
+            yield sse_event({"source": "redis"}, event="done")
+
+        return StreamingResponse(cached_events(), media_type="text/event-stream", headers=SSE_HEADERS)
+    if cached_answer:
+        return {
+            "code": "success",
+            "message": "Chat successful!",
+            "source": "redis",
+            "data": cached_answer,
+        }
+
+    # Same or similar question asked before: reuse its validated SQL
+    query, sql_match = await find_sql(redis_client, question)
 
     prompt = f"""
     You are a smart and friendly Sales Demand Consulting Assistant of the DOM Team. 
@@ -1271,55 +1874,77 @@ def chatbot(
     {message}
     """
 
-    client = genai.Client(api_key=GEMINI_API_KEY)
-    response = client.models.generate_content(
-        model="gemini-2.5-flash", 
-        contents=[
+    if query is None:
+        raw_sql = await llm.generate([
             {
                 "role": "user",
                 "parts": [
                     {"text": prompt}
                 ]
             }
-        ]
-    )
+        ])
+        query = (
+            raw_sql
+            .replace("```sql", "")
+            .replace("```", "")
+            .strip()
+        )
+        try:
+            query = validate_sql(query)
+        except Exception as e:
+            return {
+                "code": "error",
+                "message": f"Invalid SQL generated: {str(e)}",
+                "raw_sql": raw_sql
+            }
 
-    raw_sql = response.text or ""
-    query = (
-        raw_sql
-        .replace("```sql", "")
-        .replace("```", "")
-        .strip()
-    )
-    try:
-        query = validate_sql(query)
-    except Exception as e:
-        return {
-            "code": "error",
-            "message": f"Invalid SQL generated: {str(e)}",
-            "raw_sql": raw_sql
-        }
-    
-    try:
-        rows = db.execute(text(query)).fetchall()
-        result = [dict(row._mapping) for row in rows]
-    except Exception as e:
-        return {
-            "code": "error",
-            "message": "SQL execution failed",
-            "query": query,
-            "error": str(e)
-        }
+    # Results are cached per data version; the key is also the client's handle
+    # for paging the full result through /chatbot/result/{handle}
+    handle = result_handle(version, query)
+    result = await get_result(redis_client, handle)
+    result_cached = result is not None
+
+    if result is None:
+        try:
+            result = jsonable(await run_in_threadpool(run_guarded, db, query))
+        except QueryRejected as e:
+            return {
+                "code": "error",
+                "message": f"Query rejected: {str(e)}",
+                "query": query,
+            }
+        except SQLAlchemyTimeoutError:
+            return {
+                "code": "error",
+                "message": "The assistant is busy, please try again shortly",
+                "query": query,
+            }
+        except Exception as e:
+            return {
+                "code": "error",
+                "message": "SQL execution failed",
+                "query": query,
+                "error": str(e)
+            }
+
+    # Only SQL that validated and ran is offered to later questions
+    if sql_match is None:
+        await remember_sql(redis_client, question, query)
+
+    # The LLM only sees a bounded digest of the result
+    digest = digest_result(result)
     
     answer_prompt = f"""
     You are a smart and friendly Sales Demand Consulting Assistant of the DOM Team. 
     You are a senior data analyst.
     Based on the following SQL query result, provide a concise answer to the user's question.
+    The result is given as JSON. When "truncated" is true it is a summary of {digest["row_count"]} rows:
+    per-column statistics, the top rows by the main measure and totals per group.
     Do not repeat the SQL or the result back to the user.
     SQL Query:  
     {query}
     SQL Result:
-    {result}
+    {json.dumps(digest)}
     User Question:
     {message}
     Provide a concise answer in less than 200 words.
@@ -1329,24 +1954,78 @@ def chatbot(
     Do not use any markdown formatting.
     """
 
-    answer_response = client.models.generate_content(
-        model="gemini-2.5-flash",
-        contents=[
-            {
-                "role": "user",
-                "parts": [
-                    {"text": answer_prompt}
-                ]
-            }
-        ]
-    )
+    answer_contents = [
+        {
+            "role": "user",
+            "parts": [
+                {"text": answer_prompt}
+            ]
+        }
+    ]
+    meta = {
+        "query": query,
+        "result": {
+            "handle": handle,
+            "row_count": len(result),
+            "truncated": digest.get("truncated", False),
+        },
+        "cache": {
+            "sql": sql_match,
+            "result": result_cached,
+        },
+    }
+
+    async def store(answer: str):
+        await set_answer(redis_client, version, question, {"answer": answer, **meta})
+        # Written after the answer so the result never expires before it
+        await set_result(redis_client, handle, result)
+
+    if stream:
+        async def events():
+            yield sse_event(meta, event="meta")
+            try:
+                parts = []
+                async for chunk in llm.stream(answer_contents):
+                    parts.append(chunk)
+                    yield sse_event({"text": chunk})
+                await store("".join(parts))
+                yield sse_event({"source": "db"}, event="done")
+            except Exception as e:
+                yield sse_event({"message": str(e)}, event="error")
+
+        return StreamingResponse(events(), media_type="text/event-stream", headers=SSE_HEADERS)
+
+    answer = await llm.generate(answer_contents)
+    data = {"answer": answer, **meta}
+    await store(answer)
 
     return {
         "code": "success",
         "message": "Chat successful!",
-        "data": {
-            "answer": answer_response.text,
-            "query": query,
+        "source": "db",
+        "data": data,
+    }
+
+@app.get("/chatbot/result/{handle}")
+async def get_chatbot_result(
+    handle: str,
+    page: int = Query(1, ge=1),
+    limit: int = Query(100, ge=1, le=1000),
+):
+    """Page through the full SQL result behind a chatbot answer."""
+    rows = await get_result(redis_client, handle)
+    if rows is None:
+        raise HTTPException(status_code=404, detail="Result not found or expired")
+
+    total_count = len(rows)
+    return {
+        "code": "success",
+        "data": rows[(page - 1) * limit:page * limit],
+        "pagination": {
+            "page": page,
+            "limit": limit,
+            "total_count": total_count,
+            "total_pages": (total_count + limit - 1) // limit,
         }
     }
 
@@ -1355,7 +2034,7 @@ def chatbot(
 @app.get('/channel/list')
 def get_channel_list(db: Session = Depends(get_db)):
     """Get all available sales channels."""
-    channels = db.query(SalesFact.channel).distinct().all()
+    channels = db.query(DimStore.channel).distinct().order_by(DimStore.channel).all()
     result = [c[0] for c in channels if c[0] is not None]
     return {"data": result}
 
@@ -1365,9 +2044,18 @@ async def get_channel_analytics(
     country: str = Query("all", description="Filter by country"),
     year: str = Query("all", description="Filter by year"),
     month: str = Query("all", description="Filter by month"),
+    compare: str = Query("none", pattern=COMPARE_PATTERN, description="Also compute prev_period or prev_year, with deltas and growth rates"),
 ):
-    """Get detailed channel performance analytics."""
-    cache_key = f"channel_analytics:{country}:{year}:{month}"
+    """
+    Get detailed channel performance analytics. With compare, both periods
+    are aggregated in the same pass.
+    """
+    try:
+        comparison = period_comparison(year, month, compare)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    cache_key = f"channel_analytics:{country}:{year}:{month}:{compare}"
 
     cached = await redis_client.get(cache_key)
     if cached:
@@ -1377,48 +2065,61 @@ async def get_channel_analytics(
             **cached_data
         }
 
-    query = db.query(
-        SalesFact.channel,
-        func.sum(SalesFact.net_sales).label("total_sales"),
-        func.sum(SalesFact.units_sold).label("total_units"),
-        func.count(func.distinct(SalesFact.store_id)).label("store_count"),
-        func.count(func.distinct(SalesFact.sku_id)).label("product_count"),
-        func.avg(SalesFact.discount_pct).label("avg_discount"),
-        func.sum(case((SalesFact.promo_flag == True, literal(1)), else_=literal(0))).label("promo_transactions"),
-        func.sum(case((SalesFact.stock_out_flag == True, literal(1)), else_=literal(0))).label("stockout_count"),
-    )
-    
-    if country != "all":
-        query = query.filter(SalesFact.country == country)
-    if year != "all":
-        query = query.filter(func.extract("year", SalesFact.date) == int(year))
-    if month != "all":
-        query = query.filter(func.extract("month", SalesFact.date) == int(month))
-    
+    aggregates = {
+        "total_sales": func.sum(SalesFact.net_sales),
+        "total_units": func.sum(SalesFact.units_sold),
+        "store_count": func.count(func.distinct(SalesFact.store_id)),
+        "product_count": func.count(func.distinct(SalesFact.sku_id)),
+        "avg_discount": func.avg(SalesFact.discount_pct),
+        "promo_transactions": func.sum(case((SalesFact.promo_flag == True, literal(1)), else_=literal(0))),
+        "stockout_count": func.sum(case((SalesFact.stock_out_flag == True, literal(1)), else_=literal(0))),
+    }
+
+    if comparison:
+        query = db.query(SalesFact.channel, *comparison.split(aggregates))
+        query = query.filter(*sales_filters(country), comparison.where())
+    else:
+        query = db.query(SalesFact.channel, *[a.label(n) for n, a in aggregates.items()])
+        query = query.filter(*sales_filters(country, year, month))
+
     rows = query.group_by(SalesFact.channel).all()
-    
-    total_sales = sum(float(r.total_sales or 0) for r in rows)
-    
-    result = {
-        "data": [
+
+    def channel_stats(rows, prefix=""):
+        values = [{n: getattr(r, prefix + n) for n in aggregates} for r in rows]
+        total_sales = sum(float(v["total_sales"] or 0) for v in values)
+        data = [
             {
-                "channel": r.channel,
-                "sales": float(r.total_sales or 0),
-                "units": int(r.total_units or 0),
-                "stores": int(r.store_count or 0),
-                "products": int(r.product_count or 0),
-                "sales_pct": round((float(r.total_sales or 0) / total_sales * 100), 2) if total_sales > 0 else 0,
-                "avg_discount_pct": round(float(r.avg_discount or 0), 2),
-                "promo_transactions": int(r.promo_transactions or 0),
-                "stockout_count": int(r.stockout_count or 0),
+                "sales": float(v["total_sales"] or 0),
+                "units": int(v["total_units"] or 0),
+                "stores": int(v["store_count"] or 0),
+                "products": int(v["product_count"] or 0),
+                "sales_pct": round((float(v["total_sales"] or 0) / total_sales * 100), 2) if total_sales > 0 else 0,
+                "avg_discount_pct": round(float(v["avg_discount"] or 0), 2),
+                "promo_transactions": int(v["promo_transactions"] or 0),
+                "stockout_count": int(v["stockout_count"] or 0),
             }
-            for r in rows
-        ],
-        "summary": {
+            for v in values
+        ]
+        summary = {
             "total_sales": round(total_sales, 2),
-            "channels_count": len(rows)
+            # Channels with sales in the period
+            "channels_count": sum(1 for v in values if v["total_units"] is not None),
         }
+        return data, summary
+
+    data, summary = channel_stats(rows)
+    result = {
+        "data": [{"channel": r.channel, **d} for r, d in zip(rows, data)],
+        "summary": summary,
     }
+    if comparison:
+        previous_data, previous_summary = channel_stats(rows, "prev_")
+        for entry, previous in zip(result["data"], previous_data):
+            entry["previous"] = previous
+            entry["change"] = change(entry, previous)
+        summary["previous"] = previous_summary
+        summary["change"] = change(summary, previous_summary)
+        result["compare"] = comparison.describe()
 
     await redis_client.set(
         cache_key,
@@ -1438,16 +2139,13 @@ async def get_channel_daily_sales(
     channel: str = Query("all", description="Filter by channel"),
     year: str = Query("all", description="Filter by year"),
     month: str = Query("all", description="Filter by month"),
+    format: str = Query("rows", pattern=SERIES_FORMAT_PATTERN, description="rows, or columnar for one array per field"),
 ):
     """Get daily sales trend by channel."""
-    cache_key = f"channel_daily_sales:{country}:{channel}:{year}:{month}"
-    cached = await redis_client.get(cache_key)
+    cache_key = f"channel_daily_sales:{country}:{channel}:{year}:{month}:{format}"
+    cached = await cached_json(redis_client, cache_key)
     if cached:
-        cached_data = json.loads(cached)
-        return {
-            "source": "redis",
-            **cached_data
-        }
+        return cached
 
     query = db.query(
         SalesFact.date,
@@ -1467,28 +2165,21 @@ async def get_channel_daily_sales(
     
     rows = query.group_by(SalesFact.date, SalesFact.channel).order_by(SalesFact.date).all()
     
+    data = [
+        {
+            "date": r.date,
+            "channel": r.channel,
+            "sales": float(r.sales or 0),
+            "units": int(r.units or 0),
+        }
+        for r in rows
+    ]
+
     result = {
-        "data": [
-            {
-                "date": r.date,
-                "channel": r.channel,
-                "sales": float(r.sales or 0),
-                "units": int(r.units or 0),
-            }
-            for r in rows
-        ]
+        "data": columnar(data, ["date", "channel", "sales", "units"]) if format == "columnar" else data
     }
 
-    await redis_client.set(
-        cache_key,
-        json.dumps(result, default=str),
-    
-    )
-
-    return {
-        "source": "db",
-        **result
-    }
+    return await cache_json(redis_client, cache_key, result)
 
 # ==================== PRICE & DISCOUNT ANALYTICS ====================
 
@@ -1498,9 +2189,18 @@ async def get_pricing_analytics(
     country: str = Query("all", description="Filter by country"),
     year: str = Query("all", description="Filter by year"),
     month: str = Query("all", description="Filter by month"),
+    compare: str = Query("none", pattern=COMPARE_PATTERN, description="Also compute prev_period or prev_year, with deltas and growth rates"),
 ):
-    """Get pricing and discount effectiveness analysis."""
-    cache_key = f"pricing_analytics:{country}:{year}:{month}"
+    """
+    Get pricing and discount effectiveness analysis. With compare, both
+    periods are aggregated in the same pass.
+    """
+    try:
+        comparison = period_comparison(year, month, compare)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    cache_key = f"pricing_analytics:{country}:{year}:{month}:{compare}"
     cached = await redis_client.get(cache_key)
     if cached:
         cached_data = json.loads(cached)
@@ -1509,39 +2209,44 @@ async def get_pricing_analytics(
             **cached_data
         }
 
-    query = db.query(
-        SalesFact.category,
-        func.avg(SalesFact.list_price).label("avg_list_price"),
-        func.avg(SalesFact.discount_pct).label("avg_discount_pct"),
-        func.sum(SalesFact.net_sales).label("total_sales"),
-        func.sum(SalesFact.gross_sales).label("total_gross_sales"),
-        func.sum(SalesFact.units_sold).label("total_units"),
-        func.avg(SalesFact.margin_pct).label("avg_margin_pct"),
-    )
-    
-    if country != "all":
-        query = query.filter(SalesFact.country == country)
-    if year != "all":
-        query = query.filter(func.extract("year", SalesFact.date) == int(year))
-    if month != "all":
-        query = query.filter(func.extract("month", SalesFact.date) == int(month))
-    
+    aggregates = {
+        "avg_list_price": func.avg(SalesFact.list_price),
+        "avg_discount_pct": func.avg(SalesFact.discount_pct),
+        "total_sales": func.sum(SalesFact.net_sales),
+        "total_gross_sales": func.sum(SalesFact.gross_sales),
+        "total_units": func.sum(SalesFact.units_sold),
+        "avg_margin_pct": func.avg(SalesFact.margin_pct),
+    }
+
+    if comparison:
+        query = db.query(SalesFact.category, *comparison.split(aggregates))
+        query = query.filter(*sales_filters(country), comparison.where())
+    else:
+        query = db.query(SalesFact.category, *[a.label(n) for n, a in aggregates.items()])
+        query = query.filter(*sales_filters(country, year, month))
+
     rows = query.group_by(SalesFact.category).all()
-    
+
+    def pricing(r, prefix=""):
+        v = {n: getattr(r, prefix + n) for n in aggregates}
+        return {
+            "avg_list_price": round(float(v["avg_list_price"] or 0), 2),
+            "avg_discount_pct": round(float(v["avg_discount_pct"] or 0), 2),
+            "price_realization": round((float(v["total_sales"] or 0) / float(v["total_gross_sales"] or 1)), 4),
+            "total_sales": round(float(v["total_sales"] or 0), 2),
+            "total_units": int(v["total_units"] or 0),
+            "avg_margin_pct": round(float(v["avg_margin_pct"] or 0), 2),
+        }
+
     result = {
-        "data": [
-            {
-                "category": r.category,
-                "avg_list_price": round(float(r.avg_list_price or 0), 2),
-                "avg_discount_pct": round(float(r.avg_discount_pct or 0), 2),
-                "price_realization": round((float(r.total_sales or 0) / float(r.total_gross_sales or 1)), 4),
-                "total_sales": round(float(r.total_sales or 0), 2),
-                "total_units": int(r.total_units or 0),
-                "avg_margin_pct": round(float(r.avg_margin_pct or 0), 2),
-            }
-            for r in rows
-        ]
+        "data": [{"category": r.category, **pricing(r)} for r in rows]
     }
+    if comparison:
+        for r, entry in zip(rows, result["data"]):
+            previous = pricing(r, "prev_")
+            entry["previous"] = previous
+            entry["change"] = change(entry, previous)
+        result["compare"] = comparison.describe()
 
     await redis_client.set(
         cache_key,
@@ -1570,22 +2275,37 @@ async def get_discount_impact(
             **cached_data
         }
     # Compare discounted vs non-discounted sales
-    query = db.query(
-        SalesFact.category,
-        func.sum(case((SalesFact.discount_pct > 0, SalesFact.units_sold), else_=0)).label("units_discounted"),
-        func.sum(case((SalesFact.discount_pct > 0, SalesFact.net_sales), else_=0)).label("sales_discounted"),
-        func.sum(case((SalesFact.discount_pct == 0, SalesFact.units_sold), else_=0)).label("units_no_discount"),
-        func.sum(case((SalesFact.discount_pct == 0, SalesFact.net_sales), else_=0)).label("sales_no_discount"),
-        func.count(case((SalesFact.discount_pct > 0, 1))).label("transaction_count_discounted"),
-        func.count(case((SalesFact.discount_pct == 0, 1))).label("transaction_count_no_discount"),
-    )
+    if parquet_snapshot.is_fresh(db):
+        where, params = olap_filters(country, year)
+        # DuckDB scans block; keep them off the event loop
+        rows = await run_in_threadpool(parquet_snapshot.query, f"""
+            SELECT category,
+                   SUM(CASE WHEN discount_pct > 0 THEN units_sold ELSE 0 END) AS units_discounted,
+                   SUM(CASE WHEN discount_pct > 0 THEN net_sales ELSE 0 END) AS sales_discounted,
+                   SUM(CASE WHEN discount_pct = 0 THEN units_sold ELSE 0 END) AS units_no_discount,
+                   SUM(CASE WHEN discount_pct = 0 THEN net_sales ELSE 0 END) AS sales_no_discount,
+                   COUNT(CASE WHEN discount_pct > 0 THEN 1 END) AS transaction_count_discounted,
+                   COUNT(CASE WHEN discount_pct = 0 THEN 1 END) AS transaction_count_no_discount
+            FROM sales_fact WHERE {where}
+            GROUP BY category
+        """, params)
+    else:
+        query = db.query(
+            SalesFact.category,
+            func.sum(case((SalesFact.discount_pct > 0, SalesFact.units_sold), else_=0)).label("units_discounted"),
+            func.sum(case((SalesFact.discount_pct > 0, SalesFact.net_sales), else_=0)).label("sales_discounted"),
+            func.sum(case((SalesFact.discount_pct == 0, SalesFact.units_sold), else_=0)).label("units_no_discount"),
+            func.sum(case((SalesFact.discount_pct == 0, SalesFact.net_sales), else_=0)).label("sales_no_discount"),
+            func.count(case((SalesFact.discount_pct > 0, 1))).label("transaction_count_discounted"),
+            func.count(case((SalesFact.discount_pct == 0, 1))).label("transaction_count_no_discount"),
+        )
     
-    if country != "all":
-        query = query.filter(SalesFact.country == country)
-    if year != "all":
-        query = query.filter(func.extract("year", SalesFact.date) == int(year))
+        if country != "all":
+            query = query.filter(SalesFact.country == country)
+        if year != "all":
+            query = query.filter(func.extract("year", SalesFact.date) == int(year))
     
-    rows = query.group_by(SalesFact.category).all()
+        rows = query.group_by(SalesFact.category).all()
     
     result = {
         "data": [
@@ -1619,7 +2339,7 @@ async def get_discount_impact(
 @app.get('/supplier/list')
 def get_supplier_list(db: Session = Depends(get_db)):
     """Get all suppliers."""
-    suppliers = db.query(SalesFact.supplier_id).distinct().all()
+    suppliers = db.query(DimSupplier.supplier_id).order_by(DimSupplier.supplier_id).all()
     result = [s[0] for s in suppliers if s[0] is not None]
     return {"data": result}
 
@@ -1639,22 +2359,36 @@ async def get_supplier_performance(
             **cached_data
         }
 
-    query = db.query(
-        SalesFact.supplier_id,
-        func.count(func.distinct(SalesFact.sku_id)).label("products_supplied"),
-        func.sum(SalesFact.units_sold).label("total_units"),
-        func.sum(SalesFact.purchase_cost * SalesFact.units_sold).label("total_cost"),
-        func.sum(SalesFact.net_sales).label("total_sales"),
-        func.avg(SalesFact.lead_time_days).label("avg_lead_time"),
-        func.avg(SalesFact.margin_pct).label("avg_margin_pct"),
-    )
+    if parquet_snapshot.is_fresh(db):
+        where, params = olap_filters(country, year)
+        rows = await run_in_threadpool(parquet_snapshot.query, f"""
+            SELECT supplier_id,
+                   COUNT(DISTINCT sku_id) AS products_supplied,
+                   SUM(units_sold) AS total_units,
+                   SUM(purchase_cost * units_sold) AS total_cost,
+                   SUM(net_sales) AS total_sales,
+                   AVG(lead_time_days) AS avg_lead_time,
+                   AVG(margin_pct) AS avg_margin_pct
+            FROM sales_fact WHERE {where}
+            GROUP BY supplier_id
+        """, params)
+    else:
+        query = db.query(
+            SalesFact.supplier_id,
+            func.count(func.distinct(SalesFact.sku_id)).label("products_supplied"),
+            func.sum(SalesFact.units_sold).label("total_units"),
+            func.sum(SalesFact.purchase_cost * SalesFact.units_sold).label("total_cost"),
+            func.sum(SalesFact.net_sales).label("total_sales"),
+            func.avg(SalesFact.lead_time_days).label("avg_lead_time"),
+            func.avg(SalesFact.margin_pct).label("avg_margin_pct"),
+        )
     
-    if country != "all":
-        query = query.filter(SalesFact.country == country)
-    if year != "all":
-        query = query.filter(func.extract("year", SalesFact.date) == int(year))
+        if country != "all":
+            query = query.filter(SalesFact.country == country)
+        if year != "all":
+            query = query.filter(func.extract("year", SalesFact.date) == int(year))
     
-    rows = query.group_by(SalesFact.supplier_id).all()
+        rows = query.group_by(SalesFact.supplier_id).all()
     
     result = {
         "data": [
@@ -1692,16 +2426,13 @@ async def get_weather_correlation(
     country: str = Query("all", description="Filter by country"),
     year: str = Query("all", description="Filter by year"),
     month: str = Query("all", description="Filter by month"),
+    format: str = Query("rows", pattern=SERIES_FORMAT_PATTERN, description="rows, or columnar for one array per field"),
 ):
     """Analyze correlation between weather and sales."""
-    cache_key = f"weather_correlation:{country}:{year}:{month}"
-    cached = await redis_client.get(cache_key)
+    cache_key = f"weather_correlation:{country}:{year}:{month}:{format}"
+    cached = await cached_json(redis_client, cache_key)
     if cached:
-        cached_data = json.loads(cached)
-        return {
-            "source": "redis",
-            **cached_data
-        }
+        return cached
 
     query = db.query(
         SalesFact.date,
@@ -1720,29 +2451,22 @@ async def get_weather_correlation(
     
     rows = query.group_by(SalesFact.date).order_by(SalesFact.date).all()
     
+    data = [
+        {
+            "date": r.date,
+            "temperature": round(float(r.avg_temp or 0), 1),
+            "rain_mm": round(float(r.total_rain or 0), 2),
+            "units_sold": int(r.units_sold or 0),
+            "sales": round(float(r.net_sales or 0), 2),
+        }
+        for r in rows
+    ]
+
     result = {
-        "data": [
-            {
-                "date": r.date,
-                "temperature": round(float(r.avg_temp or 0), 1),
-                "rain_mm": round(float(r.total_rain or 0), 2),
-                "units_sold": int(r.units_sold or 0),
-                "sales": round(float(r.net_sales or 0), 2),
-            }
-            for r in rows
-        ]
+        "data": columnar(data, ["date", "temperature", "rain_mm", "units_sold", "sales"]) if format == "columnar" else data
     }
 
-    await redis_client.set(
-        cache_key,
-        json.dumps(result, default=str),
-    
-    )
-
-    return {
-        "source": "db",
-        **result
-    }
+    return await cache_json(redis_client, cache_key, result)
 
 @app.get('/analytics/weather-by-category')
 async def get_weather_category_analysis(
@@ -1760,26 +2484,43 @@ async def get_weather_category_analysis(
             **cached_data
         }
 
-    # Segment by temperature ranges
-    query = db.query(
-        SalesFact.category,
-        case(
-            (SalesFact.temperature < 10, "Cold (<10°C)"),
-            (SalesFact.temperature < 20, "Cool (10-20°C)"),
-            (SalesFact.temperature < 30, "Warm (20-30°C)"),
-            else_="Hot (>30°C)"
-        ).label("temp_segment"),
-        func.sum(SalesFact.units_sold).label("units"),
-        func.sum(SalesFact.net_sales).label("sales"),
-        func.count().label("record_count"),
-    )
+    if parquet_snapshot.is_fresh(db):
+        where, params = olap_filters(country, year)
+        rows = await run_in_threadpool(parquet_snapshot.query, f"""
+            SELECT category,
+                   CASE
+                       WHEN temperature < 10 THEN 'Cold (<10°C)'
+                       WHEN temperature < 20 THEN 'Cool (10-20°C)'
+                       WHEN temperature < 30 THEN 'Warm (20-30°C)'
+                       ELSE 'Hot (>30°C)'
+                   END AS temp_segment,
+                   SUM(units_sold) AS units,
+                   SUM(net_sales) AS sales,
+                   COUNT(*) AS record_count
+            FROM sales_fact WHERE {where}
+            GROUP BY category, temp_segment
+        """, params)
+    else:
+        # Segment by temperature ranges
+        query = db.query(
+            SalesFact.category,
+            case(
+                (SalesFact.temperature < 10, "Cold (<10°C)"),
+                (SalesFact.temperature < 20, "Cool (10-20°C)"),
+                (SalesFact.temperature < 30, "Warm (20-30°C)"),
+                else_="Hot (>30°C)"
+            ).label("temp_segment"),
+            func.sum(SalesFact.units_sold).label("units"),
+            func.sum(SalesFact.net_sales).label("sales"),
+            func.count().label("record_count"),
+        )
     
-    if country != "all":
-        query = query.filter(SalesFact.country == country)
-    if year != "all":
-        query = query.filter(func.extract("year", SalesFact.date) == int(year))
+        if country != "all":
+            query = query.filter(SalesFact.country == country)
+        if year != "all":
+            query = query.filter(func.extract("year", SalesFact.date) == int(year))
     
-    rows = query.group_by(SalesFact.category, "temp_segment").all()
+        rows = query.group_by(SalesFact.category, "temp_segment").all()
     
     result = {
         "data": [
@@ -1805,6 +2546,44 @@ async def get_weather_category_analysis(
         **result
     }
 
+@app.get('/analytics/weather-stats')
+async def get_weather_statistics(
+    db: Session = Depends(get_db),
+    country: str = Query("all", description="Filter by country"),
+    year: str = Query("all", description="Filter by year"),
+    month: str = Query("all", description="Filter by month"),
+    max_lag: int = Query(7, ge=0, le=30, description="Largest lag in days for the lagged correlations"),
+    bins: int = Query(0, ge=0, le=100, description="Bins of the optional weather/sales scatter, 0 for none"),
+):
+    """
+    Pearson and Spearman correlations of daily units and sales with
+    temperature and rain, lagged correlations, and sales elasticity to the
+    weather by category and country, computed on the server from one
+    (date, country, category) aggregate of the filtered rows.
+    """
+    cache_key = f"weather_stats:{country}:{year}:{month}:{max_lag}:{bins}"
+    cached = await cached_json(redis_client, cache_key)
+    if cached:
+        return cached
+
+    rows = db.query(
+        SalesFact.date,
+        SalesFact.country,
+        SalesFact.category,
+        func.sum(SalesFact.temperature),
+        func.count(SalesFact.temperature),
+        func.sum(SalesFact.rain_mm),
+        func.count(SalesFact.rain_mm),
+        func.sum(SalesFact.units_sold),
+        func.sum(SalesFact.net_sales),
+    ).filter(
+        *sales_filters(country, year, month)
+    ).group_by(SalesFact.date, SalesFact.country, SalesFact.category).all()
+
+    result = await run_in_threadpool(weather_statistics, rows, max_lag, bins)
+
+    return await cache_json(redis_client, cache_key, result)
+
 # ==================== INVENTORY OPTIMIZATION ====================
 
 @app.get('/analytics/inventory-optimization')
@@ -1813,8 +2592,17 @@ async def get_inventory_optimization(
     country: str = Query("all", description="Filter by country"),
     year: str = Query("all", description="Filter by year"),
 ):
-    """Get inventory optimization metrics and recommendations."""
-    cache_key = f"inventory_optimization:{country}:{year}"
+    """Get inventory optimization metrics and recommendations for every SKU-store."""
+    run = latest_alert_run(db)
+    if run is None:
+        # The first run is still being computed at startup; not cached
+        return {
+            "source": "db",
+            "data": [],
+            "summary": {"high_priority_count": 0, "medium_priority_count": 0, "optimal_count": 0},
+        }
+
+    cache_key = f"inventory_optimization:{run.run_id}:{country}:{year}"
     cached = await redis_client.get(cache_key)
     if cached:
         cached_data = json.loads(cached)
@@ -1823,76 +2611,34 @@ async def get_inventory_optimization(
             **cached_data
         }
 
-    # Get latest inventory status for each SKU-Store
-    latest_records = db.query(
-        SalesFact.sku_id,
-        SalesFact.store_id,
-        func.max(SalesFact.date).label("latest_date")
-    ).group_by(SalesFact.sku_id, SalesFact.store_id).subquery()
-    
-    query = db.query(
-        SalesFact.sku_id,
-        SalesFact.sku_name,
-        SalesFact.store_id,
-        SalesFact.stock_on_hand,
-        SalesFact.stock_opening,
-        SalesFact.lead_time_days,
-        func.avg(SalesFact.units_sold).label("avg_daily_sales"),
-        func.sum(SalesFact.units_sold).label("total_units_sold"),
-    ).join(
-        latest_records,
-        (SalesFact.sku_id == latest_records.c.sku_id) &
-        (SalesFact.store_id == latest_records.c.store_id) &
-        (SalesFact.date == latest_records.c.latest_date)
-    )
+    # Projections for each SKU-Store, computed per alert run
+    query = db.query(StockAlert).filter(StockAlert.run_id == run.run_id)
     
     if country != "all":
-        query = query.filter(SalesFact.country == country)
+        query = query.filter(StockAlert.country == country)
     if year != "all":
-        query = query.filter(func.extract("year", SalesFact.date) == int(year))
+        query = query.filter(func.extract("year", StockAlert.last_date) == int(year))
     
-    rows = query.group_by(
-        SalesFact.sku_id, SalesFact.sku_name, SalesFact.store_id,
-        SalesFact.stock_on_hand, SalesFact.stock_opening, SalesFact.lead_time_days
-    ).limit(500).all()
+    rows = query.order_by(StockAlert.sku_id, StockAlert.store_id).all()
     
-    inventory_data = []
-    for row in rows:
-        avg_daily = float(row.avg_daily_sales or 1)
-        lead_time = float(row.lead_time_days or 7)
-        safety_stock = int(row.stock_opening or 0)
-        current_stock = int(row.stock_on_hand or 0)
-        
-        # Calculate reorder point = (avg_daily_sales * lead_time) + safety_stock
-        reorder_point = int((avg_daily * lead_time) + (safety_stock * 0.5))
-        
-        # Calculate days of stock
-        days_of_stock = current_stock / avg_daily if avg_daily > 0 else 0
-        
-        # Determine recommendation
-        if current_stock <= reorder_point:
-            recommendation = "Order Now"
-            priority = "High"
-        elif days_of_stock < lead_time * 1.5:
-            recommendation = "Plan Replenishment"
-            priority = "Medium"
-        else:
-            recommendation = "Optimal"
-            priority = "Low"
-        
-        inventory_data.append({
+    recommendations = {"High": "Order Now", "Medium": "Plan Replenishment", "Low": "Optimal"}
+    inventory_data = [
+        {
             "sku_id": row.sku_id,
             "sku_name": row.sku_name,
             "store_id": row.store_id,
-            "current_stock": current_stock,
-            "safety_stock": safety_stock,
-            "reorder_point": reorder_point,
-            "days_of_stock": round(days_of_stock, 1),
-            "avg_daily_sales": round(avg_daily, 1),
-            "lead_time_days": lead_time,
-            "recommendation": recommendation,
-            "priority": priority,
-        })
+            "current_stock": row.current_stock,
+            "safety_stock": row.safety_stock,
+            "reorder_point": row.reorder_point,
+            "order_qty": row.order_qty,
+            "days_of_stock": float(row.days_until_stockout) if row.days_until_stockout is not None else None,
+            "avg_daily_sales": float(row.avg_daily_demand),
+            "lead_time_days": float(row.lead_time_days),
+            "recommendation": recommendations[row.priority],
+            "priority": row.priority,
+        }
+        for row in rows
+    ]
     
     result = {
         "data": inventory_data,
@@ -1923,36 +2669,8 @@ MAX_DATE = datetime(2023, 12, 31).date()
 safety_stock = 2
 preview_days = 7
 
-@app.get("/sku/list")
-async def get_top_skus(
-    db: Session = Depends(get_db),
-    limit: int = Query(20, ge=1, le=100),
-    page: int = Query(1, ge=1),
-    date: str = Query(..., description="YYYY-MM-DD"),
-    store_id: str = Query("all", description="Filter by Store ID"),
-    city: str = Query("all", description="Filter by City")
-):
-    # --- Validate date ---
-    try:
-        target_date = datetime.strptime(date, "%Y-%m-%d").date()
-    except ValueError:
-        raise HTTPException(status_code=400, detail="Invalid date format")
-
-    if target_date > MAX_DATE or target_date < MIN_DATE:
-        return {
-            "code": "error",
-            "message": "Data is only available up to 2023-12-31",
-            "data": [],
-            "pagination": {"page": page, "limit": limit, "total_count": 0, "total_pages": 0}
-        }
-
-    # --- Redis cache ---
-    cache_key = f"list_skus:{limit}:{page}:{date}:{store_id}:{city}"
-    cached = await redis_client.get(cache_key)
-    if cached:
-        return {"source": "redis", **json.loads(cached)}
-
-    # --- Lấy tổng units_sold và stock_on_hand theo SKU ---
+def _sku_list_query(db: Session, target_date, store_id: str, city: str):
+    # (date, store_id, sku_id) is the primary key, so there is one row per SKU-store
     query = db.query(
         SalesFact.sku_id,
         SalesFact.sku_name,
@@ -1962,19 +2680,10 @@ async def get_top_skus(
         SalesFact.city,
         SalesFact.lead_time_days,
         SalesFact.list_price,
-        func.sum(SalesFact.units_sold).label("total_units_sold"),
-        func.max(SalesFact.stock_on_hand).label("stock_on_hand"),
+        SalesFact.units_sold.label("total_units_sold"),
+        SalesFact.stock_on_hand,
     ).filter(
         SalesFact.date == target_date,
-    ).group_by(
-        SalesFact.sku_id,
-        SalesFact.sku_name,
-        SalesFact.category,
-        SalesFact.brand,
-        SalesFact.store_id,
-        SalesFact.city,
-        SalesFact.lead_time_days,
-        SalesFact.list_price
     )
 
     if store_id != "all":
@@ -1982,27 +2691,52 @@ async def get_top_skus(
     if city != "all":
         query = query.filter(SalesFact.city == city)
 
-    total_count = query.count()
-    skus = query.offset((page - 1) * limit).limit(limit).all()
+    return query
 
-    if not skus:
-        return {
-            "code": "success",
-            "message": "No SKUs found",
-            "data": [],
-            "pagination": {"page": page, "limit": limit, "total_count": 0, "total_pages": 0}
-        }
+async def _sku_list_total(db: Session, target_date, store_id: str, city: str) -> int:
+    # Totals only change on ingest, so count once per filter instead of once per page
+    cache_key = f"list_skus_count:{target_date.isoformat()}:{store_id}:{city}"
+    cached = await redis_client.get(cache_key)
+    if cached:
+        return int(cached)
+
+    total_count = _sku_list_query(db, target_date, store_id, city).order_by(None).with_entities(func.count()).scalar()
+
+    await redis_client.set(cache_key, str(total_count))
+    return total_count
+
+def _sku_list_page(db: Session, target_date, store_id: str, city: str, limit: int, cursor: str = None, page: int = 1):
+    """
+    Fetch one page ordered by (store_id, sku_id). With a cursor the page starts
+    right after it (keyset), otherwise it falls back to OFFSET for `page`.
+    """
+    query = _sku_list_query(db, target_date, store_id, city).order_by(SalesFact.store_id, SalesFact.sku_id)
+
+    if cursor:
+        try:
+            last_store_id, last_sku_id = decode_cursor(cursor, 2)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        query = query.filter(
+            tuple_(SalesFact.store_id, SalesFact.sku_id) > tuple_(literal(last_store_id), literal(last_sku_id))
+        )
+    else:
+        query = query.offset((page - 1) * limit)
+
+    # One extra row tells whether there is a next page
+    rows = query.limit(limit + 1).all()
+    return rows[:limit], len(rows) > limit
 
-    # Tạo list SKU keys để tính avg daily tổng
-    sku_keys = [(r.sku_id, r.category, r.brand, r.store_id, r.city) for r in skus]
+def _sku_list_avg_demand(db: Session, target_date, skus) -> dict:
+    # Average daily demand over the N_DAYS following target_date, for all rows at once
+    sku_keys = [(r.sku_id, r.store_id) for r in skus]
+    if not sku_keys:
+        return {}
 
     avg_demand_query = (
         db.query(
             SalesFact.sku_id,
             SalesFact.store_id,
-            SalesFact.category,
-            SalesFact.brand,
-            SalesFact.city,
             (func.sum(SalesFact.units_sold) / N_DAYS).label("avg_daily_demand")
         )
         .filter(
@@ -2010,68 +2744,223 @@ async def get_top_skus(
             SalesFact.date <= target_date + timedelta(days=N_DAYS),
             tuple_(
                 SalesFact.sku_id,
-                SalesFact.category,
-                SalesFact.brand,
-                SalesFact.store_id,
-                SalesFact.city
+                SalesFact.store_id
             ).in_(sku_keys)
         )
         .group_by(
             SalesFact.sku_id,
-            SalesFact.category,
-            SalesFact.brand,
-            SalesFact.store_id,
-            SalesFact.city
+            SalesFact.store_id
         )
         .all()
     )
 
-    avg_demand_map = {
-        (r.sku_id, r.category, r.brand, r.store_id, r.city): float(r.avg_daily_demand or EPSILON)
+    return {
+        (r.sku_id, r.store_id): float(r.avg_daily_demand or EPSILON)
         for r in avg_demand_query
     }
 
-    result_data = []
-    for r in skus:
-        key = (r.sku_id, r.category, r.brand, r.store_id, r.city)
-        avg_daily = avg_demand_map.get(key, EPSILON)
-        doc = r.stock_on_hand / max(avg_daily, EPSILON)
-
-        result_data.append({
-            "sku_id": r.sku_id,
-            "sku_name": r.sku_name,
-            "category": r.category,
-            "brand": r.brand,
-            "store_id": r.store_id,
-            "city": r.city,
-            "total_units_sold": int(r.total_units_sold or 0),  # sales trong ngày target
-            "stock_on_hand": int(r.stock_on_hand or 0),        # tồn kho tại target_date
-            "avg_daily_demand": round(avg_daily, 2),           # optional nhưng rất nên có
-            "doc": round(doc, 2),
-            "rop": round(
-                max(avg_daily, EPSILON) * (r.lead_time_days + safety_stock + preview_days),
-                2
-            ),
-            "day_until_order": round(
-                doc - (r.lead_time_days + safety_stock + preview_days),
-                2
-            ),
-            "average_daily_sales": round(avg_daily, 2),
-            "lead_time_days": r.lead_time_days,
-            "list_price": round(float(r.list_price or 0), 2),
-        })
+def _sku_list_item(r, avg_demand_map: dict) -> dict:
+    avg_daily = avg_demand_map.get((r.sku_id, r.store_id), EPSILON)
+    doc = (r.stock_on_hand or 0) / max(avg_daily, EPSILON)
+
+    return {
+        "sku_id": r.sku_id,
+        "sku_name": r.sku_name,
+        "category": r.category,
+        "brand": r.brand,
+        "store_id": r.store_id,
+        "city": r.city,
+        "total_units_sold": int(r.total_units_sold or 0),  # sales trong ngày target
+        "stock_on_hand": int(r.stock_on_hand or 0),        # tồn kho tại target_date
+        "avg_daily_demand": round(avg_daily, 2),           # optional nhưng rất nên có
+        "doc": round(doc, 2),
+        "rop": round(
+            max(avg_daily, EPSILON) * (r.lead_time_days + safety_stock + preview_days),
+            2
+        ),
+        "day_until_order": round(
+            doc - (r.lead_time_days + safety_stock + preview_days),
+            2
+        ),
+        "average_daily_sales": round(avg_daily, 2),
+        "lead_time_days": r.lead_time_days,
+        "list_price": round(float(r.list_price or 0), 2),
+    }
+
+def _parse_sku_list_date(date: str):
+    try:
+        return datetime.strptime(date, "%Y-%m-%d").date()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid date format")
+
+@app.get("/sku/list")
+async def get_sku_list(
+    db: Session = Depends(get_db),
+    limit: int = Query(20, ge=1, le=100),
+    page: int = Query(1, ge=1),
+    date: str = Query(..., description="YYYY-MM-DD"),
+    store_id: str = Query("all", description="Filter by Store ID"),
+    city: str = Query("all", description="Filter by City"),
+    cursor: str = Query(None, description="next_cursor from the previous page; takes precedence over page"),
+):
+    # --- Validate date ---
+    target_date = _parse_sku_list_date(date)
+
+    if target_date > MAX_DATE or target_date < MIN_DATE:
+        return {
+            "code": "error",
+            "message": "Data is only available up to 2023-12-31",
+            "data": [],
+            "pagination": {"page": page, "limit": limit, "total_count": 0, "total_pages": 0, "next_cursor": None}
+        }
+
+    # --- Redis cache ---
+    cache_key = f"list_skus:{limit}:{page}:{cursor or ''}:{date}:{store_id}:{city}"
+    cached = await redis_client.get(cache_key)
+    if cached:
+        return {"source": "redis", **json.loads(cached)}
+
+    total_count = await _sku_list_total(db, target_date, store_id, city)
+    skus, has_more = _sku_list_page(db, target_date, store_id, city, limit, cursor, page)
+
+    if not skus:
+        return {
+            "code": "success",
+            "message": "No SKUs found",
+            "data": [],
+            "pagination": {"page": page, "limit": limit, "total_count": total_count, "total_pages": (total_count + limit - 1) // limit, "next_cursor": None}
+        }
+
+    avg_demand_map = _sku_list_avg_demand(db, target_date, skus)
 
     result = {
         "code": "success",
         "message": "Top SKUs retrieved successfully",
-        "data": result_data,
+        "data": [_sku_list_item(r, avg_demand_map) for r in skus],
         "pagination": {
-            "page": page,
+            "page": None if cursor else page,
             "limit": limit,
             "total_count": total_count,
-            "total_pages": (total_count + limit - 1) // limit
+            "total_pages": (total_count + limit - 1) // limit,
+            "next_cursor": encode_cursor(skus[-1].store_id, skus[-1].sku_id) if has_more else None,
         }
     }
 
     await redis_client.set(cache_key, json.dumps(result))
-    return {"source": "db", **result}
\ No newline at end of file
+    return {"source": "db", **result}
+
+@app.get("/sku/list/bulk")
+async def get_sku_list_bulk(
+    db: Session = Depends(get_db),
+    limit: int = Query(20, ge=1, le=100),
+    pages: int = Query(5, ge=1, le=20, description="Number of consecutive pages to fetch"),
+    date: str = Query(..., description="YYYY-MM-DD"),
+    store_id: str = Query("all", description="Filter by Store ID"),
+    city: str = Query("all", description="Filter by City"),
+    cursor: str = Query(None, description="next_cursor to start from, omit for the first page"),
+):
+    """
+    Fetch several consecutive /sku/list pages with one keyset query and one
+    demand lookup, so scrolling clients can prefetch ahead.
+    """
+    target_date = _parse_sku_list_date(date)
+
+    if target_date > MAX_DATE or target_date < MIN_DATE:
+        return {
+            "code": "error",
+            "message": "Data is only available up to 2023-12-31",
+            "pages": [],
+            "pagination": {"limit": limit, "total_count": 0, "total_pages": 0, "next_cursor": None}
+        }
+
+    total_count = await _sku_list_total(db, target_date, store_id, city)
+    skus, has_more = _sku_list_page(db, target_date, store_id, city, limit * pages, cursor)
+    avg_demand_map = _sku_list_avg_demand(db, target_date, skus)
+
+    result_pages = []
+    for start in range(0, len(skus), limit):
+        chunk = skus[start:start + limit]
+        is_last = start + limit >= len(skus)
+        result_pages.append({
+            "data": [_sku_list_item(r, avg_demand_map) for r in chunk],
+            "next_cursor": encode_cursor(chunk[-1].store_id, chunk[-1].sku_id) if (has_more or not is_last) else None,
+        })
+
+    return {
+        "code": "success",
+        "message": "SKU pages retrieved successfully",
+        "pages": result_pages,
+        "pagination": {
+            "limit": limit,
+            "total_count": total_count,
+            "total_pages": (total_count + limit - 1) // limit,
+            "next_cursor": result_pages[-1]["next_cursor"] if result_pages else None,
+        }
+    }
+
+# ==================== EXPORT ====================
+
+@app.get('/export/sales_fact', dependencies=[Depends(require_admin)])
+def export_sales_fact(
+    format: str = Query("csv", description="csv, ndjson or arrow (Arrow IPC stream)"),
+    country: str = Query("all", description="Filter by country"),
+    store_id: str = Query("all", description="Filter by store"),
+    sku_id: str = Query("all", description="Filter by SKU"),
+    start_date: str = Query(None, description="First date (YYYY-MM-DD)"),
+    end_date: str = Query(None, description="Last date (YYYY-MM-DD)"),
+    columns: str = Query(None, description="Comma-separated columns, all columns when omitted"),
+):
+    """
+    Stream sales_fact rows matching the filters, ordered by (date, store_id, sku_id).
+    The response is chunked and starts before the query has finished.
+    """
+    if format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unknown format, use one of: {', '.join(EXPORT_FORMATS)}")
+    if format == "arrow" and not ARROW_AVAILABLE:
+        raise HTTPException(status_code=501, detail="Arrow export requires pyarrow")
+
+    table_columns = SalesFact.__table__.columns
+    if columns:
+        names = [c.strip() for c in columns.split(",") if c.strip()]
+        unknown = [n for n in names if n not in table_columns]
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Unknown columns: {', '.join(unknown)}")
+        selected = [table_columns[n] for n in names]
+    else:
+        selected = list(table_columns)
+
+    conditions = []
+    if country != "all":
+        conditions.append(SalesFact.country == country)
+    if store_id != "all":
+        conditions.append(SalesFact.store_id == store_id)
+    if sku_id != "all":
+        conditions.append(SalesFact.sku_id == sku_id)
+    try:
+        if start_date:
+            conditions.append(SalesFact.date >= datetime.strptime(start_date, "%Y-%m-%d").date())
+        if end_date:
+            conditions.append(SalesFact.date <= datetime.strptime(end_date, "%Y-%m-%d").date())
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid date format")
+
+    media_type, extension = EXPORT_FORMATS[format]
+    return StreamingResponse(
+        export_rows(conditions, selected, format),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="sales_fact.{extension}"'},
+    )
+
+# ==================== METRICS ====================
+
+@app.get('/metrics')
+def get_metrics():
+    """Request, SQL and cache metrics in the Prometheus text exposition format."""
+    return Response(render_metrics(), media_type=METRICS_CONTENT_TYPE)
+
+@app.get('/metrics/slow_queries')
+def get_slow_queries():
+    """Most recent slow SQL statements with their EXPLAIN (ANALYZE, BUFFERS) output."""
+    return {
+        "data": slow_queries()
+    }
@@ -0,0 +1,52 @@
+from sqlalchemy import Column, Integer, String, Boolean, Numeric, Date
+from .sales_fact import Base
+
+# Small lookup tables derived from sales_fact and refreshed on ingest
+# (see utils/refresh.py), so list endpoints never scan the fact table.
+
+class DimStore(Base):
+    __tablename__ = "dim_store"
+
+    store_id = Column(String(20), primary_key=True, nullable=False)
+    country = Column(String(50), index=True)
+    city = Column(String(50))
+    channel = Column(String(50))
+    latitude = Column(Numeric(9, 6))
+    longitude = Column(Numeric(9, 6))
+    last_date = Column(Date, nullable=False)
+
+class DimSku(Base):
+    __tablename__ = "dim_sku"
+
+    sku_id = Column(String(20), primary_key=True, nullable=False)
+    sku_name = Column(String(100))
+    category = Column(String(50), index=True)
+    subcategory = Column(String(50))
+    brand = Column(String(50), index=True)
+    supplier_id = Column(String(20))
+    last_date = Column(Date, nullable=False)
+
+class DimSupplier(Base):
+    __tablename__ = "dim_supplier"
+
+    supplier_id = Column(String(20), primary_key=True, nullable=False)
+    last_date = Column(Date, nullable=False)
+
+class DimCalendar(Base):
+    __tablename__ = "dim_calendar"
+
+    date = Column(Date, primary_key=True, nullable=False)
+    year = Column(Integer, nullable=False, index=True)
+    month = Column(Integer, nullable=False)
+    day = Column(Integer, nullable=False)
+    weekofyear = Column(Integer, nullable=False)
+    weekday = Column(Integer, nullable=False)
+    is_weekend = Column(Boolean, nullable=False)
+    is_holiday = Column(Boolean, nullable=False)
+
+DIMENSION_TABLES = [
+    DimStore.__table__,
+    DimSku.__table__,
+    DimSupplier.__table__,
+    DimCalendar.__table__,
+]
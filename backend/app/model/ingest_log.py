@@ -0,0 +1,17 @@
+from sqlalchemy import Column, Integer, String, Date, DateTime
+from .sales_fact import Base
+
+class SalesIngest(Base):
+    """
+    One row per file loaded into sales_fact by utils/ingest.py, whether or
+    not derived tables were refreshed after it. Lets copies of sales_fact
+    (the Parquet snapshot) tell which loads they already include.
+    """
+    __tablename__ = "sales_ingest"
+
+    ingest_id = Column(Integer, primary_key=True, autoincrement=True)
+    created_at = Column(DateTime, nullable=False)
+    path = Column(String(500), nullable=False)
+    rows = Column(Integer, nullable=False)
+    start_date = Column(Date, nullable=False)
+    end_date = Column(Date, nullable=False)
@@ -0,0 +1,24 @@
+from sqlalchemy import Column, Integer, String, Boolean, Numeric, Date
+from .sales_fact import Base
+
+class LatestInventory(Base):
+    """
+    Latest known inventory position per SKU-store, upserted as days are
+    ingested (see utils/refresh.py).
+    """
+    __tablename__ = "latest_inventory"
+
+    sku_id = Column(String(20), primary_key=True, nullable=False)
+    store_id = Column(String(20), primary_key=True, nullable=False)
+    sku_name = Column(String(100))
+    country = Column(String(50), index=True)
+    city = Column(String(50))
+
+    stock_on_hand = Column(Integer)
+    stock_opening = Column(Integer)
+    stock_out_flag = Column(Boolean, nullable=False)
+    lead_time_days = Column(Integer)
+
+    # Average units sold per recorded day over the trailing window ending at last_date
+    avg_daily_sales = Column(Numeric(10, 2))
+    last_date = Column(Date, nullable=False, index=True)
@@ -0,0 +1,47 @@
+from sqlalchemy import Column, Integer, String, Numeric, Date
+from .sales_fact import Base
+
+class SkuStoreMonth(Base):
+    """
+    Units sold per SKU-store and month, with the stock position and net
+    sales of the last sold day in the month. Recomputed for the months
+    touched by an ingest (see utils/leaderboard.py).
+    """
+    __tablename__ = "sku_store_month"
+
+    year = Column(Integer, primary_key=True, nullable=False)
+    month = Column(Integer, primary_key=True, nullable=False)
+    sku_id = Column(String(20), primary_key=True, nullable=False)
+    store_id = Column(String(20), primary_key=True, nullable=False)
+    country = Column(String(50))
+
+    units_sold = Column(Integer, nullable=False)
+    last_date = Column(Date, nullable=False)
+    stock_opening = Column(Integer)
+    lead_time_days = Column(Integer)
+    net_sales = Column(Numeric(12, 2))
+
+class SkuLeaderboard(Base):
+    """
+    Top SKUs per (country, year, month) filter of /sku/top, each with its
+    best-selling store. country is "all" and year/month are 0 for no filter.
+    """
+    __tablename__ = "sku_leaderboard"
+
+    country = Column(String(50), primary_key=True, nullable=False)
+    year = Column(Integer, primary_key=True, nullable=False)
+    month = Column(Integer, primary_key=True, nullable=False)
+    # 1 for the best-selling SKU
+    rank = Column(Integer, primary_key=True, nullable=False)
+
+    sku_id = Column(String(20), nullable=False)
+    store_id = Column(String(20), nullable=False)
+    units_sold = Column(Integer, nullable=False)
+    stock_opening = Column(Integer)
+    lead_time_days = Column(Integer)
+    net_sales = Column(Numeric(12, 2))
+
+LEADERBOARD_TABLES = [
+    SkuStoreMonth.__table__,
+    SkuLeaderboard.__table__,
+]
@@ -5,6 +5,8 @@ Base = declarative_base()
 
 class SalesFact(Base):
     __tablename__ = "sales_fact"
+    # Monthly partitions are created by utils.ingest as data arrives
+    __table_args__ = {"postgresql_partition_by": "RANGE (date)"}
 
     date = Column(Date, primary_key=True, nullable=False)
     year = Column(Integer, nullable=False)
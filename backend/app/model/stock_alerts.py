@@ -0,0 +1,67 @@
+from sqlalchemy import Column, Integer, String, Numeric, Date, DateTime, ForeignKey
+from .sales_fact import Base
+
+class DemandForecast(Base):
+    """
+    Latest 7-day demand and lead-time forecast per SKU-store, materialized
+    from the AI backend (see utils/stock_alerts.py). `as_of` is the
+    LatestInventory.last_date the forecast starts after.
+    """
+    __tablename__ = "demand_forecast"
+
+    sku_id = Column(String(20), primary_key=True, nullable=False)
+    store_id = Column(String(20), primary_key=True, nullable=False)
+    # 1..7, days after as_of
+    day = Column(Integer, primary_key=True, nullable=False)
+
+    as_of = Column(Date, nullable=False, index=True)
+    date = Column(Date, nullable=False)
+    units_sold = Column(Numeric(10, 2))
+    lead_time_days = Column(Numeric(6, 2))
+    created_at = Column(DateTime, nullable=False)
+
+
+class StockAlertRun(Base):
+    __tablename__ = "stock_alert_run"
+
+    run_id = Column(Integer, primary_key=True, autoincrement=True)
+    created_at = Column(DateTime, nullable=False)
+    # Latest stock position date across the network
+    as_of = Column(Date)
+    sku_stores = Column(Integer, nullable=False)
+    # SKU-stores projected from a forecast rather than trailing average sales
+    forecasted = Column(Integer, nullable=False)
+
+
+class StockAlert(Base):
+    """Projected stock position per SKU-store, one set of rows per alert run."""
+    __tablename__ = "stock_alert"
+
+    run_id = Column(Integer, ForeignKey("stock_alert_run.run_id", ondelete="CASCADE"), primary_key=True)
+    sku_id = Column(String(20), primary_key=True, nullable=False)
+    store_id = Column(String(20), primary_key=True, nullable=False)
+    sku_name = Column(String(100))
+    country = Column(String(50), index=True)
+    city = Column(String(50))
+    last_date = Column(Date, nullable=False)
+
+    current_stock = Column(Integer, nullable=False)
+    avg_daily_demand = Column(Numeric(10, 2), nullable=False)
+    lead_time_days = Column(Numeric(6, 2), nullable=False)
+    safety_stock = Column(Integer, nullable=False)
+    reorder_point = Column(Integer, nullable=False)
+    order_qty = Column(Integer, nullable=False)
+
+    # NULL when no demand is expected
+    days_until_stockout = Column(Numeric(8, 1))
+    stockout_date = Column(Date)
+
+    # critical / warning / info
+    urgency = Column(String(10), nullable=False, index=True)
+    # High / Medium / Low
+    priority = Column(String(10), nullable=False)
+    # "forecast" or "history"
+    demand_source = Column(String(10), nullable=False)
+
+
+STOCK_ALERT_TABLES = [DemandForecast.__table__, StockAlertRun.__table__, StockAlert.__table__]
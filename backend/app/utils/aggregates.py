@@ -0,0 +1,52 @@
+from dataclasses import dataclass
+from typing import Any, Optional
+from sqlalchemy import func, case, literal
+from sqlalchemy.orm import Session
+
+
+@dataclass(frozen=True)
+class Metric:
+    """
+    A named aggregate over the fact table, optionally restricted to the rows
+    matching `where`. A metric without a column counts rows.
+    """
+    name: str
+    agg: str = "sum"
+    column: Any = None
+    where: Optional[Any] = None
+
+
+def compile_metric(metric: Metric, style: str = "filter"):
+    """
+    Compile one metric to a labeled SQL expression.
+
+    style="filter" emits `agg(col) FILTER (WHERE cond)` (PostgreSQL),
+    style="case" emits `agg(CASE WHEN cond THEN col END)` for other dialects.
+    """
+    fn = getattr(func, metric.agg)
+    column = metric.column
+
+    if metric.where is None:
+        expr = fn(column) if column is not None else fn()
+    elif style == "filter":
+        expr = (fn(column) if column is not None else fn()).filter(metric.where)
+    elif style == "case":
+        value = column if column is not None else literal(1)
+        expr = fn(case((metric.where, value)))
+    else:
+        raise ValueError(f"Unknown aggregate style: {style}")
+
+    return expr.label(metric.name)
+
+
+def compile_metrics(metrics, style: str = "filter"):
+    return [compile_metric(m, style) for m in metrics]
+
+
+def run_metrics(db: Session, metrics, filters=(), style: str = "filter") -> dict:
+    """
+    Evaluate all metrics in a single pass over the rows matching `filters`.
+    Returns {metric name: value}.
+    """
+    row = db.query(*compile_metrics(metrics, style)).filter(*filters).one()
+    return dict(row._mapping)
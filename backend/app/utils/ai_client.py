@@ -0,0 +1,185 @@
+import asyncio
+import os
+import random
+import time
+import httpx
+from opentelemetry.trace import SpanKind
+from .tracing import tracer, inject_headers
+
+# Statuses worth retrying: the AI backend is restarting or overloaded
+RETRYABLE_STATUS = {502, 503, 504}
+
+
+class CircuitOpenError(Exception):
+    """Raised without calling the AI backend while the circuit breaker is open."""
+
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive failures (transport errors
+    and 5xx responses left after retries) and fails fast until
+    `reset_timeout` seconds have passed, then lets a single trial call through.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.trial_in_flight = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half_open" and not self.trial_in_flight:
+            self.trial_in_flight = True
+            return True
+        return False
+
+    def release_trial(self):
+        """End a trial call that neither succeeded nor failed, e.g. when it was cancelled."""
+        self.trial_in_flight = False
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self.trial_in_flight = False
+
+    def record_failure(self):
+        self.failures += 1
+        self.trial_in_flight = False
+        if self.opened_at is not None or self.failures >= self.failure_threshold:
+            # A failed trial call re-opens the circuit for another full timeout
+            self.opened_at = time.monotonic()
+
+
+class AIBackendClient:
+    """
+    Application-lifetime HTTP client for the AI backend: keep-alive connection
+    pooling, bounded concurrency, retries with exponential backoff for
+    idempotent calls and a circuit breaker.
+    """
+
+    def __init__(
+        self,
+        base_url: str,
+        timeout: float = 30.0,
+        max_connections: int = 20,
+        max_concurrency: int = 10,
+        retries: int = 2,
+        backoff: float = 0.5,
+        breaker: CircuitBreaker = None,
+        transport: httpx.AsyncBaseTransport = None,
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.max_connections = max_connections
+        self.retries = retries
+        self.backoff = backoff
+        self.breaker = breaker or CircuitBreaker()
+        self.transport = transport
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._client = None
+
+    @classmethod
+    def from_env(cls) -> "AIBackendClient":
+        return cls(
+            base_url=os.getenv("AI_BACKEND_URL", "http://3.27.185.230:8001"),
+            timeout=float(os.getenv("AI_BACKEND_TIMEOUT", 30.0)),
+            max_connections=int(os.getenv("AI_BACKEND_MAX_CONNECTIONS", 20)),
+            max_concurrency=int(os.getenv("AI_BACKEND_MAX_CONCURRENCY", 10)),
+            retries=int(os.getenv("AI_BACKEND_RETRIES", 2)),
+            backoff=float(os.getenv("AI_BACKEND_BACKOFF", 0.5)),
+            breaker=CircuitBreaker(
+                failure_threshold=int(os.getenv("AI_BACKEND_BREAKER_THRESHOLD", 5)),
+                reset_timeout=float(os.getenv("AI_BACKEND_BREAKER_RESET", 30.0)),
+            ),
+        )
+
+    async def start(self):
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                timeout=self.timeout,
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections,
+                ),
+                transport=self.transport,
+            )
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def request(self, method: str, path: str, idempotent: bool = None, **kwargs) -> httpx.Response:
+        """
+        Send a request and return the final response. Connection errors and
+        502/503/504 responses are retried only for idempotent calls
+        (GET/HEAD by default). Raises CircuitOpenError while the backend is
+        considered down.
+        """
+        if idempotent is None:
+            idempotent = method.upper() in ("GET", "HEAD")
+
+        trial = self.breaker.state == "half_open"
+        if not self.breaker.allow():
+            raise CircuitOpenError(f"AI backend at {self.base_url} is unavailable, retry later")
+
+        try:
+            return await self._send(method, path, idempotent, **kwargs)
+        finally:
+            if trial:
+                # Without this a cancelled trial, or one failing before a response,
+                # would keep the breaker rejecting every call
+                self.breaker.release_trial()
+
+    async def _send(self, method: str, path: str, idempotent: bool, **kwargs) -> httpx.Response:
+        await self.start()
+
+        attempts = self.retries + 1 if idempotent else 1
+        with tracer.start_as_current_span(
+            f"ai_backend {method.upper()} {path}",
+            kind=SpanKind.CLIENT,
+            attributes={"http.request.method": method.upper(), "url.path": path},
+        ) as span:
+            # The AI backend continues this trace from the traceparent header
+            kwargs["headers"] = inject_headers(kwargs.get("headers"))
+            async with self._semaphore:
+                for attempt in range(attempts):
+                    is_last = attempt == attempts - 1
+                    span.set_attribute("ai_backend.attempts", attempt + 1)
+                    try:
+                        response = await self._client.request(method, path, **kwargs)
+                    except httpx.TransportError:
+                        if is_last:
+                            self.breaker.record_failure()
+                            raise
+                    else:
+                        span.set_attribute("http.response.status_code", response.status_code)
+                        if response.status_code < 500:
+                            self.breaker.record_success()
+                            return response
+                        if response.status_code not in RETRYABLE_STATUS or is_last:
+                            self.breaker.record_failure()
+                            return response
+
+                    # Exponential backoff with jitter before the next attempt
+                    delay = self.backoff * (2 ** attempt)
+                    await asyncio.sleep(delay + random.uniform(0, delay))
+
+    async def post(self, path: str, idempotent: bool = False, **kwargs) -> httpx.Response:
+        return await self.request("POST", path, idempotent=idempotent, **kwargs)
+
+    async def get(self, path: str, **kwargs) -> httpx.Response:
+        return await self.request("GET", path, **kwargs)
@@ -0,0 +1,16 @@
+import os
+import secrets
+from fastapi import Header, HTTPException
+
+# Shared secret for the /admin endpoints; unset disables them
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+
+
+def require_admin(authorization: str = Header(None)):
+    """Dependency for /admin routes: expects `Authorization: Bearer <ADMIN_TOKEN>`."""
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=503, detail="Admin endpoints are disabled, set ADMIN_TOKEN")
+
+    scheme, _, token = (authorization or "").partition(" ")
+    if scheme.lower() != "bearer" or not secrets.compare_digest(token.encode(), ADMIN_TOKEN.encode()):
+        raise HTTPException(status_code=401, detail="Invalid admin token", headers={"WWW-Authenticate": "Bearer"})
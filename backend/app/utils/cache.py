@@ -0,0 +1,75 @@
+import os
+import contextvars
+from decimal import Decimal
+import orjson
+from fastapi.responses import Response
+
+# Accepted by the `format` query parameter of the time-series endpoints
+SERIES_FORMAT_PATTERN = "^(rows|columnar)$"
+
+# Set while the cache warmer recomputes entries: every cache read misses,
+# so endpoints query the database and overwrite what is cached
+skip_cache_reads = contextvars.ContextVar("skip_cache_reads", default=False)
+# Set while the cache warmer builds the entries of the next data version
+cache_version = contextvars.ContextVar("cache_version", default=None)
+
+# Entries built from sales data. Their keys carry the data version, so a new
+# version retires every variant at once, including ones the warmer never builds
+VERSIONED_PREFIXES = {
+    "store_list", "city_list", "category_list", "brand_list",
+    "top_skus", "net_sales_location", "net_sales_clusters", "stock_alerts", "dashboard",
+    "revenue", "profit", "channel_analytics", "channel_daily_sales", "pricing_analytics",
+    "discount_impact", "supplier_performance", "weather_correlation", "weather_by_category",
+    "weather_stats", "inventory_optimization", "list_skus", "list_skus_count",
+}
+# Retired versions drain from Redis after this long
+CACHE_ENTRY_TTL = int(os.getenv("CACHE_ENTRY_TTL", 7 * 24 * 3600))
+
+
+def _default(value):
+    if isinstance(value, Decimal):
+        return float(value)
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def dumps(value) -> bytes:
+    """orjson with Decimal support; dates become ISO strings."""
+    return orjson.dumps(value, default=_default, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY)
+
+
+loads = orjson.loads
+
+
+class FastJSONResponse(Response):
+    """JSON response serialized with orjson; bytes content is sent as is."""
+    media_type = "application/json"
+
+    def render(self, content) -> bytes:
+        return content if isinstance(content, bytes) else dumps(content)
+
+
+def with_source(blob: bytes, source: str) -> bytes:
+    """Add a "source" key to a serialized JSON object without parsing it."""
+    head = b'{"source":"' + source.encode() + b'"'
+    body = blob.strip()[1:]
+    return head + (body if body.startswith(b"}") else b"," + body)
+
+
+async def cached_json(redis, key: str):
+    """The cached blob as a response tagged "source": "redis", or None on a miss."""
+    cached = await redis.get(key)
+    if cached:
+        return FastJSONResponse(with_source(cached.encode(), "redis"))
+    return None
+
+
+async def cache_json(redis, key: str, result: dict) -> FastJSONResponse:
+    """Serialize once, store the blob and respond with it tagged "source": "db"."""
+    blob = dumps(result)
+    await redis.set(key, blob.decode())
+    return FastJSONResponse(with_source(blob, "db"))
+
+
+def columnar(records: list, fields: list) -> dict:
+    """[{"date": d, "sales": s}, ...] -> {"date": [...], "sales": [...]}"""
+    return {f: [r[f] for r in records] for f in fields}
@@ -0,0 +1,164 @@
+import os
+import re
+import json
+import hashlib
+from .refresh import DATA_VERSION_KEY
+
+# Lowest similarity at which a cached question's SQL is reused for a new one
+CHATBOT_SIMILARITY_THRESHOLD = float(os.getenv("CHATBOT_SIMILARITY_THRESHOLD", 0.8))
+# Words only in one question must be at least this close to a word in the other (typos)
+CHATBOT_WORD_MATCH = 0.6
+# Recent distinct questions compared against on an exact-match miss
+CHATBOT_QUESTION_INDEX_SIZE = int(os.getenv("CHATBOT_QUESTION_INDEX_SIZE", 500))
+# Validated SQL does not depend on the data, so it is kept longer than results
+CHATBOT_SQL_TTL = int(os.getenv("CHATBOT_SQL_TTL", 7 * 24 * 3600))
+# How long a result and the answer built on it stay cached
+CHATBOT_RESULT_TTL = int(os.getenv("CHATBOT_RESULT_TTL", 3600))
+
+QUESTION_INDEX_KEY = "chatbot:questions"
+
+# Filler only: question words (how many, which), listing and aggregation
+# words (list, per, each, all) change what SQL answers the question
+STOPWORDS = {
+    "a", "an", "the", "of", "in", "on", "for", "to", "by", "at", "and", "or",
+    "is", "are", "was", "were", "be", "me", "show", "tell", "give", "please",
+    "can", "you", "i", "do", "does", "with", "from", "my", "our",
+}
+
+# Words close enough in spelling to pass as typos of each other, but opposite in meaning
+OPPOSITES = {
+    frozenset(pair) for pair in [
+        ("asc", "desc"), ("ascending", "descending"), ("top", "bottom"), ("most", "least"),
+        ("first", "last"), ("highest", "lowest"), ("best", "worst"), ("max", "min"),
+    ]
+}
+
+
+def normalize_question(question: str) -> str:
+    """
+    Lowercase, strip punctuation, filler words and plurals.
+
+    >>> normalize_question("Show me the top 5 SKUs?")
+    'top 5 sku'
+    >>> normalize_question("How many SKUs?"), normalize_question("List all SKUs")
+    ('how many sku', 'list all sku')
+    """
+    words = [w for w in re.findall(r"\w+", question.lower()) if w not in STOPWORDS]
+    return " ".join(w[:-1] if len(w) > 3 and w.endswith("s") and not w.endswith("ss") else w for w in words)
+
+
+def _trigrams(text: str) -> set:
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def _dice(a: str, b: str) -> float:
+    ta, tb = _trigrams(a), _trigrams(b)
+    return 2 * len(ta & tb) / (len(ta) + len(tb)) if ta or tb else 1.0
+
+
+def _only_typos(words: set, others: set) -> bool:
+    return all(
+        max((_dice(w, o) for o in others if frozenset((w, o)) not in OPPOSITES), default=0.0) >= CHATBOT_WORD_MATCH
+        for w in words
+    )
+
+
+def similarity(a: str, b: str) -> float:
+    """
+    Dice coefficient of character trigrams between two normalized questions,
+    which tolerates typos and word order. Questions that differ by a real
+    word (online vs offline, Vietnam vs Japan, ascending vs descending) or
+    by any number (years, months, top-N) never match.
+
+    >>> round(similarity("top sku by revenu", "top sku by revenue"), 3)
+    0.919
+    >>> similarity("top sku by revenue ascending", "top sku by revenue descending")
+    0.0
+    >>> similarity("top sku by revenue asc", "top sku by revenue desc")
+    0.0
+    >>> similarity("top 5 sku", "bottom 5 sku"), similarity("most sold sku", "least sold sku")
+    (0.0, 0.0)
+    >>> similarity("first order date", "last order date")
+    0.0
+    >>> q = [normalize_question(t) for t in ["How much revenue per store?", "Show revenue for each store", "Revenue of all stores"]]
+    >>> similarity(q[0], q[1]), similarity(q[1], q[2]), similarity(q[0], q[2])
+    (0.0, 0.0, 0.0)
+    """
+    if re.findall(r"\d+", a) != re.findall(r"\d+", b):
+        return 0.0
+    wa, wb = set(a.split()), set(b.split())
+    if not (_only_typos(wa - wb, wb - wa) and _only_typos(wb - wa, wa - wb)):
+        return 0.0
+    return _dice(a, b)
+
+
+def _hash(*parts) -> str:
+    return hashlib.sha1("\x00".join(str(p) for p in parts).encode()).hexdigest()
+
+
+def result_key(handle: str) -> str:
+    return f"chatbot_result:{handle}"
+
+
+async def data_version(redis) -> str:
+    """Bumped by /admin/refresh; results and answers are cached per version."""
+    return str(await redis.get(DATA_VERSION_KEY) or 0)
+
+
+# ---------- level 1: question -> validated SQL ----------
+
+async def find_sql(redis, question: str):
+    """
+    Return (sql, "exact" | "similar") for a normalized question seen before,
+    or (None, None). Similar matches are searched locally over the question index.
+    """
+    sql = await redis.get(f"chatbot:sql:{_hash(question)}")
+    if sql:
+        return sql, "exact"
+
+    best_sql, best_score = None, CHATBOT_SIMILARITY_THRESHOLD
+    for entry in await redis.lrange(QUESTION_INDEX_KEY, 0, CHATBOT_QUESTION_INDEX_SIZE - 1):
+        entry = json.loads(entry)
+        score = similarity(question, entry["question"])
+        if score >= best_score:
+            best_sql, best_score = entry["sql"], score
+
+    if best_sql:
+        # The new wording becomes an exact match next time
+        await redis.set(f"chatbot:sql:{_hash(question)}", best_sql, ex=CHATBOT_SQL_TTL)
+        return best_sql, "similar"
+    return None, None
+
+
+async def remember_sql(redis, question: str, sql: str):
+    await redis.set(f"chatbot:sql:{_hash(question)}", sql, ex=CHATBOT_SQL_TTL)
+    await redis.lpush(QUESTION_INDEX_KEY, json.dumps({"question": question, "sql": sql}))
+    await redis.ltrim(QUESTION_INDEX_KEY, 0, CHATBOT_QUESTION_INDEX_SIZE - 1)
+
+
+# ---------- level 2: (SQL, data version) -> result ----------
+
+def result_handle(version: str, sql: str) -> str:
+    """The result cache key doubles as the client's handle for paging the full result."""
+    return _hash(version, sql)
+
+
+async def get_result(redis, handle: str):
+    cached = await redis.get(result_key(handle))
+    return json.loads(cached) if cached else None
+
+
+async def set_result(redis, handle: str, rows: list):
+    await redis.set(result_key(handle), json.dumps(rows), ex=CHATBOT_RESULT_TTL)
+
+
+# ---------- level 3: (question, data version) -> answer ----------
+
+async def get_answer(redis, version: str, question: str):
+    cached = await redis.get(f"chatbot:answer:{_hash(version, question)}")
+    return json.loads(cached) if cached else None
+
+
+async def set_answer(redis, version: str, question: str, data: dict):
+    await redis.set(f"chatbot:answer:{_hash(version, question)}", json.dumps(data), ex=CHATBOT_RESULT_TTL)
@@ -0,0 +1,91 @@
+import datetime
+from sqlalchemy import and_, or_
+from ..model.sales_fact import SalesFact
+
+# Accepted by the `compare` query parameter of the analytics endpoints
+COMPARE_PATTERN = "^(none|prev_period|prev_year)$"
+
+
+def _month_start(year: int, month: int) -> datetime.date:
+    # month may run past 12 or below 1, e.g. (2024, 13) is January 2025
+    year, month = year + (month - 1) // 12, (month - 1) % 12 + 1
+    return datetime.date(year, month, 1)
+
+
+class PeriodComparison:
+    """
+    The filtered period and the one it is compared with, as [start, end)
+    date ranges. prev_period is the preceding month for a month filter and
+    the preceding year for a year filter; prev_year is the same month or
+    year one year earlier. Both need a year filter.
+    """
+
+    def __init__(self, year: str, month: str, mode: str):
+        if year == "all":
+            raise ValueError(f"compare={mode} needs a year filter")
+        self.mode = mode
+        year = int(year)
+
+        if month == "all":
+            self.current = (datetime.date(year, 1, 1), datetime.date(year + 1, 1, 1))
+            self.previous = (datetime.date(year - 1, 1, 1), datetime.date(year, 1, 1))
+        else:
+            month = int(month)
+            self.current = (_month_start(year, month), _month_start(year, month + 1))
+            if mode == "prev_year":
+                self.previous = (_month_start(year - 1, month), _month_start(year - 1, month + 1))
+            else:
+                self.previous = (_month_start(year, month - 1), self.current[0])
+
+    @staticmethod
+    def _between(bounds):
+        return and_(SalesFact.date >= bounds[0], SalesFact.date < bounds[1])
+
+    def where(self):
+        """Rows of either period; the gap between them is never scanned."""
+        return or_(self._between(self.current), self._between(self.previous))
+
+    def split(self, aggregates: dict) -> list:
+        """
+        Each aggregate twice, as <name> over the current period and
+        prev_<name> over the previous one, so a single GROUP BY over
+        where() yields both.
+        """
+        columns = []
+        for name, aggregate in aggregates.items():
+            columns.append(aggregate.filter(self._between(self.current)).label(name))
+            columns.append(aggregate.filter(self._between(self.previous)).label(f"prev_{name}"))
+        return columns
+
+    def is_current(self, date: datetime.date) -> bool:
+        return self.current[0] <= date < self.current[1]
+
+    def describe(self) -> dict:
+        day = datetime.timedelta(days=1)
+        return {
+            "mode": self.mode,
+            "current": {"start": self.current[0].isoformat(), "end": (self.current[1] - day).isoformat()},
+            "previous": {"start": self.previous[0].isoformat(), "end": (self.previous[1] - day).isoformat()},
+        }
+
+
+def period_comparison(year: str, month: str, mode: str):
+    """The comparison for the filter, or None for compare=none."""
+    return None if mode == "none" else PeriodComparison(year, month, mode)
+
+
+def change(current: dict, previous: dict) -> dict:
+    """
+    Delta and growth in percent per numeric metric. growth_pct is None when
+    the previous value is 0.
+    """
+    result = {}
+    for name, value in current.items():
+        before = previous.get(name)
+        if isinstance(value, bool) or not isinstance(value, (int, float)) or not isinstance(before, (int, float)):
+            continue
+        result[name] = {
+            "delta": round(value - before, 4),
+            "growth_pct": round((value - before) / abs(before) * 100, 2) if before else None,
+        }
+    return result
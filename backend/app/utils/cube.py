@@ -0,0 +1,235 @@
+import os
+import time
+import logging
+import datetime
+from collections import namedtuple
+import numpy as np
+from sqlalchemy import select
+from ..model.sales_fact import SalesFact
+
+logger = logging.getLogger(__name__)
+
+# "cube" serves the dashboard aggregations from memory, "postgres" always queries the DB
+QUERY_ENGINE = os.getenv("QUERY_ENGINE", "postgres")
+CUBE_REFRESH_SECONDS = int(os.getenv("CUBE_REFRESH_SECONDS", 900))
+CUBE_LOAD_CHUNK = int(os.getenv("CUBE_LOAD_CHUNK", 200_000))
+
+# Dictionary-encoded string columns
+DIMENSIONS = ["country", "city", "store_id", "sku_id", "category", "brand", "channel"]
+# Stored as float32
+MEASURES = ["units_sold", "net_sales", "gross_sales"]
+FLAGS = ["is_weekend", "is_holiday", "promo_flag", "stock_out_flag"]
+
+EPOCH = np.datetime64("1970-01-01", "D")
+# Stand-in for NULL while dictionary-encoding a chunk
+NULL = "\x00"
+
+# Everything a query reads, swapped in one assignment on reload
+Snapshot = namedtuple("Snapshot", ["columns", "dictionaries", "years", "loaded_at"])
+
+
+class SalesCube:
+    """
+    Column-oriented in-memory copy of sales_fact for the dashboard endpoints.
+    Filters become boolean masks over NumPy arrays and group-bys become
+    np.bincount reductions over dictionary codes, so no query hits Postgres.
+    """
+
+    def __init__(self):
+        self.snapshot = None
+
+    @property
+    def enabled(self) -> bool:
+        return QUERY_ENGINE == "cube"
+
+    @property
+    def ready(self) -> bool:
+        return self.enabled and self.snapshot is not None
+
+    @property
+    def years(self) -> list:
+        return self.snapshot.years if self.snapshot else []
+
+    # ---------- loading ----------
+
+    def load(self, db):
+        """
+        Stream sales_fact in chunks and build fresh column arrays. The new
+        snapshot replaces the old one in one assignment, so readers never see
+        a half-loaded cube.
+        """
+        started = time.perf_counter()
+        fields = ["date", *DIMENSIONS, *MEASURES, *FLAGS]
+        stmt = select(*[getattr(SalesFact, f) for f in fields]).execution_options(yield_per=CUBE_LOAD_CHUNK)
+
+        codes = {d: {} for d in DIMENSIONS}
+        chunks = {f: [] for f in ["day", *DIMENSIONS, *MEASURES, *FLAGS]}
+
+        for partition in db.execute(stmt).partitions():
+            batch = list(zip(*partition))
+            values = dict(zip(fields, batch))
+
+            chunks["day"].append(
+                (np.array(values["date"], dtype="datetime64[D]") - EPOCH).astype(np.int32)
+            )
+            for d in DIMENSIONS:
+                chunks[d].append(_encode(values[d], codes[d]))
+            for mcol in MEASURES:
+                chunks[mcol].append(np.array([v or 0 for v in values[mcol]], dtype=np.float32))
+            for f in FLAGS:
+                chunks[f].append(np.array(values[f], dtype=bool))
+
+        columns = {
+            name: np.concatenate(parts) if parts else np.array([], dtype=np.int32)
+            for name, parts in chunks.items()
+        }
+
+        dates = (EPOCH + columns["day"]).astype("datetime64[D]")
+        columns["year"] = dates.astype("datetime64[Y]").astype(np.int32) + 1970
+        columns["month"] = (dates.astype("datetime64[M]").astype(np.int32) % 12 + 1).astype(np.int8)
+
+        dictionaries = {
+            d: np.array(sorted(codes[d], key=codes[d].get), dtype=object)
+            for d in DIMENSIONS
+        }
+
+        self.snapshot = Snapshot(
+            columns=columns,
+            dictionaries=dictionaries,
+            years=[int(y) for y in np.unique(columns["year"])],
+            loaded_at=datetime.datetime.utcnow(),
+        )
+
+        logger.info(f"CUBE|LOADED|ROWS={len(columns['day'])}|SECONDS={time.perf_counter() - started:.2f}")
+
+    # ---------- aggregation ----------
+
+    def group_by(self, by: str, aggregates: dict, granularity: str = "day", **filters):
+        """
+        Aggregate rows matching `filters` by a dimension, flag or "date".
+        `aggregates` maps output name -> ("sum", measure) or ("count", None).
+        Dates are grouped by the start of their day, week, month or quarter.
+        Returns rows sorted by key with the same attribute names a SQL
+        GROUP BY query would produce, skipping empty groups.
+        """
+        snap = self.snapshot
+        mask = _mask(snap, **filters)
+
+        if by == "date":
+            keys = _truncate_days(snap.columns["day"][mask].astype(np.int64), granularity)
+            offset = int(keys.min()) if len(keys) else 0
+            keys = (keys - offset).astype(np.int64)
+        else:
+            keys = snap.columns[by][mask].astype(np.int64)
+            offset = 0
+
+        size = int(keys.max()) + 1 if len(keys) else 0
+        counts = np.bincount(keys, minlength=size)
+
+        results = {}
+        for name, (agg, column) in aggregates.items():
+            if agg == "count":
+                results[name] = counts
+            else:
+                # bincount accumulates in float64 even for float32 weights
+                results[name] = np.bincount(keys, weights=snap.columns[column][mask], minlength=size)
+
+        present = np.nonzero(counts)[0]
+        labels = _labels(snap, by, present + offset)
+
+        Row = namedtuple("Row", [by, *aggregates])
+        rows = [
+            Row(label, *[results[name][i].item() for name in aggregates])
+            for label, i in zip(labels, present)
+        ]
+        if by in DIMENSIONS:
+            # Same order as SQL ORDER BY: NULLs last
+            rows.sort(key=lambda r: (getattr(r, by) is None, getattr(r, by) or ""))
+        return rows
+
+    def totals(self, metrics: dict, **filters) -> dict:
+        """
+        Evaluate named totals in one pass. `metrics` maps name ->
+        (agg, measure, condition) where condition is None or (flag, bool).
+        """
+        snap = self.snapshot
+        mask = _mask(snap, **filters)
+
+        result = {}
+        for name, (agg, column, condition) in metrics.items():
+            selected = mask
+            if condition is not None:
+                flag, value = condition
+                selected = mask & (snap.columns[flag] == value)
+            if agg == "count":
+                result[name] = int(np.count_nonzero(selected))
+            else:
+                result[name] = float(snap.columns[column][selected].sum(dtype=np.float64))
+        return result
+
+    def count_distinct(self, column: str, **filters) -> int:
+        """COUNT(DISTINCT column), ignoring NULL labels like SQL does."""
+        snap = self.snapshot
+        values = np.unique(snap.columns[column][_mask(snap, **filters)])
+        if column in DIMENSIONS:
+            return sum(1 for v in values if snap.dictionaries[column][v] is not None)
+        return int(len(values))
+
+
+def _mask(snap: Snapshot, country="all", year="all", month="all", store_id="all",
+          category="all", brand="all", sku_id="all", channel="all") -> np.ndarray:
+    """Boolean row mask for the usual "all"-or-value endpoint filters."""
+    columns = snap.columns
+    mask = np.ones(len(columns["day"]), dtype=bool)
+
+    for dim, value in (("country", country), ("store_id", store_id), ("category", category),
+                       ("brand", brand), ("sku_id", sku_id), ("channel", channel)):
+        if value != "all":
+            mask &= columns[dim] == _code(snap, dim, value)
+
+    if year != "all":
+        mask &= columns["year"] == int(year)
+    if month != "all":
+        mask &= columns["month"] == int(month)
+
+    return mask
+
+
+def _code(snap: Snapshot, dim: str, value) -> int:
+    matches = np.nonzero(snap.dictionaries[dim] == value)[0]
+    return int(matches[0]) if len(matches) else -1
+
+
+def _truncate_days(days: np.ndarray, granularity: str) -> np.ndarray:
+    """Days since the epoch -> first day of their period, matching Postgres date_trunc."""
+    if granularity == "week":
+        # 1970-01-01 was a Thursday; weeks start on Monday
+        return days - (days + 3) % 7
+    if granularity in ("month", "quarter"):
+        months = (EPOCH + days).astype("datetime64[M]")
+        if granularity == "quarter":
+            months = months - months.astype(np.int64) % 3
+        return (months.astype("datetime64[D]") - EPOCH).astype(np.int64)
+    return days
+
+
+def _labels(snap: Snapshot, by: str, values: np.ndarray) -> list:
+    if by == "date":
+        return (EPOCH + values.astype(np.int32)).astype("datetime64[D]").tolist()
+    if by in FLAGS:
+        return [bool(v) for v in values]
+    return snap.dictionaries[by][values].tolist()
+
+
+def _encode(values, codes: dict) -> np.ndarray:
+    """Dictionary-encode a chunk of labels, extending the shared code table."""
+    labels = np.array([NULL if v is None else v for v in values], dtype=object)
+    unique, inverse = np.unique(labels, return_inverse=True)
+    mapped = np.array(
+        [codes.setdefault(None if u == NULL else u, len(codes)) for u in unique],
+        dtype=np.int32,
+    )
+    return mapped[inverse]
+
+
+sales_cube = SalesCube()
@@ -19,6 +19,32 @@ engine = create_engine(
 )
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+# Separate small pool for LLM-generated chatbot SQL, so it can never starve the
+# dashboards. Point CHATBOT_DB_USER at a read-only role where available; every
+# connection is read-only and statement-time-limited either way.
+CHATBOT_DB_USER = os.getenv("CHATBOT_DB_USER", DB_USER)
+CHATBOT_DB_PASSWORD = os.getenv("CHATBOT_DB_PASSWORD", DB_PASSWORD)
+CHATBOT_POOL_SIZE = int(os.getenv("CHATBOT_POOL_SIZE", 2))
+CHATBOT_POOL_TIMEOUT = float(os.getenv("CHATBOT_POOL_TIMEOUT", 5))
+CHATBOT_STATEMENT_TIMEOUT_MS = int(os.getenv("CHATBOT_STATEMENT_TIMEOUT_MS", 5000))
+
+chatbot_engine = create_engine(
+    f"postgresql+psycopg2://{CHATBOT_DB_USER}:{CHATBOT_DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_DATABASE}",
+    pool_pre_ping=True,
+    pool_size=CHATBOT_POOL_SIZE,
+    max_overflow=0,
+    pool_timeout=CHATBOT_POOL_TIMEOUT,
+    connect_args={
+        "options": (
+            "-c default_transaction_read_only=on "
+            f"-c statement_timeout={CHATBOT_STATEMENT_TIMEOUT_MS}"
+        ),
+        "application_name": "datastorm-chatbot",
+    },
+)
+
+ChatbotSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=chatbot_engine)
 Base = declarative_base()
 
 def get_db():
@@ -26,4 +52,11 @@ def get_db():
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+def get_chatbot_db():
+    db = ChatbotSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
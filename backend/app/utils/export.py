@@ -0,0 +1,90 @@
+import os
+import io
+import csv
+import json
+import datetime
+from decimal import Decimal
+from sqlalchemy import select
+from ..model.sales_fact import SalesFact
+from .db import SessionLocal
+from .olap import arrow_type, plain_values
+
+try:
+    import pyarrow as pa
+except ImportError:  # optional: only the Arrow format needs it
+    pa = None
+
+ARROW_AVAILABLE = pa is not None
+
+# Rows fetched from the server-side cursor and sent per chunk
+EXPORT_CHUNK_ROWS = int(os.getenv("EXPORT_CHUNK_ROWS", 10_000))
+
+EXPORT_FORMATS = {
+    "csv": ("text/csv", "csv"),
+    "ndjson": ("application/x-ndjson", "ndjson"),
+    "arrow": ("application/vnd.apache.arrow.stream", "arrows"),
+}
+
+# End-of-stream marker of the Arrow IPC streaming format
+ARROW_EOS = b"\xff\xff\xff\xff\x00\x00\x00\x00"
+
+
+def _json_default(value):
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def _csv_chunk(rows) -> bytes:
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rows)
+    return buffer.getvalue().encode()
+
+
+def _ndjson_chunk(names, rows) -> bytes:
+    return "".join(json.dumps(dict(zip(names, row)), default=_json_default) + "\n" for row in rows).encode()
+
+
+def export_rows(conditions, columns, fmt: str):
+    """
+    Stream `columns` of the sales_fact rows matching `conditions` as encoded
+    chunks. Rows come from a server-side cursor (yield_per), so memory stays
+    bounded by EXPORT_CHUNK_ROWS and the first chunk is sent as soon as the
+    database returns it. Opens its own session because the response outlives
+    the request's dependencies.
+    """
+    names = [c.name for c in columns]
+    stmt = (
+        select(*columns)
+        .where(*conditions)
+        .order_by(SalesFact.date, SalesFact.store_id, SalesFact.sku_id)
+        .execution_options(yield_per=EXPORT_CHUNK_ROWS)
+    )
+
+    if fmt == "csv":
+        yield _csv_chunk([names])
+    elif fmt == "arrow":
+        schema = pa.schema([(c.name, arrow_type(c.type)) for c in columns])
+        yield schema.serialize().to_pybytes()
+
+    db = SessionLocal()
+    try:
+        for partition in db.execute(stmt).partitions():
+            if fmt == "csv":
+                yield _csv_chunk(partition)
+            elif fmt == "ndjson":
+                yield _ndjson_chunk(names, partition)
+            else:
+                batch = pa.record_batch(
+                    [pa.array(plain_values(values), type=field.type)
+                     for values, field in zip(zip(*partition), schema)],
+                    schema=schema,
+                )
+                yield batch.serialize().to_pybytes()
+    finally:
+        db.close()
+
+    if fmt == "arrow":
+        yield ARROW_EOS
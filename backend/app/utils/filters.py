@@ -0,0 +1,19 @@
+from sqlalchemy import func
+from ..model.sales_fact import SalesFact
+
+
+def sales_filters(country: str = "all", year: str = "all", month: str = "all"):
+    """
+    Build the country/year/month conditions shared by the dashboard endpoints.
+    A value of "all" means no filter on that field.
+    """
+    conditions = []
+
+    if country != "all":
+        conditions.append(SalesFact.country == country)
+    if year != "all":
+        conditions.append(func.extract("year", SalesFact.date) == int(year))
+    if month != "all":
+        conditions.append(func.extract("month", SalesFact.date) == int(month))
+
+    return conditions
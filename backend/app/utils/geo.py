@@ -0,0 +1,100 @@
+import os
+import numpy as np
+
+# Cluster cell edge in screen pixels of 256 px Web Mercator tiles, so a cell
+# covers the same screen area at every zoom
+CLUSTER_CELL_PX = int(os.getenv("CLUSTER_CELL_PX", 64))
+# Above this zoom stores are no longer merged
+CLUSTER_MAX_ZOOM = int(os.getenv("CLUSTER_MAX_ZOOM", 16))
+# Upper bound on features per response; coarser cells are used beyond it
+CLUSTER_MAX_FEATURES = int(os.getenv("CLUSTER_MAX_FEATURES", 2000))
+
+# Web Mercator is undefined at the poles
+MAX_LATITUDE = 85.05112878
+
+BBOX_PATTERN = r"^-?\d+(\.\d+)?(,-?\d+(\.\d+)?){3}$"
+
+
+def mercator(lon: np.ndarray, lat: np.ndarray):
+    """Longitude/latitude to Web Mercator x/y in [0, 1), y growing southwards."""
+    lat = np.radians(np.clip(lat, -MAX_LATITUDE, MAX_LATITUDE))
+    x = (lon + 180.0) / 360.0
+    y = (1.0 - np.log(np.tan(lat) + 1.0 / np.cos(lat)) / np.pi) / 2.0
+    return x, y
+
+
+def grid_cells(lon: np.ndarray, lat: np.ndarray, zoom: int):
+    """Column and row of each point in the zoom's grid of CLUSTER_CELL_PX cells."""
+    cells = (2 ** zoom) * 256 // CLUSTER_CELL_PX
+    x, y = mercator(lon, lat)
+    column = np.clip((x * cells).astype(np.int64), 0, cells - 1)
+    row = np.clip((y * cells).astype(np.int64), 0, cells - 1)
+    return column, row, cells
+
+
+def cluster_points(stores: dict, zoom: int) -> dict:
+    """
+    Merge stores falling in the same grid cell. `stores` holds equal-length
+    lists: store_id, longitude, latitude, net_sales, stock_out_count and
+    total_count. Returns columnar clusters positioned at the mean of their
+    stores, with summed sales and stock-outs.
+    """
+    lon = np.asarray(stores["longitude"], dtype=np.float64)
+    lat = np.asarray(stores["latitude"], dtype=np.float64)
+    if len(lon) == 0:
+        return {name: [] for name in ["cell", "longitude", "latitude", "stores", "store_id",
+                                      "net_sales", "stock_out_count", "total_count"]}
+
+    column, row, cells = grid_cells(lon, lat, zoom)
+    cell_ids, index = np.unique(row * cells + column, return_inverse=True)
+    count = np.bincount(index)
+
+    def total(name):
+        return np.bincount(index, weights=np.asarray(stores[name], dtype=np.float64))
+
+    # The store id is kept for single-store clusters, so they can link to the store
+    member = np.empty(len(cell_ids), dtype=np.int64)
+    member[index] = np.arange(len(index))
+    store_ids = [stores["store_id"][i] if n == 1 else None for i, n in zip(member, count)]
+
+    return {
+        "cell": cell_ids.tolist(),
+        "longitude": np.round(np.bincount(index, weights=lon) / count, 6).tolist(),
+        "latitude": np.round(np.bincount(index, weights=lat) / count, 6).tolist(),
+        "stores": count.tolist(),
+        "store_id": store_ids,
+        "net_sales": np.round(total("net_sales"), 2).tolist(),
+        "stock_out_count": total("stock_out_count").astype(np.int64).tolist(),
+        "total_count": total("total_count").astype(np.int64).tolist(),
+    }
+
+
+def parse_bbox(bbox: str):
+    """"west,south,east,north" in degrees; west > east crosses the antimeridian."""
+    west, south, east, north = (float(v) for v in bbox.split(","))
+    if south > north:
+        raise ValueError("bbox south must not be above north")
+    return west, south, east, north
+
+
+def cell_bounds(cell_ids: list, zoom: int):
+    """West, south, east and north edges in degrees of grid cells numbered as by cluster_points."""
+    cells = (2 ** zoom) * 256 // CLUSTER_CELL_PX
+    cell_ids = np.asarray(cell_ids, dtype=np.int64)
+    row, column = np.divmod(cell_ids, cells)
+
+    def latitude(y):
+        return np.degrees(np.arctan(np.sinh(np.pi * (1.0 - 2.0 * y / cells))))
+
+    return column / cells * 360.0 - 180.0, latitude(row + 1), (column + 1) / cells * 360.0 - 180.0, latitude(row)
+
+
+def cells_in_bbox(cell_ids: list, zoom: int, bbox) -> np.ndarray:
+    """Mask of the grid cells overlapping the bbox, so clusters with any store in view are kept."""
+    west, south, east, north = bbox
+    cell_west, cell_south, cell_east, cell_north = cell_bounds(cell_ids, zoom)
+    if west <= east:
+        inside_lon = (cell_east >= west) & (cell_west <= east)
+    else:
+        inside_lon = (cell_east >= west) | (cell_west <= east)
+    return inside_lon & (cell_north >= south) & (cell_south <= north)
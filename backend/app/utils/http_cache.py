@@ -0,0 +1,115 @@
+import os
+import hashlib
+from pathlib import Path
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.responses import Response
+from .refresh import DATA_VERSION_KEY
+
+try:
+    from brotli_asgi import BrotliMiddleware
+except ImportError:  # optional: without it responses are only gzip-compressed
+    BrotliMiddleware = None
+
+# How long clients may reuse a response before revalidating it with If-None-Match
+HTTP_CACHE_MAX_AGE = int(os.getenv("HTTP_CACHE_MAX_AGE", 0))
+# How often each worker re-reads the data version bumped by another worker
+DATA_VERSION_POLL_SECONDS = int(os.getenv("DATA_VERSION_POLL_SECONDS", 15))
+# Responses smaller than this are sent uncompressed
+COMPRESSION_MIN_BYTES = int(os.getenv("COMPRESSION_MIN_BYTES", 1024))
+
+def _source_hash() -> str:
+    """Hash of the app's Python source: changes with every deploy that can change a response."""
+    digest = hashlib.sha1()
+    for path in sorted(Path(__file__).resolve().parent.parent.rglob("*.py")):
+        digest.update(path.read_bytes())
+    return digest.hexdigest()[:10]
+
+
+# Part of every ETag, so a deploy that changes response shapes invalidates
+# what clients hold; defaults to a hash of the source
+APP_BUILD = os.getenv("APP_BUILD") or _source_hash()
+
+CACHE_CONTROL = f"public, max-age={HTTP_CACHE_MAX_AGE}, must-revalidate"
+
+# Not derived from sales data, so they change without an ingest
+UNVERSIONED_PATHS = {"/docs", "/docs/oauth2-redirect", "/redoc", "/openapi.json", "/metrics", "/metrics/slow_queries"}
+# Job status and other admin responses change while they are polled
+UNVERSIONED_PREFIXES = ("/admin/",)
+
+
+class DataVersion:
+    """
+    In-process copy of the Redis data version, so conditional requests are
+    answered without a Redis round trip. Versioned cache keys carry it too.
+    Published by the cache warmer once the next version's entries are built
+    (bumped directly when warming after refresh is off) and re-read by every
+    worker every DATA_VERSION_POLL_SECONDS.
+    """
+
+    def __init__(self):
+        self.value = None
+
+    async def fetch(self, redis) -> str:
+        """The version in Redis, without adopting it."""
+        return str(await redis.get(DATA_VERSION_KEY) or 0)
+
+    async def sync(self, redis):
+        self.value = await self.fetch(redis)
+
+    async def bump(self, redis):
+        self.value = str(await redis.incr(DATA_VERSION_KEY))
+
+    async def publish(self, redis, value: str):
+        """Switch to a version whose cache entries were built beforehand."""
+        await redis.set(DATA_VERSION_KEY, value)
+        self.value = str(value)
+
+    @property
+    def etag(self):
+        # Weak: the same data may be sent gzip-, brotli- or un-compressed
+        return f'W/"{APP_BUILD}-{self.value}"' if self.value is not None else None
+
+
+current_data_version = DataVersion()
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """Weak comparison against an If-None-Match list such as `W/"ab12-3", W/"ab12-4"` or `*`."""
+    tags = [t.strip() for t in if_none_match.split(",")]
+    return "*" in tags or any(t.removeprefix("W/") == etag.removeprefix("W/") for t in tags)
+
+
+class ConditionalGetMiddleware:
+    """
+    Tag successful GET responses with the data version and answer a matching
+    If-None-Match with 304 before the endpoint touches Redis or Postgres.
+    Plain ASGI rather than @app.middleware, which would re-stream every body
+    and defeat the compression size threshold.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        etag = current_data_version.etag
+        if (
+            scope["type"] != "http"
+            or etag is None
+            or scope["method"] not in ("GET", "HEAD")
+            or scope["path"] in UNVERSIONED_PATHS
+            or scope["path"].startswith(UNVERSIONED_PREFIXES)
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        headers = {"ETag": etag, "Cache-Control": CACHE_CONTROL}
+        if etag_matches(Headers(scope=scope).get("if-none-match", ""), etag):
+            await Response(status_code=304, headers=headers)(scope, receive, send)
+            return
+
+        async def send_tagged(message):
+            if message["type"] == "http.response.start" and message["status"] == 200:
+                MutableHeaders(scope=message).update(headers)
+            await send(message)
+
+        await self.app(scope, receive, send_tagged)
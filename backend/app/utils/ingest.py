@@ -0,0 +1,279 @@
+import os
+import io
+import csv
+import time
+import logging
+import datetime
+from sqlalchemy import select, text, table, column, String, Numeric
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+from ..model.sales_fact import SalesFact
+from ..model.ingest_log import SalesIngest
+from .olap import arrow_type
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.csv as pa_csv
+    import pyarrow.parquet as pq
+except ImportError:  # optional: only ingest needs it
+    pa = None
+
+logger = logging.getLogger(__name__)
+
+# Bytes of CSV parsed, validated and copied per chunk
+INGEST_CSV_BLOCK_BYTES = int(os.getenv("INGEST_CSV_BLOCK_BYTES", 64 << 20))
+# Rows per chunk when reading Parquet
+INGEST_PARQUET_BATCH_ROWS = int(os.getenv("INGEST_PARQUET_BATCH_ROWS", 250_000))
+# Only files under this directory can be ingested
+INGEST_DIR = os.getenv("INGEST_DIR", "./data/ingest")
+
+COLUMNS = list(SalesFact.__table__.columns)
+NAMES = [c.name for c in COLUMNS]
+KEY = ["date", "store_id", "sku_id"]
+
+# Calendar columns filled in from `date` when the file does not have them
+DERIVED = {
+    "year": lambda d: pc.year(d),
+    "month": lambda d: pc.month(d),
+    "day": lambda d: pc.day(d),
+    "weekofyear": lambda d: pc.iso_week(d),
+    "weekday": lambda d: pc.day_of_week(d),
+    "is_weekend": lambda d: pc.greater_equal(pc.day_of_week(d), 5),
+}
+
+STAGE = "sales_fact_stage"
+stage = table(STAGE, *[column(n) for n in NAMES], column("_seq"))
+
+
+class IngestError(ValueError):
+    """The input file does not fit sales_fact; nothing from it is committed."""
+
+
+# ---------- reading and validation ----------
+
+def _read_chunks(path: str, fmt: str):
+    """Yield record batches of the sales_fact columns present in the file, typed as in sales_fact."""
+    types = {c.name: arrow_type(c.type) for c in COLUMNS}
+
+    if fmt == "csv":
+        with open(path, newline="") as f:
+            header = next(csv.reader(f), [])
+        present = [n for n in NAMES if n in header]
+        _check_columns(present)
+        try:
+            reader = pa_csv.open_csv(
+                path,
+                read_options=pa_csv.ReadOptions(block_size=INGEST_CSV_BLOCK_BYTES),
+                convert_options=pa_csv.ConvertOptions(
+                    column_types={n: types[n] for n in present},
+                    include_columns=present,
+                    strings_can_be_null=True,
+                ),
+            )
+            yield from reader
+        except pa.ArrowInvalid as e:
+            # pyarrow quotes the offending values, which stay in the log only
+            logger.warning(f"INGEST|CSV|INVALID|{str(e)}")
+            raise IngestError("CSV values do not parse as the sales_fact column types")
+    else:
+        parquet = pq.ParquetFile(path)
+        present = [n for n in NAMES if n in parquet.schema_arrow.names]
+        _check_columns(present)
+        yield from parquet.iter_batches(batch_size=INGEST_PARQUET_BATCH_ROWS, columns=present)
+
+
+def _check_columns(present: list):
+    missing = [
+        c.name for c in COLUMNS
+        if c.name not in present and not c.nullable and c.name not in DERIVED
+    ]
+    if missing:
+        raise IngestError(f"Missing required columns: {', '.join(missing)}")
+
+
+def validate_chunk(batch, chunk: int):
+    """
+    Cast a batch to the sales_fact column types and check NOT NULL, string
+    length and numeric precision, so bad rows are reported with their chunk
+    instead of failing deep inside COPY. Returns a table with every column.
+    """
+    columns = {}
+    for c in COLUMNS:
+        target = arrow_type(c.type)
+        if c.name in batch.schema.names:
+            try:
+                values = batch.column(c.name).cast(target, safe=True)
+            except (pa.ArrowInvalid, pa.ArrowNotImplementedError) as e:
+                logger.warning(f"INGEST|CHUNK={chunk}|COLUMN={c.name}|INVALID|{str(e)}")
+                raise IngestError(f"Chunk {chunk}: column {c.name} is not {target}")
+        elif c.name in DERIVED:
+            values = DERIVED[c.name](columns["date"]).cast(target)
+        else:
+            values = pa.nulls(batch.num_rows, type=target)
+
+        if not c.nullable and values.null_count:
+            raise IngestError(f"Chunk {chunk}: column {c.name} has {values.null_count} empty values")
+        if isinstance(c.type, String) and c.type.length and len(values) > values.null_count:
+            longest = pc.max(pc.utf8_length(values)).as_py()
+            if longest > c.type.length:
+                raise IngestError(f"Chunk {chunk}: column {c.name} has values longer than {c.type.length} characters")
+        if isinstance(c.type, Numeric) and c.type.precision and len(values) > values.null_count:
+            limit = 10 ** (c.type.precision - (c.type.scale or 0))
+            if pc.max(pc.abs(values)).as_py() >= limit:
+                raise IngestError(f"Chunk {chunk}: column {c.name} has values outside numeric({c.type.precision}, {c.type.scale})")
+        columns[c.name] = values
+
+    return pa.table(columns)
+
+
+# ---------- loading ----------
+
+def _months(start: datetime.date, end: datetime.date):
+    month = start.replace(day=1)
+    while month <= end:
+        following = (month + datetime.timedelta(days=32)).replace(day=1)
+        yield month, following
+        month = following
+
+
+def is_partitioned(db: Session) -> bool:
+    return db.execute(text(
+        "SELECT EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = 'sales_fact'::regclass)"
+    )).scalar()
+
+
+def ensure_partitions(db: Session, start: datetime.date, end: datetime.date):
+    """Create the monthly sales_fact partitions covering start..end that do not exist yet."""
+    for month, following in _months(start, end):
+        db.execute(text(
+            f"CREATE TABLE IF NOT EXISTS sales_fact_{month:%Y_%m} PARTITION OF sales_fact "
+            f"FOR VALUES FROM ('{month}') TO ('{following}')"
+        ))
+
+
+def _upsert_stage(db: Session):
+    """Move the staged chunk into sales_fact; within a chunk the last row per key wins."""
+    source = (
+        select(*[stage.c[n] for n in NAMES])
+        .distinct(*[stage.c[k] for k in KEY])
+        .order_by(*[stage.c[k] for k in KEY], stage.c._seq.desc())
+    )
+    stmt = insert(SalesFact).from_select(NAMES, source)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=KEY,
+        set_={n: stmt.excluded[n] for n in NAMES if n not in KEY},
+    )
+    db.execute(stmt)
+    db.execute(text(f"TRUNCATE {STAGE}"))
+
+
+def resolve_ingest_path(path: str) -> str:
+    """
+    The real path of a file under INGEST_DIR, relative paths being taken from
+    there. Anything else, symlinks pointing out of it included, is rejected
+    with the same error whether or not it exists.
+    """
+    root = os.path.realpath(INGEST_DIR)
+    resolved = os.path.realpath(os.path.join(root, path))
+    if os.path.commonpath([root, resolved]) != root or not os.path.isfile(resolved):
+        raise IngestError("path must name a file under INGEST_DIR")
+    return resolved
+
+
+def ingest_file(db: Session, path: str, fmt: str = None, progress: dict = None) -> dict:
+    """
+    Stream a CSV or Parquet file into sales_fact. Each chunk is validated,
+    written to a temporary staging table with COPY FROM STDIN and upserted on
+    (date, store_id, sku_id), so memory stays bounded by one chunk. Monthly
+    partitions are created as needed when sales_fact is partitioned. The
+    caller commits; returns the sales_ingest id, row counts and the loaded
+    date range. `path` must come from resolve_ingest_path(); rows and chunks
+    loaded so far are kept in `progress` when given.
+    """
+    if pa is None:
+        raise IngestError("Ingest needs pyarrow installed")
+    fmt = fmt or os.path.splitext(path)[1].lstrip(".").lower()
+    if fmt not in ("csv", "parquet"):
+        raise IngestError(f"Unsupported format: {fmt}")
+    if not os.path.exists(path):
+        raise IngestError(f"File not found: {path}")
+
+    started = time.perf_counter()
+    SalesFact.__table__.create(db.connection(), checkfirst=True)
+    SalesIngest.__table__.create(db.connection(), checkfirst=True)
+    partitioned = is_partitioned(db)
+
+    db.execute(text(
+        f"CREATE TEMP TABLE IF NOT EXISTS {STAGE} (LIKE sales_fact INCLUDING DEFAULTS, _seq bigserial) ON COMMIT DROP"
+    ))
+    cursor = db.connection().connection.cursor()
+    copy_sql = f"COPY {STAGE} ({', '.join(NAMES)}) FROM STDIN WITH (FORMAT csv)"
+
+    rows, chunks = 0, 0
+    start_date = end_date = None
+    for chunks, batch in enumerate(_read_chunks(path, fmt), start=1):
+        if batch.num_rows == 0:
+            continue
+        chunk = validate_chunk(batch, chunks)
+
+        low, high = pc.min_max(chunk.column("date")).values()
+        low, high = low.as_py(), high.as_py()
+        if partitioned:
+            ensure_partitions(db, low, high)
+        start_date = min(start_date or low, low)
+        end_date = max(end_date or high, high)
+
+        buffer = io.BytesIO()
+        pa_csv.write_csv(chunk, buffer, write_options=pa_csv.WriteOptions(include_header=False))
+        buffer.seek(0)
+        cursor.copy_expert(copy_sql, buffer)
+        _upsert_stage(db)
+
+        rows += chunk.num_rows
+        if progress is not None:
+            progress.update(rows=rows, chunks=chunks)
+        logger.info(f"INGEST|CHUNK={chunks}|ROWS={chunk.num_rows}|TOTAL={rows}")
+
+    ingest_id = None
+    if rows:
+        ingest_id = db.execute(insert(SalesIngest).values(
+            created_at=datetime.datetime.utcnow(),
+            path=path,
+            rows=rows,
+            start_date=start_date,
+            end_date=end_date,
+        ).returning(SalesIngest.ingest_id)).scalar()
+
+    seconds = round(time.perf_counter() - started, 2)
+    logger.info(f"INGEST|COMPLETE|PATH={path}|ROWS={rows}|SECONDS={seconds}")
+    return {
+        "ingest_id": ingest_id,
+        "rows": rows,
+        "chunks": chunks,
+        "start_date": start_date,
+        "end_date": end_date,
+        "partitioned": partitioned,
+        "seconds": seconds,
+    }
+
+
+def partition_sales_fact(db: Session):
+    """
+    One-off migration of an existing plain sales_fact into a table
+    range-partitioned by month on `date`, keeping its columns, defaults,
+    indexes and rows. The caller commits.
+    """
+    if is_partitioned(db):
+        return
+    bounds = db.execute(text("SELECT min(date), max(date) FROM sales_fact")).one()
+
+    db.execute(text("ALTER TABLE sales_fact RENAME TO sales_fact_unpartitioned"))
+    db.execute(text(
+        "CREATE TABLE sales_fact (LIKE sales_fact_unpartitioned INCLUDING ALL) PARTITION BY RANGE (date)"
+    ))
+    if bounds[0] is not None:
+        ensure_partitions(db, bounds[0], bounds[1])
+        db.execute(text(f"INSERT INTO sales_fact ({', '.join(NAMES)}) SELECT {', '.join(NAMES)} FROM sales_fact_unpartitioned"))
+    db.execute(text("DROP TABLE sales_fact_unpartitioned"))
+    logger.info(f"INGEST|PARTITIONED|FROM={bounds[0]}|TO={bounds[1]}")
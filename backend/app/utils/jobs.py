@@ -0,0 +1,58 @@
+import time
+import uuid
+import asyncio
+import logging
+import datetime
+
+logger = logging.getLogger(__name__)
+
+
+class BackgroundJob:
+    """
+    A long admin task run outside the request that started it, one run at a
+    time per worker. `status` is what the matching GET endpoint reports:
+    the job updates it with its progress, and its result is merged in when
+    it finishes. Each run gets a `job_id`.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.status = {"state": "idle"}
+        self.task = None
+
+    @property
+    def running(self) -> bool:
+        return self.task is not None and not self.task.done()
+
+    def start(self, job, **params) -> bool:
+        """
+        Run `job(status, **params)`, a coroutine function returning a dict,
+        in the background; False when a run is already in progress here.
+        """
+        if self.running:
+            return False
+        self.status = {
+            "job_id": uuid.uuid4().hex,
+            "state": "running",
+            "params": params,
+            "started_at": datetime.datetime.utcnow().isoformat(),
+        }
+        self.task = asyncio.create_task(self._run(job, params))
+        return True
+
+    async def _run(self, job, params: dict):
+        started = time.perf_counter()
+        logger.info(f"JOB|{self.name}|START|PARAMS={params}")
+        try:
+            result = await job(self.status, **params)
+        except Exception as e:
+            logger.error(f"JOB|{self.name}|FAILED|{str(e)}")
+            self.status.update(state="failed", error=str(e), seconds=round(time.perf_counter() - started, 1))
+            return
+        self.status.update(result or {})
+        self.status.update(state="finished", seconds=round(time.perf_counter() - started, 1))
+        logger.info(f"JOB|{self.name}|COMPLETE|SECONDS={self.status['seconds']}")
+
+    def cancel(self):
+        if self.running:
+            self.task.cancel()
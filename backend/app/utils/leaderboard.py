@@ -0,0 +1,138 @@
+import os
+import datetime
+from sqlalchemy import select, func, delete, literal
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+from ..model.sales_fact import SalesFact
+from ..model.leaderboard import SkuStoreMonth, SkuLeaderboard
+
+# SKUs kept per (country, year, month); also the largest /sku/top limit
+SKU_LEADERBOARD_SIZE = int(os.getenv("SKU_LEADERBOARD_SIZE", 100))
+
+RANKED_COLUMNS = ["sku_id", "store_id", "units_sold", "stock_opening", "lead_time_days", "net_sales"]
+
+
+def _months(start_date: datetime.date, end_date: datetime.date):
+    month = start_date.replace(day=1)
+    while month <= end_date:
+        yield month.year, month.month
+        month = (month + datetime.timedelta(days=32)).replace(day=1)
+
+
+def refresh_sku_store_month(db: Session, start_date=None, end_date=None):
+    """
+    Recompute units per SKU-store for every month touched by the date range
+    (the whole table when no range is given), keeping the stock position and
+    net sales of the last day in the month.
+    """
+    conditions = []
+    if start_date is not None:
+        conditions.append(SalesFact.date >= start_date.replace(day=1))
+    if end_date is not None:
+        following = (end_date.replace(day=1) + datetime.timedelta(days=32)).replace(day=1)
+        conditions.append(SalesFact.date < following)
+
+    group = [SalesFact.year, SalesFact.month, SalesFact.sku_id, SalesFact.store_id]
+    source = (
+        select(
+            *group,
+            SalesFact.country,
+            func.sum(SalesFact.units_sold).over(partition_by=group),
+            SalesFact.date,
+            SalesFact.stock_opening,
+            SalesFact.lead_time_days,
+            SalesFact.net_sales,
+        )
+        .distinct(*group)
+        .where(*conditions)
+        .order_by(*group, SalesFact.date.desc())
+    )
+
+    columns = ["year", "month", "sku_id", "store_id", "country",
+               "units_sold", "last_date", "stock_opening", "lead_time_days", "net_sales"]
+    stmt = insert(SkuStoreMonth).from_select(columns, source)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=columns[:4],
+        set_={c: stmt.excluded[c] for c in columns[4:]},
+    )
+    db.execute(stmt)
+
+
+def _rank(db: Session, per_store, year: int, month: int, by_country: bool):
+    """Insert the top SKUs of one grain, each with its best-selling store."""
+    key = [per_store.c.country] if by_country else []
+    top_store = (
+        select(per_store)
+        .distinct(*key, per_store.c.sku_id)
+        .where(*[c.isnot(None) for c in key])
+        .order_by(*key, per_store.c.sku_id, per_store.c.units_sold.desc(), per_store.c.store_id)
+        .subquery("top_store")
+    )
+    rank = func.row_number().over(
+        partition_by=top_store.c.country if by_country else None,
+        order_by=[top_store.c.units_sold.desc(), top_store.c.sku_id],
+    )
+    ranked = select(
+        top_store.c.country if by_country else literal("all").label("country"),
+        rank.label("rank"),
+        *[top_store.c[c] for c in RANKED_COLUMNS],
+    ).subquery("ranked")
+
+    source = select(
+        ranked.c.country,
+        literal(year),
+        literal(month),
+        ranked.c.rank,
+        *[ranked.c[c] for c in RANKED_COLUMNS],
+    ).where(ranked.c.rank <= SKU_LEADERBOARD_SIZE)
+    db.execute(insert(SkuLeaderboard).from_select(
+        ["country", "year", "month", "rank", *RANKED_COLUMNS], source
+    ))
+
+
+def _rank_grain(db: Session, year: int, month: int):
+    conditions = []
+    if year:
+        conditions.append(SkuStoreMonth.year == year)
+    if month:
+        conditions.append(SkuStoreMonth.month == month)
+
+    pair = [SkuStoreMonth.sku_id, SkuStoreMonth.store_id]
+    per_store = (
+        select(
+            *pair,
+            SkuStoreMonth.country,
+            func.sum(SkuStoreMonth.units_sold).over(partition_by=pair).label("units_sold"),
+            SkuStoreMonth.stock_opening,
+            SkuStoreMonth.lead_time_days,
+            SkuStoreMonth.net_sales,
+        )
+        .distinct(*pair)
+        .where(*conditions)
+        .order_by(*pair, SkuStoreMonth.year.desc(), SkuStoreMonth.month.desc())
+        .subquery("per_store")
+    )
+
+    db.execute(delete(SkuLeaderboard).where(SkuLeaderboard.year == year, SkuLeaderboard.month == month))
+    _rank(db, per_store, year, month, by_country=True)
+    _rank(db, per_store, year, month, by_country=False)
+
+
+def refresh_sku_leaderboard(db: Session, start_date=None, end_date=None):
+    """
+    Bring sku_store_month up to date for the date range, then re-rank every
+    leaderboard grain whose period contains one of the touched months: the
+    month itself, its year, the same month across years and all time.
+    """
+    refresh_sku_store_month(db, start_date, end_date)
+
+    if start_date is not None and end_date is not None:
+        touched = set(_months(start_date, end_date))
+    else:
+        touched = set(db.execute(select(SkuStoreMonth.year, SkuStoreMonth.month).distinct()).all())
+
+    grains = set()
+    for year, month in touched:
+        grains.update({(year, month), (year, 0), (0, month), (0, 0)})
+    for year, month in sorted(grains):
+        _rank_grain(db, year, month)
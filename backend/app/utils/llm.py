@@ -0,0 +1,76 @@
+import os
+import json
+import hashlib
+from google import genai
+from google.genai import types
+
+GEMINI_API_KEY = os.getenv('GEMINI_API_KEY')
+LLM_MODEL = os.getenv("LLM_MODEL", "gemini-2.5-flash")
+# Override the Gemini API endpoint, e.g. a local fake server in tests
+LLM_BASE_URL = os.getenv("LLM_BASE_URL")
+LLM_TIMEOUT_MS = int(os.getenv("LLM_TIMEOUT_MS", 60_000))
+
+# Keep proxies (nginx) from buffering server-sent events
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+
+class GeminiClient:
+    """
+    Application-lifetime async Gemini client. Endpoints depend on get_llm()
+    rather than this class, so tests can swap in any object with the same
+    `generate`/`stream` methods via app.dependency_overrides, or point
+    LLM_BASE_URL at a fake server.
+    """
+
+    def __init__(self, api_key: str = GEMINI_API_KEY, model: str = LLM_MODEL,
+                 base_url: str = LLM_BASE_URL, timeout_ms: int = LLM_TIMEOUT_MS):
+        self.api_key = api_key
+        self.model = model
+        self.base_url = base_url
+        self.timeout_ms = timeout_ms
+        self._client = None
+
+    @property
+    def client(self) -> genai.Client:
+        # Created on first use so the app starts without an API key
+        if self._client is None:
+            self._client = genai.Client(
+                api_key=self.api_key,
+                http_options=types.HttpOptions(base_url=self.base_url, timeout=self.timeout_ms),
+            )
+        return self._client
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aio.aclose()
+            self._client = None
+
+    async def generate(self, contents) -> str:
+        """`contents` is a prompt string or a list of Gemini content dicts."""
+        response = await self.client.aio.models.generate_content(model=self.model, contents=contents)
+        return response.text or ""
+
+    async def stream(self, contents):
+        """Yield the response text chunk by chunk as Gemini produces it."""
+        chunks = await self.client.aio.models.generate_content_stream(model=self.model, contents=contents)
+        async for chunk in chunks:
+            if chunk.text:
+                yield chunk.text
+
+
+gemini_client = GeminiClient()
+
+
+def get_llm() -> GeminiClient:
+    return gemini_client
+
+
+def content_hash(payload) -> str:
+    """Stable hash of a JSON-serializable payload, independent of key order."""
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def sse_event(data: dict, event: str = None) -> str:
+    """One server-sent event frame."""
+    frame = f"event: {event}\n" if event else ""
+    return frame + f"data: {json.dumps(data)}\n\n"
@@ -0,0 +1,246 @@
+import os
+import re
+import time
+import logging
+import threading
+import contextvars
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy import event
+from prometheus_client import (
+    Counter, Histogram, CollectorRegistry, REGISTRY, generate_latest, multiprocess,
+    CONTENT_TYPE_LATEST,
+)
+from .tracing import tracer
+from .cache import skip_cache_reads, cache_version, VERSIONED_PREFIXES, CACHE_ENTRY_TTL
+
+logger = logging.getLogger(__name__)
+
+# Statements slower than this are logged and get an EXPLAIN (ANALYZE, BUFFERS)
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", 500))
+# At most one EXPLAIN per distinct statement in this window, so a slow
+# endpoint under load does not run every query twice
+SLOW_QUERY_EXPLAIN_INTERVAL = int(os.getenv("SLOW_QUERY_EXPLAIN_INTERVAL", 600))
+# Plans kept in memory for GET /metrics/slow_queries
+SLOW_QUERY_KEEP = int(os.getenv("SLOW_QUERY_KEEP", 50))
+
+# Set with several workers so /metrics aggregates all of them
+PROMETHEUS_MULTIPROC_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+
+CONTENT_TYPE = CONTENT_TYPE_LATEST
+
+HTTP_REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds", "HTTP request latency by route",
+    ["method", "route", "status"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
+DB_QUERY_SECONDS = Histogram(
+    "db_query_duration_seconds", "SQL statement latency by engine, route and operation",
+    ["engine", "route", "operation"],
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+DB_QUERY_ROWS = Histogram(
+    "db_query_rows", "Rows returned or affected per SQL statement",
+    ["engine", "route", "operation"],
+    buckets=(0, 1, 10, 100, 1_000, 10_000, 100_000, 1_000_000),
+)
+DB_SLOW_QUERIES = Counter(
+    "db_slow_queries", "SQL statements slower than SLOW_QUERY_MS",
+    ["engine", "route"],
+)
+CACHE_REQUESTS = Counter(
+    "cache_requests", "Redis cache lookups by key prefix and result",
+    ["prefix", "result"],
+)
+
+# The ASGI scope of the request being served; the router adds the matched
+# route to it, and threadpool endpoints inherit it with the context
+_current_scope = contextvars.ContextVar("current_scope", default=None)
+
+_slow_queries = deque(maxlen=SLOW_QUERY_KEEP)
+_explained_at = {}
+_explain_lock = threading.Lock()
+# One background connection for EXPLAIN, so it never competes with requests
+_explain_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="explain")
+
+
+def current_route() -> str:
+    scope = _current_scope.get()
+    if scope is None:
+        return "background"
+    route = scope.get("route")
+    return getattr(route, "path", "unmatched")
+
+
+def _operation(statement: str) -> str:
+    word = statement.lstrip().split(None, 1)
+    return word[0].lower() if word else "unknown"
+
+
+def _fingerprint(statement: str) -> str:
+    """Statement shape without literals, for rate-limiting EXPLAIN."""
+    return re.sub(r"\s+", " ", re.sub(r"'[^']*'|\b\d+\b", "?", statement)).strip()
+
+
+# ---------- SQL ----------
+
+def instrument_engine(engine, name: str):
+    """Record latency and row counts of every statement run on `engine`."""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_started"].pop()
+        operation, route = _operation(statement), current_route()
+
+        DB_QUERY_SECONDS.labels(name, route, operation).observe(elapsed)
+        if cursor.rowcount is not None and cursor.rowcount >= 0:
+            DB_QUERY_ROWS.labels(name, route, operation).observe(cursor.rowcount)
+
+        if elapsed * 1000 >= SLOW_QUERY_MS:
+            DB_SLOW_QUERIES.labels(name, route).inc()
+            logger.warning(f"DB|SLOW|ENGINE={name}|ROUTE={route}|MS={elapsed * 1000:.0f}|ROWS={cursor.rowcount}|SQL={statement}")
+            # Only plain reads are re-run; EXPLAIN ANALYZE executes the statement
+            if operation in ("select", "with") and not executemany:
+                _schedule_explain(conn.engine, name, route, elapsed, _literal_sql(cursor, statement, parameters))
+
+
+def _literal_sql(cursor, statement, parameters) -> str:
+    # psycopg2 renders the exact statement the server ran
+    if hasattr(cursor, "mogrify"):
+        sql = cursor.mogrify(statement, parameters)
+        return sql.decode() if isinstance(sql, bytes) else sql
+    return statement
+
+
+def _schedule_explain(engine, name: str, route: str, elapsed: float, sql: str):
+    fingerprint = _fingerprint(sql)
+    now = time.monotonic()
+    with _explain_lock:
+        if now - _explained_at.get(fingerprint, -SLOW_QUERY_EXPLAIN_INTERVAL) < SLOW_QUERY_EXPLAIN_INTERVAL:
+            return
+        _explained_at[fingerprint] = now
+    _explain_pool.submit(_explain, engine, name, route, elapsed, sql)
+
+
+def _explain(engine, name: str, route: str, elapsed: float, sql: str):
+    try:
+        with engine.connect() as conn:
+            # Read-only, so a misclassified statement can never write twice
+            conn.exec_driver_sql("SET TRANSACTION READ ONLY")
+            rows = conn.exec_driver_sql(f"EXPLAIN (ANALYZE, BUFFERS) {sql}").all()
+            conn.rollback()
+    except Exception as e:
+        logger.error(f"DB|EXPLAIN|FAILED|{str(e)}")
+        return
+
+    plan = "\n".join(r[0] for r in rows)
+    _slow_queries.appendleft({
+        "engine": name,
+        "route": route,
+        "ms": round(elapsed * 1000, 1),
+        "at": time.time(),
+        "sql": sql,
+        "plan": plan,
+    })
+    logger.warning(f"DB|EXPLAIN|ENGINE={name}|ROUTE={route}\n{plan}")
+
+
+def slow_queries() -> list:
+    """Most recent slow statements with their EXPLAIN (ANALYZE, BUFFERS) output."""
+    return list(_slow_queries)
+
+
+# ---------- Redis ----------
+
+class InstrumentedRedis:
+    """
+    Counts and traces hits and misses of `get` per key prefix; everything else
+    passes through. Keys of VERSIONED_PREFIXES are stored under the data
+    version from `version()` (or the one the cache warmer is building) and
+    expire after CACHE_ENTRY_TTL; while the version is unknown they are
+    neither read nor written. Reads are skipped while the cache warmer
+    refreshes entries.
+    """
+
+    def __init__(self, client, version=lambda: None):
+        self._client = client
+        self._version = version
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+    def _key(self, key: str):
+        if key.split(":", 1)[0] not in VERSIONED_PREFIXES:
+            return key
+        version = cache_version.get() or self._version()
+        return f"v{version}:{key}" if version is not None else None
+
+    async def get(self, key: str):
+        prefix = key.split(":", 1)[0]
+        if skip_cache_reads.get():
+            CACHE_REQUESTS.labels(prefix, "skipped").inc()
+            return None
+        key = self._key(key)
+        if key is None:
+            CACHE_REQUESTS.labels(prefix, "miss").inc()
+            return None
+        with tracer.start_as_current_span("cache.get", attributes={"cache.prefix": prefix}) as span:
+            value = await self._client.get(key)
+            span.set_attribute("cache.hit", bool(value))
+        CACHE_REQUESTS.labels(prefix, "hit" if value else "miss").inc()
+        return value
+
+    async def set(self, key: str, value, **kwargs):
+        versioned = self._key(key)
+        if versioned is None:
+            return None
+        if versioned != key:
+            kwargs.setdefault("ex", CACHE_ENTRY_TTL)
+        return await self._client.set(versioned, value, **kwargs)
+
+    async def delete(self, *keys):
+        keys = [k for k in map(self._key, keys) if k is not None]
+        return await self._client.delete(*keys) if keys else 0
+
+
+# ---------- HTTP ----------
+
+class MetricsMiddleware:
+    """Per-route latency histogram; also makes the route visible to the SQL hooks."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = [500]
+
+        async def send_status(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        token = _current_scope.set(scope)
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_status)
+        finally:
+            route = getattr(scope.get("route"), "path", "unmatched")
+            HTTP_REQUEST_SECONDS.labels(scope["method"], route, str(status[0])).observe(time.perf_counter() - started)
+            _current_scope.reset(token)
+
+
+def render_metrics() -> bytes:
+    """Every metric in the Prometheus text exposition format."""
+    if PROMETHEUS_MULTIPROC_DIR:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry)
+    return generate_latest(REGISTRY)
@@ -0,0 +1,221 @@
+import os
+import json
+import time
+import logging
+import datetime
+from collections import namedtuple
+from decimal import Decimal
+from sqlalchemy import select, func, Integer, Numeric, Boolean, Date
+from sqlalchemy.orm import Session
+from ..model.sales_fact import SalesFact
+from ..model.dimensions import DimCalendar
+from ..model.ingest_log import SalesIngest
+
+# Optional: without them every query stays on Postgres
+try:
+    import duckdb
+except ImportError:
+    duckdb = None
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+logger = logging.getLogger(__name__)
+
+# "duckdb" serves the heavy analytics endpoints from a Parquet snapshot
+OLAP_ENGINE = os.getenv("OLAP_ENGINE", "postgres")
+PARQUET_DIR = os.getenv("PARQUET_DIR", "./data/parquet/sales_fact")
+OLAP_EXPORT_CHUNK = int(os.getenv("OLAP_EXPORT_CHUNK", 100_000))
+# How long a freshness check against Postgres is trusted
+OLAP_FRESHNESS_TTL = int(os.getenv("OLAP_FRESHNESS_TTL", 60))
+
+MANIFEST = "_manifest.json"
+
+# year/month come from the hive partition path instead of the file contents
+EXPORT_COLUMNS = [c for c in SalesFact.__table__.columns if c.name not in ("year", "month")]
+
+
+class ParquetSnapshot:
+    """
+    Date-partitioned Parquet copy of sales_fact (year=YYYY/month=M/data.parquet)
+    queried with an embedded DuckDB. A snapshot is only used while it covers
+    every day present in Postgres and every ingest up to the latest one, so
+    corrections to days already loaded count too; otherwise callers fall
+    back to Postgres.
+    """
+
+    def __init__(self, root: str = PARQUET_DIR):
+        self.root = root
+        self._fresh = False
+        self._checked_at = 0.0
+
+    @property
+    def enabled(self) -> bool:
+        return OLAP_ENGINE == "duckdb" and duckdb is not None and pa is not None
+
+    def manifest(self) -> dict:
+        try:
+            with open(os.path.join(self.root, MANIFEST)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def is_fresh(self, db: Session) -> bool:
+        if not self.enabled:
+            return False
+
+        now = time.monotonic()
+        if now - self._checked_at < OLAP_FRESHNESS_TTL:
+            return self._fresh
+
+        manifest = self.manifest()
+        snapshot_max = manifest.get("max_date")
+        db_max = db.query(func.max(DimCalendar.date)).scalar()
+        self._fresh = (
+            snapshot_max is not None and db_max is not None and snapshot_max >= db_max.isoformat()
+            and manifest.get("ingest_id") == latest_ingest(db)
+        )
+        self._checked_at = now
+        return self._fresh
+
+    # ---------- export ----------
+
+    def export(self, db: Session, start_date=None, end_date=None) -> int:
+        """
+        Rewrite the monthly partitions overlapping the date range (all of
+        them when no range is given), widened to the days of every ingest
+        since the last export, including ones loaded without a refresh.
+        Each file is written to a temporary path and renamed, so readers
+        never see a partial partition.
+        """
+        if not self.enabled:
+            return 0
+
+        manifest = self.manifest()
+        # Read first: an ingest committed while exporting leaves the snapshot stale
+        ingest_id = latest_ingest(db)
+        if start_date is not None and end_date is not None:
+            pending_start, pending_end = db.query(
+                func.min(SalesIngest.start_date), func.max(SalesIngest.end_date)
+            ).filter(SalesIngest.ingest_id > (manifest.get("ingest_id") or 0)).one()
+            if pending_start is not None:
+                start_date = min(start_date, pending_start)
+                end_date = max(end_date, pending_end)
+
+        months = db.query(DimCalendar.year, DimCalendar.month).distinct()
+        if start_date is not None:
+            months = months.filter(DimCalendar.date >= start_date.replace(day=1))
+        if end_date is not None:
+            months = months.filter(DimCalendar.date <= end_date)
+
+        schema = pa.schema([(c.name, arrow_type(c.type)) for c in EXPORT_COLUMNS])
+        exported = 0
+
+        months = months.order_by(DimCalendar.year, DimCalendar.month).all()
+        for year, month in months:
+            exported += self._export_month(db, schema, year, month)
+
+        db_max = db.query(func.max(DimCalendar.date)).scalar()
+        manifest.update({
+            "max_date": db_max.isoformat() if db_max else None,
+            "ingest_id": ingest_id,
+            "exported_at": datetime.datetime.utcnow().isoformat(),
+        })
+        os.makedirs(self.root, exist_ok=True)
+        with open(os.path.join(self.root, MANIFEST), "w") as f:
+            json.dump(manifest, f)
+
+        self._checked_at = 0.0
+        logger.info(f"OLAP|EXPORT|ROWS={exported}|MONTHS={len(months)}")
+        return exported
+
+    def _export_month(self, db: Session, schema, year: int, month: int) -> int:
+        first = datetime.date(year, month, 1)
+        after = datetime.date(year + month // 12, month % 12 + 1, 1)
+
+        stmt = (
+            select(*EXPORT_COLUMNS)
+            .where(SalesFact.date >= first, SalesFact.date < after)
+            .execution_options(yield_per=OLAP_EXPORT_CHUNK)
+        )
+
+        directory = os.path.join(self.root, f"year={year}", f"month={month}")
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, "data.parquet")
+        tmp_path = path + ".tmp"
+
+        rows = 0
+        with pq.ParquetWriter(tmp_path, schema) as writer:
+            for partition in db.execute(stmt).partitions():
+                columns = list(zip(*partition))
+                writer.write_table(pa.table(
+                    [pa.array(plain_values(values), type=field.type) for values, field in zip(columns, schema)],
+                    schema=schema,
+                ))
+                rows += len(partition)
+
+        os.replace(tmp_path, path)
+        return rows
+
+    # ---------- query ----------
+
+    def query(self, sql: str, params=()) -> list:
+        """
+        Run DuckDB SQL against a `sales_fact` view over the snapshot and
+        return rows with attribute access, like SQLAlchemy rows.
+        """
+        con = duckdb.connect()
+        try:
+            pattern = os.path.join(self.root, "**", "*.parquet").replace("'", "''")
+            con.execute(
+                f"CREATE VIEW sales_fact AS SELECT * FROM read_parquet('{pattern}', hive_partitioning = true)"
+            )
+            cursor = con.execute(sql, list(params))
+            Row = namedtuple("Row", [d[0] for d in cursor.description])
+            return [Row(*r) for r in cursor.fetchall()]
+        finally:
+            con.close()
+
+
+def latest_ingest(db: Session):
+    """Id of the last file loaded into sales_fact, None before the first one."""
+    return db.query(func.max(SalesIngest.ingest_id)).scalar()
+
+
+def olap_filters(country: str = "all", year: str = "all", month: str = "all"):
+    """
+    DuckDB equivalent of utils.filters.sales_filters. Year and month filter
+    on the partition columns so untouched partitions are never read.
+    """
+    conditions, params = ["TRUE"], []
+    if country != "all":
+        conditions.append("country = ?")
+        params.append(country)
+    if year != "all":
+        conditions.append("year = ?")
+        params.append(int(year))
+    if month != "all":
+        conditions.append("month = ?")
+        params.append(int(month))
+    return " AND ".join(conditions), params
+
+
+def arrow_type(column_type):
+    if isinstance(column_type, Numeric):
+        return pa.float64()
+    if isinstance(column_type, Integer):
+        return pa.int32()
+    if isinstance(column_type, Boolean):
+        return pa.bool_()
+    if isinstance(column_type, Date):
+        return pa.date32()
+    return pa.string()
+
+
+def plain_values(values):
+    return [float(v) if isinstance(v, Decimal) else v for v in values]
+
+
+parquet_snapshot = ParquetSnapshot()
@@ -0,0 +1,22 @@
+import base64
+import json
+
+
+def encode_cursor(*values) -> str:
+    """Encode the sort key of the last returned row into an opaque cursor."""
+    raw = json.dumps(list(values), separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, size: int) -> tuple:
+    """Decode a cursor produced by encode_cursor. Raises ValueError if malformed."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except Exception:
+        raise ValueError("Malformed cursor")
+
+    if not isinstance(values, list) or len(values) != size:
+        raise ValueError("Malformed cursor")
+
+    return tuple(values)
@@ -0,0 +1,146 @@
+import time
+from sqlalchemy import select, func
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session, aliased
+from ..model.sales_fact import SalesFact
+from ..model.dimensions import DimStore, DimSku, DimSupplier, DimCalendar
+from ..model.latest_inventory import LatestInventory
+from .olap import parquet_snapshot
+from .stock_alerts import run_stock_alerts
+from .leaderboard import refresh_sku_leaderboard
+
+# Trailing window for LatestInventory.avg_daily_sales
+ROLLING_WINDOW_DAYS = 28
+
+
+def _date_range(start_date=None, end_date=None):
+    conditions = []
+    if start_date is not None:
+        conditions.append(SalesFact.date >= start_date)
+    if end_date is not None:
+        conditions.append(SalesFact.date <= end_date)
+    return conditions
+
+
+def _upsert_latest(db: Session, model, key: str, attributes, start_date=None, end_date=None):
+    """
+    Upsert the latest attributes per `key` seen in sales_fact within the date range.
+    Rows already holding a newer last_date are left untouched.
+    """
+    key_column = getattr(SalesFact, key)
+    columns = [key_column] + [getattr(SalesFact, a) for a in attributes]
+
+    source = (
+        select(*columns, SalesFact.date.label("last_date"))
+        .distinct(key_column)
+        .where(key_column.isnot(None), *_date_range(start_date, end_date))
+        .order_by(key_column, SalesFact.date.desc())
+    )
+
+    stmt = insert(model).from_select([key, *attributes, "last_date"], source)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[key],
+        set_={c: stmt.excluded[c] for c in [*attributes, "last_date"]},
+        where=model.last_date <= stmt.excluded.last_date,
+    )
+    db.execute(stmt)
+
+
+def refresh_dimensions(db: Session, start_date=None, end_date=None):
+    _upsert_latest(db, DimStore, "store_id", ["country", "city", "channel", "latitude", "longitude"], start_date, end_date)
+    _upsert_latest(db, DimSku, "sku_id", ["sku_name", "category", "subcategory", "brand", "supplier_id"], start_date, end_date)
+    _upsert_latest(db, DimSupplier, "supplier_id", [], start_date, end_date)
+
+    calendar_columns = ["date", "year", "month", "day", "weekofyear", "weekday", "is_weekend", "is_holiday"]
+    source = (
+        select(*[getattr(SalesFact, c) for c in calendar_columns])
+        .distinct(SalesFact.date)
+        .where(*_date_range(start_date, end_date))
+        .order_by(SalesFact.date)
+    )
+    stmt = insert(DimCalendar).from_select(calendar_columns, source)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["date"],
+        set_={c: stmt.excluded[c] for c in calendar_columns[1:]},
+    )
+    db.execute(stmt)
+
+
+def refresh_latest_inventory(db: Session, start_date=None, end_date=None):
+    """
+    Upsert the latest row per SKU-store seen in the date range, together with
+    its trailing average daily sales. Newer snapshots are never overwritten.
+    """
+    columns = ["sku_id", "store_id", "sku_name", "country", "city",
+               "stock_on_hand", "stock_opening", "stock_out_flag", "lead_time_days"]
+
+    latest = (
+        select(*[getattr(SalesFact, c) for c in columns], SalesFact.date)
+        .distinct(SalesFact.sku_id, SalesFact.store_id)
+        .where(*_date_range(start_date, end_date))
+        .order_by(SalesFact.sku_id, SalesFact.store_id, SalesFact.date.desc())
+        .subquery("latest")
+    )
+
+    history = aliased(SalesFact)
+    avg_daily_sales = (
+        select(func.avg(history.units_sold))
+        .where(
+            history.sku_id == latest.c.sku_id,
+            history.store_id == latest.c.store_id,
+            history.date > latest.c.date - ROLLING_WINDOW_DAYS,
+            history.date <= latest.c.date,
+        )
+        .scalar_subquery()
+    )
+
+    source = select(
+        *[latest.c[c] for c in columns],
+        avg_daily_sales,
+        latest.c.date,
+    )
+
+    stmt = insert(LatestInventory).from_select([*columns, "avg_daily_sales", "last_date"], source)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["sku_id", "store_id"],
+        set_={c: stmt.excluded[c] for c in [*columns[2:], "avg_daily_sales", "last_date"]},
+        where=LatestInventory.last_date <= stmt.excluded.last_date,
+    )
+    db.execute(stmt)
+
+
+def refresh_stock_alerts(db: Session, start_date=None, end_date=None):
+    # Reprojects the whole network: every SKU-store's position may have moved
+    run_stock_alerts(db)
+
+
+def refresh_parquet_snapshot(db: Session, start_date=None, end_date=None):
+    # No-op unless OLAP_ENGINE=duckdb; needs the calendar refreshed first
+    parquet_snapshot.export(db, start_date, end_date)
+
+
+# Run in order after new days land in sales_fact
+REFRESH_STEPS = [
+    ("dimensions", refresh_dimensions),
+    ("latest_inventory", refresh_latest_inventory),
+    ("sku_leaderboard", refresh_sku_leaderboard),
+    ("stock_alerts", refresh_stock_alerts),
+    ("parquet_snapshot", refresh_parquet_snapshot),
+]
+
+# Redis counter bumped after every refresh; caches keyed by it expire implicitly
+DATA_VERSION_KEY = "data_version"
+
+
+def refresh_after_ingest(db: Session, start_date=None, end_date=None) -> dict:
+    """
+    Bring every derived table up to date for the ingested date range
+    (the whole table when no range is given). Returns seconds per step.
+    """
+    timings = {}
+    for name, step in REFRESH_STEPS:
+        started = time.perf_counter()
+        step(db, start_date, end_date)
+        db.commit()
+        timings[name] = round(time.perf_counter() - started, 3)
+    return timings
@@ -0,0 +1,191 @@
+import os
+import json
+import datetime
+from decimal import Decimal
+from collections import Counter
+
+# Rough prompt budget for the digest sent to the answer LLM call
+CHATBOT_DIGEST_TOKENS = int(os.getenv("CHATBOT_DIGEST_TOKENS", 1500))
+CHATBOT_DIGEST_TOP_N = int(os.getenv("CHATBOT_DIGEST_TOP_N", 10))
+CHATBOT_DIGEST_GROUPS = int(os.getenv("CHATBOT_DIGEST_GROUPS", 10))
+
+# ~4 characters per token for English text and JSON
+CHARS_PER_TOKEN = 4
+# Longer text values are cut when the digest is still over budget
+DIGEST_TEXT_CHARS = 80
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def jsonable(rows: list) -> list:
+    """Rows with Decimal/date values converted so they survive json.dumps."""
+    return [{k: _plain(v) for k, v in row.items()} for row in rows]
+
+
+def _plain(value):
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.isoformat()
+    return value
+
+
+def _is_number(value) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _column_stats(rows: list, columns: list) -> dict:
+    stats = {}
+    for column in columns:
+        values = [r[column] for r in rows if r[column] is not None]
+        nulls = len(rows) - len(values)
+        if values and all(_is_number(v) for v in values):
+            stats[column] = {
+                "type": "number",
+                "min": min(values),
+                "max": max(values),
+                "mean": round(sum(values) / len(values), 4),
+                "sum": round(sum(values), 4),
+                "nulls": nulls,
+            }
+        else:
+            counts = Counter(str(v) for v in values)
+            stats[column] = {
+                "type": "text",
+                "distinct": len(counts),
+                "most_common": counts.most_common(5),
+                "nulls": nulls,
+            }
+    return stats
+
+
+def _main_measure(stats: dict):
+    """The numeric column with the largest absolute total, e.g. net_sales over discount_pct."""
+    numeric = [c for c, s in stats.items() if s["type"] == "number"]
+    return max(numeric, key=lambda c: abs(stats[c]["sum"])) if numeric else None
+
+
+def _group_totals(rows: list, stats: dict, measure: str, limit: int):
+    """Measure totals per value of the first low-cardinality text column."""
+    candidates = [
+        c for c, s in stats.items()
+        if s["type"] == "text" and 1 < s["distinct"] < len(rows)
+    ]
+    if not candidates or measure is None:
+        return None
+
+    column = candidates[0]
+    totals = Counter()
+    for r in rows:
+        totals[str(r[column])] += r[measure] or 0
+
+    top = totals.most_common(limit)
+    other = sum(totals.values()) - sum(v for _, v in top)
+    return {
+        "by": column,
+        "measure": measure,
+        "totals": [{column: k, measure: round(v, 4)} for k, v in top],
+        "other_total": round(other, 4) if len(totals) > limit else None,
+    }
+
+
+def digest_result(rows: list, budget_tokens: int = CHATBOT_DIGEST_TOKENS) -> dict:
+    """
+    Bounded summary of a query result for the answer prompt. Small results are
+    passed through whole; larger ones become column statistics, the top rows by
+    the main measure and group totals, shrunk until the digest fits the token
+    budget. When even one top row and one group are too large, long text
+    values are cut, column statistics dropped and finally the JSON itself
+    truncated, so the budget always holds. `rows` must already be jsonable().
+    """
+    full = {"row_count": len(rows), "rows": rows}
+    if estimate_tokens(json.dumps(full)) <= budget_tokens:
+        return full
+
+    columns = list(rows[0].keys())
+    stats = _column_stats(rows, columns)
+    measure = _main_measure(stats)
+
+    ordered = sorted(rows, key=lambda r: r[measure] or 0, reverse=True) if measure else rows
+
+    top_n, groups = CHATBOT_DIGEST_TOP_N, CHATBOT_DIGEST_GROUPS
+    while True:
+        digest = {
+            "row_count": len(rows),
+            "columns": stats,
+            "top_rows": {"by": measure, "rows": ordered[:top_n]},
+            "group_totals": _group_totals(rows, stats, measure, groups),
+            "truncated": True,
+        }
+        if _fits(digest, budget_tokens):
+            return digest
+        if top_n <= 1 and groups <= 1:
+            break
+        top_n, groups = max(top_n // 2, 1), max(groups // 2, 1)
+
+    # Still over budget with one row and one group: long text values or many columns
+    digest = _shorten_values(digest)
+    if _fits(digest, budget_tokens):
+        return digest
+
+    # Then column statistics last-first, the sample rows and groups, and
+    # the main measure's statistics last of all
+    columns = digest["columns"]
+    for column in [c for c in reversed(list(columns)) if c != measure]:
+        del columns[column]
+        if _fits(digest, budget_tokens):
+            return digest
+
+    digest.update(top_rows=None, group_totals=None)
+    if _fits(digest, budget_tokens):
+        return digest
+
+    columns.clear()
+    if _fits(digest, budget_tokens):
+        return digest
+    return _hard_truncate(digest, budget_tokens)
+
+
+def _fits(digest: dict, budget_tokens: int) -> bool:
+    return estimate_tokens(json.dumps(digest)) <= budget_tokens
+
+
+def _shorten(value):
+    if isinstance(value, str) and len(value) > DIGEST_TEXT_CHARS:
+        return value[:DIGEST_TEXT_CHARS] + "..."
+    return value
+
+
+def _shorten_values(digest: dict) -> dict:
+    """The digest with long text values cut and at most 3 most common values per column."""
+    columns = {}
+    for column, s in digest["columns"].items():
+        if s["type"] == "text":
+            s = {**s, "most_common": [[_shorten(v), n] for v, n in s["most_common"][:3]]}
+        columns[column] = s
+
+    top_rows = digest["top_rows"]
+    top_rows = {**top_rows, "rows": [{k: _shorten(v) for k, v in r.items()} for r in top_rows["rows"]]}
+
+    group_totals = digest["group_totals"]
+    if group_totals:
+        by = group_totals["by"]
+        group_totals = {
+            **group_totals,
+            "totals": [{**t, by: _shorten(t[by])} for t in group_totals["totals"]],
+        }
+    return {**digest, "columns": columns, "top_rows": top_rows, "group_totals": group_totals}
+
+
+def _hard_truncate(digest: dict, budget_tokens: int) -> dict:
+    """Last resort: the digest's JSON text cut to the budget."""
+    text = json.dumps(digest)
+    result = {"row_count": digest["row_count"], "truncated": True, "digest_prefix": ""}
+    room = max(budget_tokens * CHARS_PER_TOKEN - len(json.dumps(result)) - CHARS_PER_TOKEN, 0)
+    while True:
+        result["digest_prefix"] = text[:room]
+        if _fits(result, budget_tokens) or room == 0:
+            return result
+        room = max(room - (len(json.dumps(result)) - budget_tokens * CHARS_PER_TOKEN) - CHARS_PER_TOKEN, 0)
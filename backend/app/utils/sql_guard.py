@@ -0,0 +1,52 @@
+import os
+import logging
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+# Plans estimated above either limit are rejected before they run
+CHATBOT_MAX_PLAN_COST = float(os.getenv("CHATBOT_MAX_PLAN_COST", 500_000))
+CHATBOT_MAX_PLAN_ROWS = int(os.getenv("CHATBOT_MAX_PLAN_ROWS", 100_000))
+
+# Postgres SQLSTATE for a statement cancelled by statement_timeout
+QUERY_CANCELED = "57014"
+
+
+class QueryRejected(Exception):
+    """Raised instead of running a generated query that is too expensive or too slow."""
+
+
+def explain(db: Session, sql: str) -> dict:
+    """Planner estimate for `sql` without executing it: the root node of EXPLAIN (FORMAT JSON)."""
+    plan = db.execute(text(f"EXPLAIN (FORMAT JSON) {sql}")).scalar()
+    return plan[0]["Plan"]
+
+
+def run_guarded(db: Session, sql: str) -> list:
+    """
+    Admit `sql` only if its estimated cost and row count are within limits,
+    then run it and return the rows as dicts. Statement timeouts surface as
+    QueryRejected; other database errors propagate.
+    """
+    plan = explain(db, sql)
+    cost, rows = plan["Total Cost"], plan["Plan Rows"]
+
+    if cost > CHATBOT_MAX_PLAN_COST:
+        logger.warning(f"CHATBOT|REJECTED|COST={cost}|SQL={sql}")
+        raise QueryRejected(f"Query is too expensive (estimated cost {cost:.0f}, limit {CHATBOT_MAX_PLAN_COST:.0f})")
+    if rows > CHATBOT_MAX_PLAN_ROWS:
+        logger.warning(f"CHATBOT|REJECTED|ROWS={rows}|SQL={sql}")
+        raise QueryRejected(f"Query returns too many rows (estimated {rows}, limit {CHATBOT_MAX_PLAN_ROWS})")
+
+    try:
+        result = db.execute(text(sql)).fetchall()
+    except OperationalError as e:
+        if getattr(e.orig, "pgcode", None) == QUERY_CANCELED:
+            db.rollback()
+            logger.warning(f"CHATBOT|TIMEOUT|SQL={sql}")
+            raise QueryRejected("Query took too long and was cancelled")
+        raise
+
+    return [dict(row._mapping) for row in result]
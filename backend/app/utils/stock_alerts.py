@@ -0,0 +1,347 @@
+import os
+import time
+import asyncio
+import logging
+import datetime
+import numpy as np
+import httpx
+from sqlalchemy import select, func, and_, delete
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+from fastapi.concurrency import run_in_threadpool
+from ..model.latest_inventory import LatestInventory
+from ..model.dimensions import DimSku
+from ..model.stock_alerts import DemandForecast, StockAlertRun, StockAlert
+from .ai_client import AIBackendClient, CircuitOpenError
+
+logger = logging.getLogger(__name__)
+
+HORIZON = 7
+# z-score of the cycle service level used for safety stock (1.65 ~ 95%)
+ALERT_SERVICE_LEVEL_Z = float(os.getenv("ALERT_SERVICE_LEVEL_Z", 1.65))
+# Days of demand an order should cover beyond the lead time
+ALERT_REVIEW_PERIOD_DAYS = int(os.getenv("ALERT_REVIEW_PERIOD_DAYS", 7))
+ALERT_RUNS_KEPT = int(os.getenv("ALERT_RUNS_KEPT", 10))
+# SKU-stores forecasted and written per batch by materialize_forecasts
+FORECAST_BATCH_SIZE = int(os.getenv("FORECAST_BATCH_SIZE", 200))
+
+DEFAULT_LEAD_TIME = 7
+WARNING_BUFFER_DAYS = 3
+
+
+# ---------- forecasts ----------
+
+def _forecast_rows(position, payload: dict, created_at) -> list:
+    sku_id, store_id, last_date = position[:3]
+    rows = []
+    for item in payload["data"]["daily_forecasts"]:
+        rows.append({
+            "sku_id": sku_id,
+            "store_id": store_id,
+            "day": item["day"],
+            "as_of": last_date,
+            "date": datetime.datetime.strptime(item["date"][:10], "%Y-%m-%d").date(),
+            "units_sold": item["demand"]["units_sold"],
+            "lead_time_days": item["supply"]["lead_time_days"],
+            "created_at": created_at,
+        })
+    return rows
+
+
+def _pending_positions(db: Session, refresh: bool) -> list:
+    query = (
+        db.query(LatestInventory.sku_id, LatestInventory.store_id, LatestInventory.last_date,
+                 DimSku.category, DimSku.brand)
+        .join(DimSku, DimSku.sku_id == LatestInventory.sku_id)
+    )
+    if not refresh:
+        current = (
+            select(DemandForecast.sku_id)
+            .where(
+                DemandForecast.sku_id == LatestInventory.sku_id,
+                DemandForecast.store_id == LatestInventory.store_id,
+                DemandForecast.as_of == LatestInventory.last_date,
+            )
+            .exists()
+        )
+        query = query.filter(~current)
+    return query.order_by(LatestInventory.sku_id, LatestInventory.store_id).all()
+
+
+def _store_forecasts(db: Session, rows: list):
+    stmt = insert(DemandForecast).values(rows)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["sku_id", "store_id", "day"],
+        set_={c: stmt.excluded[c] for c in ["as_of", "date", "units_sold", "lead_time_days", "created_at"]},
+    )
+    db.execute(stmt)
+    db.commit()
+
+
+def _with_session(session_factory, work, *args):
+    db = session_factory()
+    try:
+        return work(db, *args)
+    finally:
+        db.close()
+
+
+async def materialize_forecasts(session_factory, client: AIBackendClient, refresh: bool = False, status: dict = None) -> dict:
+    """
+    Fetch a 7-day forecast from the AI backend for every SKU-store whose
+    stored forecast does not start after its latest stock position (all of
+    them when `refresh` is set) and upsert it into demand_forecast.
+    Concurrency is bounded by the client; failed SKU-stores are skipped and
+    fall back to trailing average sales in the alert run. Database work
+    runs in the threadpool on short-lived sessions; progress goes to `status`.
+    """
+    started = time.perf_counter()
+    status = status if status is not None else {}
+
+    positions = await run_in_threadpool(_with_session, session_factory, _pending_positions, refresh)
+    status.update(total=len(positions), forecasted=0, failed=0)
+
+    async def forecast(position):
+        sku_id, store_id, last_date, category, brand = position
+        body = {
+            "start_date": (last_date + datetime.timedelta(days=1)).isoformat(),
+            "store_id": store_id,
+            "sku_id": sku_id,
+            "category": category,
+            "brand": brand,
+        }
+        try:
+            response = await client.post("/ai/predict_7days", json=body, idempotent=True)
+            response.raise_for_status()
+            return response.json()
+        except (httpx.HTTPError, CircuitOpenError) as e:
+            logger.warning(f"FORECAST|FAILED|SKU={sku_id}|STORE={store_id}|{e}")
+            return None
+
+    stored = failed = 0
+    for i in range(0, len(positions), FORECAST_BATCH_SIZE):
+        batch = positions[i:i + FORECAST_BATCH_SIZE]
+        payloads = await asyncio.gather(*[forecast(p) for p in batch])
+
+        created_at = datetime.datetime.utcnow()
+        rows = []
+        for position, payload in zip(batch, payloads):
+            if payload is None:
+                failed += 1
+                continue
+            rows.extend(_forecast_rows(position, payload, created_at))
+            stored += 1
+
+        if rows:
+            await run_in_threadpool(_with_session, session_factory, _store_forecasts, rows)
+        status.update(forecasted=stored, failed=failed)
+
+    seconds = round(time.perf_counter() - started, 2)
+    logger.info(f"FORECAST|MATERIALIZED|SKU_STORES={stored}|FAILED={failed}|SECONDS={seconds}")
+    return {"forecasted": stored, "failed": failed, "seconds": seconds}
+
+
+# ---------- alert engine ----------
+
+def project_stock(stock, history_demand, history_lead_time, demand, lead_time) -> dict:
+    """
+    Vectorized stock projection for n SKU-stores.
+
+    `stock`, `history_demand` and `history_lead_time` have shape (n,);
+    `demand` and `lead_time` are (n, HORIZON) forecasts with NaN where no
+    forecast exists, in which case the trailing averages are used instead.
+    Returns arrays of shape (n,); days_until_stockout is NaN when no demand
+    is expected.
+    """
+    n = len(stock)
+    stock = np.maximum(np.nan_to_num(stock), 0)
+    history_demand = np.nan_to_num(history_demand)
+    history_lead_time = np.where(np.isnan(history_lead_time), DEFAULT_LEAD_TIME, history_lead_time)
+
+    forecasted = ~np.isnan(demand).all(axis=1)
+    demand = np.where(np.isnan(demand), history_demand[:, None], np.maximum(demand, 0))
+
+    lead_known = ~np.isnan(lead_time)
+    lead_sum = np.where(lead_known, lead_time, 0).sum(axis=1)
+    lead_count = lead_known.sum(axis=1)
+    lead = np.where(lead_count > 0, lead_sum / np.maximum(lead_count, 1), history_lead_time)
+
+    daily_mean = demand.mean(axis=1)
+    daily_std = demand.std(axis=1)
+
+    # First horizon day on which cumulative demand exhausts the stock,
+    # interpolated within that day
+    cumulative = demand.cumsum(axis=1)
+    exhausted = cumulative >= stock[:, None]
+    within = exhausted.any(axis=1) & (cumulative[:, -1] > 0)
+    first = exhausted.argmax(axis=1)
+    rows = np.arange(n)
+    before = cumulative[rows, first] - demand[rows, first]
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        partial = (stock - before) / demand[rows, first]
+        # Past the horizon, run down the remaining stock at the mean forecast rate
+        beyond = HORIZON + (stock - cumulative[:, -1]) / daily_mean
+
+    days = np.where(within, first + np.nan_to_num(partial), np.where(daily_mean > 0, beyond, np.nan))
+    days = np.where(stock <= 0, 0.0, days)
+
+    safety_stock = np.ceil(ALERT_SERVICE_LEVEL_Z * daily_std * np.sqrt(lead))
+    reorder_point = np.ceil(daily_mean * lead + safety_stock)
+    order_up_to = daily_mean * (lead + ALERT_REVIEW_PERIOD_DAYS) + safety_stock
+    order_qty = np.ceil(np.maximum(order_up_to - stock, 0))
+
+    # NaN compares False, so SKU-stores without demand end up as info/Low
+    urgency = np.select(
+        [(stock <= 0) | (days < lead), days < lead + WARNING_BUFFER_DAYS],
+        ["critical", "warning"],
+        "info",
+    )
+    priority = np.select(
+        [stock <= reorder_point, days < lead * 1.5],
+        ["High", "Medium"],
+        "Low",
+    )
+
+    return {
+        "avg_daily_demand": daily_mean,
+        "lead_time_days": lead,
+        "safety_stock": safety_stock,
+        "reorder_point": reorder_point,
+        "order_qty": order_qty,
+        "days_until_stockout": days,
+        "urgency": urgency,
+        "priority": priority,
+        "forecasted": forecasted,
+    }
+
+
+def _load_positions(db: Session):
+    """One row per SKU-store with its stored forecast pivoted into day columns."""
+    days = range(1, HORIZON + 1)
+    demand_columns = [
+        func.max(DemandForecast.units_sold).filter(DemandForecast.day == d).label(f"demand_{d}")
+        for d in days
+    ]
+    lead_columns = [
+        func.max(DemandForecast.lead_time_days).filter(DemandForecast.day == d).label(f"lead_time_{d}")
+        for d in days
+    ]
+
+    stmt = (
+        select(
+            LatestInventory.sku_id,
+            LatestInventory.store_id,
+            LatestInventory.sku_name,
+            LatestInventory.country,
+            LatestInventory.city,
+            LatestInventory.last_date,
+            LatestInventory.stock_on_hand,
+            LatestInventory.avg_daily_sales,
+            LatestInventory.lead_time_days,
+            *demand_columns,
+            *lead_columns,
+        )
+        .outerjoin(DemandForecast, and_(
+            DemandForecast.sku_id == LatestInventory.sku_id,
+            DemandForecast.store_id == LatestInventory.store_id,
+            # Forecasts made from an older stock position are ignored
+            DemandForecast.as_of == LatestInventory.last_date,
+        ))
+        .group_by(LatestInventory.sku_id, LatestInventory.store_id)
+        .order_by(LatestInventory.sku_id, LatestInventory.store_id)
+    )
+    return db.execute(stmt).all()
+
+
+def run_stock_alerts(db: Session) -> int:
+    """
+    Project every SKU-store in latest_inventory in one NumPy pass, store the
+    results as a new alert run and drop runs beyond ALERT_RUNS_KEPT.
+    Returns the new run_id; the caller commits.
+    """
+    started = time.perf_counter()
+    rows = _load_positions(db)
+
+    columns = list(zip(*rows)) if rows else [()] * (9 + 2 * HORIZON)
+    sku_ids, store_ids, names, countries, cities, last_dates = columns[:6]
+    stock = np.array(columns[6], dtype=float)
+    history_demand = np.array(columns[7], dtype=float)
+    history_lead_time = np.array(columns[8], dtype=float)
+    demand = np.array(columns[9:9 + HORIZON], dtype=float).T.reshape(len(rows), HORIZON)
+    lead_time = np.array(columns[9 + HORIZON:], dtype=float).T.reshape(len(rows), HORIZON)
+
+    projection = project_stock(stock, history_demand, history_lead_time, demand, lead_time)
+
+    days = projection["days_until_stockout"]
+    known = ~np.isnan(days)
+    stockout_dates = [
+        d + datetime.timedelta(days=int(offset)) if ok else None
+        for d, offset, ok in zip(last_dates, np.floor(np.where(known, days, 0)), known)
+    ]
+
+    run = StockAlertRun(
+        created_at=datetime.datetime.utcnow(),
+        as_of=max(last_dates) if rows else None,
+        sku_stores=len(rows),
+        forecasted=int(projection["forecasted"].sum()),
+    )
+    db.add(run)
+    db.flush()
+
+    values = zip(
+        sku_ids, store_ids, names, countries, cities, last_dates,
+        np.nan_to_num(stock).astype(int).tolist(),
+        np.round(projection["avg_daily_demand"], 2).tolist(),
+        np.round(projection["lead_time_days"], 2).tolist(),
+        projection["safety_stock"].astype(int).tolist(),
+        projection["reorder_point"].astype(int).tolist(),
+        projection["order_qty"].astype(int).tolist(),
+        np.round(days, 1).tolist(),
+        known.tolist(),
+        stockout_dates,
+        projection["urgency"].tolist(),
+        projection["priority"].tolist(),
+        projection["forecasted"].tolist(),
+    )
+    alerts = [
+        {
+            "run_id": run.run_id,
+            "sku_id": sku_id,
+            "store_id": store_id,
+            "sku_name": name,
+            "country": country,
+            "city": city,
+            "last_date": last_date,
+            "current_stock": current_stock,
+            "avg_daily_demand": avg_daily_demand,
+            "lead_time_days": lead,
+            "safety_stock": safety_stock,
+            "reorder_point": reorder_point,
+            "order_qty": order_qty,
+            "days_until_stockout": days_left if has_days else None,
+            "stockout_date": stockout_date,
+            "urgency": urgency,
+            "priority": priority,
+            "demand_source": "forecast" if forecasted else "history",
+        }
+        for (sku_id, store_id, name, country, city, last_date, current_stock, avg_daily_demand, lead,
+             safety_stock, reorder_point, order_qty, days_left, has_days, stockout_date, urgency,
+             priority, forecasted) in values
+    ]
+    if alerts:
+        db.execute(StockAlert.__table__.insert(), alerts)
+
+    # Keep the most recent runs only
+    kept = select(StockAlertRun.run_id).order_by(StockAlertRun.run_id.desc()).limit(ALERT_RUNS_KEPT)
+    old_runs = select(StockAlertRun.run_id).where(StockAlertRun.run_id.notin_(kept.scalar_subquery()))
+    db.execute(delete(StockAlert).where(StockAlert.run_id.in_(old_runs)))
+    db.execute(delete(StockAlertRun).where(StockAlertRun.run_id.in_(old_runs)))
+
+    logger.info(f"ALERTS|RUN={run.run_id}|SKU_STORES={len(rows)}|FORECASTED={run.forecasted}"
+                f"|SECONDS={time.perf_counter() - started:.2f}")
+    return run.run_id
+
+
+def latest_alert_run(db: Session):
+    return db.query(StockAlertRun).order_by(StockAlertRun.run_id.desc()).first()
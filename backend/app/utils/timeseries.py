@@ -0,0 +1,57 @@
+import numpy as np
+from sqlalchemy import func, cast, Date
+
+# Accepted by the `granularity` query parameter of the daily series endpoints
+GRANULARITY_PATTERN = "^(day|week|month|quarter)$"
+
+
+def period_column(column, granularity: str):
+    """`column` truncated to the start of its period, as a date (weeks start on Monday)."""
+    if granularity == "day":
+        return column
+    return cast(func.date_trunc(granularity, column), Date)
+
+
+def lttb(x: np.ndarray, y: np.ndarray, threshold: int) -> np.ndarray:
+    """
+    Largest-Triangle-Three-Buckets downsampling. Returns the indices of at most
+    `threshold` points that keep the visual shape of the series: the first and
+    last points, plus from each bucket in between the point forming the largest
+    triangle with the previously kept point and the average of the next bucket.
+    """
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+
+    x = x.astype(np.float64)
+    y = y.astype(np.float64)
+    # Bucket boundaries over the points between the first and the last
+    edges = np.linspace(1, n - 1, threshold - 1).astype(np.int64)
+
+    kept = np.empty(threshold, dtype=np.int64)
+    kept[0], kept[-1] = 0, n - 1
+    a = 0
+    for i in range(threshold - 2):
+        start, end = edges[i], edges[i + 1]
+        if i + 2 < len(edges):
+            avg_x = x[end:edges[i + 2]].mean()
+            avg_y = y[end:edges[i + 2]].mean()
+        else:
+            avg_x, avg_y = x[-1], y[-1]
+
+        area = np.abs(
+            (x[a] - avg_x) * (y[start:end] - y[a])
+            - (x[a] - x[start:end]) * (avg_y - y[a])
+        )
+        a = start + int(area.argmax())
+        kept[i + 1] = a
+    return kept
+
+
+def downsample(rows: list, measure: str, max_points: int) -> list:
+    """Keep at most `max_points` of the date-ordered `rows` with LTTB on `measure`."""
+    if not max_points or len(rows) <= max_points:
+        return rows
+    x = np.array([r.date.toordinal() for r in rows])
+    y = np.array([float(getattr(r, measure) or 0) for r in rows])
+    return [rows[i] for i in lttb(x, y, max_points)]
@@ -0,0 +1,231 @@
+import os
+import time
+import asyncio
+import logging
+import httpx
+from sqlalchemy import select
+from fastapi.concurrency import run_in_threadpool
+from ..model.dimensions import DimStore, DimCalendar
+from .cache import skip_cache_reads, cache_version
+from .refresh import DATA_VERSION_KEY
+from .http_cache import current_data_version
+
+logger = logging.getLogger(__name__)
+
+# Warm-up requests in flight at once; each holds at most one pooled
+# connection, except /dashboard which runs up to DASHBOARD_CONCURRENCY
+CACHE_WARM_CONCURRENCY = int(os.getenv("CACHE_WARM_CONCURRENCY", 2))
+# Fill missing cache entries when a worker starts
+CACHE_WARM_ON_STARTUP = os.getenv("CACHE_WARM_ON_STARTUP", "true").lower() == "true"
+# Recompute every cache entry after /admin/ingest and /admin/refresh
+CACHE_WARM_AFTER_REFRESH = os.getenv("CACHE_WARM_AFTER_REFRESH", "true").lower() == "true"
+# Upper bound on one run; the Redis lock expires after it if a worker dies mid-run
+CACHE_WARM_LOCK_SECONDS = int(os.getenv("CACHE_WARM_LOCK_SECONDS", 1800))
+
+CACHE_WARM_LOCK_KEY = "cache_warmup_lock"
+# Set when a refresh run is requested while another run holds the lock
+CACHE_WARM_PENDING_KEY = "cache_warmup_pending"
+
+# Cached GET endpoints and the dashboard filters each one is keyed on
+WARM_ENDPOINTS = [
+    ("/dashboard", ("country", "year", "month")),
+    ("/sku/top", ("country", "year", "month")),
+    ("/net_sales/location", ("country", "year", "month")),
+    ("/net_sales/location/clusters", ("country", "year", "month")),
+    ("/analytics/revenue", ("country", "year", "month")),
+    ("/analytics/profit", ("country", "year", "month")),
+    ("/analytics/channel", ("country", "year", "month")),
+    ("/analytics/channel/daily", ("country", "year", "month")),
+    ("/analytics/pricing", ("country", "year", "month")),
+    ("/analytics/weather-correlation", ("country", "year", "month")),
+    ("/analytics/weather-stats", ("country", "year", "month")),
+    ("/analytics/discount-impact", ("country", "year")),
+    ("/analytics/supplier", ("country", "year")),
+    ("/analytics/weather-by-category", ("country", "year")),
+    ("/analytics/inventory-optimization", ("country", "year")),
+    ("/stock_alerts", ("country",)),
+    ("/store/list", ()),
+    ("/city/list", ()),
+    ("/category/list", ()),
+    ("/brand/list", ()),
+]
+
+
+def filter_space(db) -> list:
+    """
+    Every country/year/month filter the dashboard can send, "all" included,
+    from the dimension tables. Months are only paired with years that have them.
+    """
+    countries = db.execute(
+        select(DimStore.country).where(DimStore.country.isnot(None)).distinct().order_by(DimStore.country)
+    ).scalars().all()
+    periods = db.execute(select(DimCalendar.year, DimCalendar.month).distinct()).all()
+
+    months = {"all": sorted({m for _, m in periods})}
+    for year, month in periods:
+        months.setdefault(year, []).append(month)
+
+    filters = []
+    for country in ["all", *countries]:
+        for year in ["all", *sorted(y for y in months if y != "all")]:
+            for month in ["all", *sorted(months[year])]:
+                filters.append({"country": country, "year": str(year), "month": str(month)})
+    return filters
+
+
+def warm_requests(filters: list) -> list:
+    """(path, params) for every cached endpoint and distinct filter it is keyed on."""
+    requests = []
+    for path, keys in WARM_ENDPOINTS:
+        seen = set()
+        for f in filters:
+            params = tuple((k, f[k]) for k in keys)
+            if params not in seen:
+                seen.add(params)
+                requests.append((path, dict(params)))
+    return requests
+
+
+class CacheWarmer:
+    """
+    Requests every cached endpoint for every filter through the app itself,
+    so each entry is built by the same code, with the same key, as for a
+    user. Without refresh, missing entries of the current data version are
+    built. With refresh=True (after an ingest) every entry is computed under
+    the next data version while users keep reading the current one, and that
+    version is published when the run ends, so no response ever carries a
+    version newer than its body. One run at a time across workers, guarded
+    by a Redis lock; refresh runs requested meanwhile are queued, not dropped.
+    """
+
+    def __init__(self):
+        self.status = {"state": "idle"}
+        self.task = None
+        self.pending_refresh = False
+
+    @property
+    def running(self) -> bool:
+        return self.task is not None and not self.task.done()
+
+    def start(self, app, redis, session_factory, refresh: bool) -> bool:
+        """
+        Run in the background; False when a run is already in progress here,
+        in which case a refresh is queued behind it.
+        """
+        if self.running:
+            self.pending_refresh = self.pending_refresh or refresh
+            return False
+        self.task = asyncio.create_task(self.run(app, redis, session_factory, refresh))
+        return True
+
+    async def run(self, app, redis, session_factory, refresh: bool):
+        while True:
+            try:
+                locked = await redis.set(CACHE_WARM_LOCK_KEY, "1", nx=True, ex=CACHE_WARM_LOCK_SECONDS)
+            except Exception as e:
+                logger.error(f"WARMUP|LOCK|FAILED|{str(e)}")
+                self.status = {"state": "failed", "error": str(e)}
+                return
+            if not locked:
+                if refresh:
+                    # The worker holding the lock runs it once its own run ends
+                    await redis.set(CACHE_WARM_PENDING_KEY, "1", ex=CACHE_WARM_LOCK_SECONDS)
+                    logger.info("WARMUP|QUEUED|LOCKED")
+                    self.status = {"state": "queued", "reason": "another worker is warming the cache"}
+                else:
+                    logger.info("WARMUP|SKIPPED|LOCKED")
+                    self.status = {"state": "skipped", "reason": "another worker is warming the cache"}
+                return
+
+            try:
+                await self._run(app, redis, session_factory, refresh)
+            except Exception as e:
+                logger.error(f"WARMUP|FAILED|{str(e)}")
+                self.status.update(state="failed", error=str(e))
+            finally:
+                await redis.delete(CACHE_WARM_LOCK_KEY)
+
+            # Refreshes requested meanwhile, here or on another worker
+            pending = self.pending_refresh or bool(await redis.get(CACHE_WARM_PENDING_KEY))
+            if not pending:
+                return
+            self.pending_refresh = False
+            await redis.delete(CACHE_WARM_PENDING_KEY)
+            refresh = True
+
+    async def _run(self, app, redis, session_factory, refresh: bool):
+        started = time.perf_counter()
+        current = int(await redis.get(DATA_VERSION_KEY) or 0)
+        version = str(current + 1 if refresh else current)
+
+        def load_filters():
+            db = session_factory()
+            try:
+                return filter_space(db)
+            finally:
+                db.close()
+
+        try:
+            requests = warm_requests(await run_in_threadpool(load_filters))
+            self.status = {
+                "state": "running",
+                "refresh": refresh,
+                "version": version,
+                "total": len(requests),
+                "done": 0,
+                "failed": 0,
+                "seconds": 0.0,
+                "endpoints": {},
+            }
+            logger.info(f"WARMUP|START|REQUESTS={len(requests)}|REFRESH={refresh}|VERSION={version}")
+            await self._warm(app, requests, refresh, version, started)
+        finally:
+            if refresh:
+                # Published even after a failed run: entries it did not build
+                # are computed on first use, and the data has changed
+                await current_data_version.publish(redis, version)
+                logger.info(f"WARMUP|PUBLISHED|VERSION={version}")
+
+    async def _warm(self, app, requests: list, refresh: bool, version: str, started: float):
+        semaphore = asyncio.Semaphore(CACHE_WARM_CONCURRENCY)
+        transport = httpx.ASGITransport(app=app)
+
+        async with httpx.AsyncClient(transport=transport, base_url="http://warmup") as client:
+            async def warm(path: str, params: dict):
+                async with semaphore:
+                    request_started = time.perf_counter()
+                    try:
+                        # Uncompressed: the body is thrown away
+                        response = await client.get(path, params=params, headers={"Accept-Encoding": "identity"})
+                        ok = response.status_code == 200
+                    except Exception as e:
+                        logger.error(f"WARMUP|REQUEST|FAILED|PATH={path}|PARAMS={params}|{str(e)}")
+                        ok = False
+                    elapsed = time.perf_counter() - request_started
+
+                endpoint = self.status["endpoints"].setdefault(path, {"requests": 0, "failed": 0, "seconds": 0.0})
+                endpoint["requests"] += 1
+                endpoint["seconds"] = round(endpoint["seconds"] + elapsed, 3)
+                self.status["done"] += 1
+                if not ok:
+                    endpoint["failed"] += 1
+                    self.status["failed"] += 1
+                self.status["seconds"] = round(time.perf_counter() - started, 1)
+                if self.status["done"] % 100 == 0:
+                    logger.info(f"WARMUP|PROGRESS|DONE={self.status['done']}|TOTAL={len(requests)}")
+
+            skip_token = skip_cache_reads.set(refresh)
+            version_token = cache_version.set(version)
+            try:
+                await asyncio.gather(*(warm(path, params) for path, params in requests))
+            finally:
+                cache_version.reset(version_token)
+                skip_cache_reads.reset(skip_token)
+
+        self.status.update(state="finished", seconds=round(time.perf_counter() - started, 1))
+        logger.info(
+            f"WARMUP|COMPLETE|REQUESTS={len(requests)}|FAILED={self.status['failed']}|SECONDS={self.status['seconds']}"
+        )
+
+
+cache_warmer = CacheWarmer()
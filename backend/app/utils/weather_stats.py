@@ -0,0 +1,191 @@
+import numpy as np
+
+WEATHER = ["temperature", "rain_mm"]
+MEASURES = ["units_sold", "sales"]
+
+
+def _valid(x: np.ndarray, y: np.ndarray):
+    mask = ~(np.isnan(x) | np.isnan(y))
+    return x[mask], y[mask]
+
+
+def pearson(x: np.ndarray, y: np.ndarray):
+    """Pearson r over the days where both are known; None below 3 days or without variance."""
+    x, y = _valid(x, y)
+    if len(x) < 3:
+        return None
+    x = x - x.mean()
+    y = y - y.mean()
+    denominator = np.sqrt((x * x).sum() * (y * y).sum())
+    return round(float((x * y).sum() / denominator), 4) if denominator > 0 else None
+
+
+def rank(a: np.ndarray) -> np.ndarray:
+    """1-based ranks, ties sharing their average rank."""
+    ranks = np.empty(len(a), dtype=np.float64)
+    ranks[a.argsort(kind="mergesort")] = np.arange(1, len(a) + 1)
+    _, inverse, counts = np.unique(a, return_inverse=True, return_counts=True)
+    return (np.bincount(inverse, weights=ranks) / counts)[inverse]
+
+
+def spearman(x: np.ndarray, y: np.ndarray):
+    """Spearman rho: Pearson r of the ranks, over the days where both are known."""
+    x, y = _valid(x, y)
+    if len(x) < 3:
+        return None
+    return pearson(rank(x), rank(y))
+
+
+def lagged(weather: np.ndarray, measure: np.ndarray, max_lag: int) -> list:
+    """
+    Pearson r of the measure against the weather `lag` days earlier, for
+    lag 0..max_lag. Both series are daily and gap-free (missing days NaN).
+    """
+    result = []
+    for lag in range(max_lag + 1):
+        if lag >= len(weather):
+            result.append(None)
+            continue
+        result.append(pearson(weather[:len(weather) - lag], measure[lag:]))
+    return result
+
+
+def semi_elasticity(x: np.ndarray, y: np.ndarray):
+    """
+    Percent change in y per unit of x, from the least-squares slope of
+    log(1 + y) on x. None below 3 days or when x does not vary.
+    """
+    x, y = _valid(x, y)
+    if len(x) < 3:
+        return None
+    x = x - x.mean()
+    variance = (x * x).sum()
+    if variance == 0:
+        return None
+    slope = (x * np.log1p(np.clip(y, 0, None))).sum() / variance
+    return round(float(np.expm1(slope) * 100), 3)
+
+
+def binned(x: np.ndarray, series: dict, bins: int) -> list:
+    """
+    Equal-width bins over x with the day count and mean of every series per
+    non-empty bin: a scatter plot's shape in `bins` points instead of one per day.
+    """
+    known = ~np.isnan(x)
+    x = x[known]
+    if len(x) == 0:
+        return []
+    edges = np.linspace(x.min(), x.max(), bins + 1)
+    index = np.clip(np.searchsorted(edges, x, side="right") - 1, 0, bins - 1)
+    counts = np.bincount(index, minlength=bins)
+
+    means = {
+        name: np.bincount(index, weights=values[known], minlength=bins) / np.maximum(counts, 1)
+        for name, values in series.items()
+    }
+    return [
+        {
+            "from": round(float(edges[i]), 2),
+            "to": round(float(edges[i + 1]), 2),
+            "days": int(counts[i]),
+            **{name: round(float(means[name][i]), 2) for name in series},
+        }
+        for i in range(bins) if counts[i]
+    ]
+
+
+def daily(day: np.ndarray, days: int, groups: np.ndarray, columns: dict) -> tuple:
+    """
+    Sum the per-row columns into a dense (group, day) grid; cells without
+    rows are NaN. Returns the group labels and one grid per column.
+    """
+    labels, group_index = np.unique(groups, return_inverse=True)
+    cell = group_index * days + day
+    size = len(labels) * days
+    present = np.bincount(cell, minlength=size) > 0
+
+    grids = {}
+    for name, values in columns.items():
+        grid = np.bincount(cell, weights=values, minlength=size)
+        grid[~present] = np.nan
+        grids[name] = grid.reshape(len(labels), days)
+    return labels, grids
+
+
+def weather_statistics(rows: list, max_lag: int, bins: int) -> dict:
+    """
+    Correlation, lag and elasticity summary of daily sales against the
+    weather, from rows of (date, country, category, temperature_sum,
+    temperature_count, rain_sum, rain_count, units_sold, sales).
+    Temperature and rain are daily means over the sales rows.
+    """
+    if not rows:
+        return {"summary": {"days": 0}, "correlations": {}, "lagged": {}, "elasticity": {"category": [], "country": []}}
+
+    dates = np.array([r[0] for r in rows], dtype="datetime64[D]")
+    start = dates.min()
+    day = (dates - start).astype(np.int64)
+    days = int(day.max()) + 1
+
+    columns = {
+        name: np.array([float(r[i] or 0) for r in rows])
+        for i, name in enumerate(
+            ["temperature_sum", "temperature_count", "rain_sum", "rain_count", "units_sold", "sales"], start=3
+        )
+    }
+
+    def series(grids):
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return {
+                "temperature": grids["temperature_sum"] / grids["temperature_count"],
+                "rain_mm": grids["rain_sum"] / grids["rain_count"],
+                "units_sold": grids["units_sold"],
+                "sales": grids["sales"],
+            }
+
+    # Whole filter: a single group
+    _, grids = daily(day, days, np.zeros(len(rows), dtype=np.int64), columns)
+    total = {name: values[0] for name, values in series(grids).items()}
+
+    result = {
+        "summary": {
+            "days": int((~np.isnan(total["units_sold"])).sum()),
+            "start": str(start),
+            "end": str(start + days - 1),
+        },
+        "correlations": {
+            w: {m: {"pearson": pearson(total[w], total[m]), "spearman": spearman(total[w], total[m])} for m in MEASURES}
+            for w in WEATHER
+        },
+        "lagged": {},
+        "elasticity": {},
+    }
+    for w in WEATHER:
+        by_measure = {m: lagged(total[w], total[m], max_lag) for m in MEASURES}
+        result["lagged"][w] = [
+            {"lag": lag, **{m: by_measure[m][lag] for m in MEASURES}}
+            for lag in range(max_lag + 1)
+        ]
+
+    for dimension, position in [("category", 2), ("country", 1)]:
+        # Rows without the attribute count towards the totals only
+        labels, grids = daily(day, days, np.array([r[position] or "" for r in rows]), columns)
+        values = series(grids)
+        result["elasticity"][dimension] = [
+            {
+                dimension: str(label),
+                "days": int((~np.isnan(values["units_sold"][i])).sum()),
+                "temperature_pct_per_c": semi_elasticity(values["temperature"][i], values["units_sold"][i]),
+                "rain_pct_per_mm": semi_elasticity(values["rain_mm"][i], values["units_sold"][i]),
+                "temperature_pearson": pearson(values["temperature"][i], values["units_sold"][i]),
+                "rain_pearson": pearson(values["rain_mm"][i], values["units_sold"][i]),
+            }
+            for i, label in enumerate(labels) if label
+        ]
+
+    if bins:
+        result["scatter"] = {
+            w: binned(total[w], {m: total[m] for m in MEASURES}, bins)
+            for w in WEATHER
+        }
+    return result